@@ -1,6 +1,7 @@
 from .aligners import (
     Aligner,
     DTWAligner,
+    DTWSessionCache,
     FastDTWAligner,
     GreedyCoverageAligner,
     GreedyDistanceAligner,
@@ -9,7 +10,13 @@ from .aligners import (
     TamuheyAligner,
     WordIdsAligner,
 )
-from .utils import get_distance_fn, precompute_distances
+from .utils import (
+    AlignmentCache,
+    AlignmentReader,
+    AlignmentWriter,
+    get_distance_fn,
+    precompute_distances,
+)
 
 __all__ = [
     "Aligner",
@@ -21,6 +28,10 @@ __all__ = [
     "PythonDTWAligner",
     "TamuheyAligner",
     "FastDTWAligner",
+    "DTWSessionCache",
     "get_distance_fn",
     "precompute_distances",
+    "AlignmentReader",
+    "AlignmentWriter",
+    "AlignmentCache",
 ]
@@ -1,6 +1,7 @@
 from .base import Aligner
 from .dtw import DTWAligner
 from .dtw_py import PythonDTWAligner
+from .dtw_session import DTWSessionCache
 from .fast_dtw import FastDTWAligner
 from .greedy_coverage import GreedyCoverageAligner
 from .greedy_coverage_py import PythonGreedyCoverageAligner
@@ -18,4 +19,5 @@ __all__ = [
     "PythonDTWAligner",
     "TamuheyAligner",
     "FastDTWAligner",
+    "DTWSessionCache",
 ]
@@ -1,16 +1,57 @@
+import asyncio
+import functools
+import os
+import weakref
 from abc import ABC, abstractmethod
-from typing import Callable, List, Optional, Union
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
 
 import numpy as np
 
-from ..types import Alignment, TokenizedPair, TokenizedSet
-from ..utils.heuristics import align_one_to_one
+from ..types import (
+    Alignment,
+    BatchAlignment,
+    Features,
+    TokenizedPair,
+    TokenizedSet,
+)
+from ..utils.arrow import import_pyarrow
+from ..utils.cache import (
+    AlignmentCache,
+    Positions,
+    hash_pair,
+    positions_to_alignment,
+)
+from ..utils.heuristics import align_one_to_one, pin_special_tokens, slice_pair
 from ..utils.preprocess import preprocess_tokens
+from ..utils.projection import (
+    PROJECTION_KINDS,
+    TORCH_REDUCTIONS,
+    aggregate_torch,
+    is_torch_tensor,
+    project_features,
+    project_features_chunked,
+)
 
 
 class Aligner(ABC):
     def __init__(self, **kwargs):
         self.kwargs = kwargs
+        self.cache: Optional[AlignmentCache] = kwargs.get("cache")
+        self.executor: Optional[Executor] = kwargs.get("executor")
+        self.max_concurrency: int = kwargs.get(
+            "max_concurrency", os.cpu_count() or 1
+        )
+        # Sorted to be part of the cache config
+        self.special_tokens: tuple = tuple(
+            sorted(set(kwargs.get("special_tokens") or ()))
+        )
+        self._special_tokens = frozenset(self.special_tokens)
+        # Concurrency limit of the coroutines of each event loop
+        self._semaphores: weakref.WeakKeyDictionary = (
+            weakref.WeakKeyDictionary()
+        )
 
     @abstractmethod
     def _align_pair(self, tokenized_pair: TokenizedPair) -> Alignment:
@@ -25,18 +66,105 @@ class Aligner(ABC):
         """
         ...
 
-    def align_pair(
-        self,
-        tokenized_pair: TokenizedPair,
-    ) -> Alignment:
+    def _align_pairs(
+        self, tokenized_pairs: List[TokenizedPair]
+    ) -> List[Alignment]:
         """
-        Preprocess the tokens of a tokenized pair and aligns them.
+        Aligns the tokens of a batch of tokenized pairs. Aligners with
+        a batched implementation override this method to align all the
+        pairs at once, otherwise, the pairs are aligned one by one.
+
+        Args:
+            tokenized_pairs (List[TokenizedPair]): preprocessed tokenized pairs.
+
+        Returns:
+            List[Alignment]: positions and tokens of each alignment.
+        """
+        return [
+            self._align_pair(tokenized_pair)
+            for tokenized_pair in tokenized_pairs
+        ]
+
+    def _align_pinned(
+        self, tokenized_pairs: List[TokenizedPair]
+    ) -> List[Alignment]:
+        """
+        Aligns the tokens of a batch of preprocessed tokenized pairs, pinning
+        the special tokens of both texts to each other. Only the content
+        between the pinned tokens is aligned by `_align_pairs`, and the
+        content of `a` without content of `b` is aligned with the closest
+        pinned token of `b`. Tokens of the content of `a` left unaligned
+        are aligned with the last token of the content of `b`.
+
+        Args:
+            tokenized_pairs (List[TokenizedPair]): preprocessed tokenized pairs.
+
+        Returns:
+            List[Alignment]: positions and tokens of each alignment.
+        """
+        if not self._special_tokens:
+            return self._align_pairs(tokenized_pairs)
+
+        pinned: List[Positions] = []
+        segments, segment_pairs = [], []
+        for idx, tokenized_pair in enumerate(tokenized_pairs):
+            positions, pair_segments = pin_special_tokens(
+                tokenized_pair, self._special_tokens
+            )
+            for (start_a, end_a), (start_b, end_b) in pair_segments:
+                if start_b == end_b:
+                    closest = [start_b - 1] if start_b > 0 else [end_b]
+                    positions += [(p, closest) for p in range(start_a, end_a)]
+                elif (
+                    tokenized_pair.preprocessed_tokens_a[start_a:end_a]
+                    == tokenized_pair.preprocessed_tokens_b[start_b:end_b]
+                ):
+                    positions += [
+                        (start_a + k, [start_b + k])
+                        for k in range(end_a - start_a)
+                    ]
+                else:
+                    segments.append((idx, start_a, end_a, start_b, end_b))
+                    segment_pairs.append(
+                        tokenized_pair
+                        if not positions and len(pair_segments) == 1
+                        else slice_pair(
+                            tokenized_pair, (start_a, end_a), (start_b, end_b)
+                        )
+                    )
+            pinned.append(positions)
+
+        for (idx, start_a, end_a, start_b, end_b), alignment in zip(
+            segments, self._align_pairs(segment_pairs)
+        ):
+            segment_positions = [
+                (start_a + position_a, [start_b + p for p in positions_b])
+                for position_a, positions_b in alignment
+            ]
+            # Aligners that stop at the end of `b`, e.g., `WordIdsAligner`,
+            # leave tokens of `a` unaligned, which are aligned with the last
+            # token of `b` in the segment, as the end of `b` is not the end
+            # of the text but the next pinned token
+            aligned = {position_a for position_a, _ in segment_positions}
+            pinned[idx] += segment_positions + [
+                (position_a, [end_b - 1])
+                for position_a in range(start_a, end_a)
+                if position_a not in aligned
+            ]
+        return [
+            positions_to_alignment(sorted(positions), tokenized_pair)
+            for positions, tokenized_pair in zip(pinned, tokenized_pairs)
+        ]
+
+    def _preprocess_pair(self, tokenized_pair: TokenizedPair) -> bool:
+        """
+        Preprocess the tokens of a tokenized pair in place.
 
         Args:
             tokenized_pair (TokenizedPair): a pair of tokenized texts.
 
         Returns:
-            Alignment: positions and tokens of the alignment.
+            bool: whether both preprocessed tokenizations are the same.
         """
         tokenized_pair.preprocessed_tokens_a = preprocess_tokens(
             tokenized_pair.tokens_a
@@ -44,15 +172,101 @@ class Aligner(ABC):
         tokenized_pair.preprocessed_tokens_b = preprocess_tokens(
             tokenized_pair.tokens_b
         )
-
-        # If both tokenizations are the same, return 1-1 alignment
-        if (
+        return (
             tokenized_pair.preprocessed_tokens_a
             == tokenized_pair.preprocessed_tokens_b
-        ):
-            return align_one_to_one(tokenized_pair)
+        )
 
-        return self._align_pair(tokenized_pair)
+    def _cache_config(self) -> str:
+        """
+        Describes the aligner and its parameters, to key the cache.
+
+        Returns:
+            str: name of the aligner and its parameters.
+        """
+        params = []
+        for name, value in sorted(vars(self).items()):
+            if name in [
+                "cache",
+                "kwargs",
+                "executor",
+                "max_concurrency",
+            ] or name.startswith("c_"):
+                continue
+            if callable(value):
+                value = getattr(value, "__qualname__", type(value).__name__)
+            elif not isinstance(value, (int, float, str, bool, tuple)):
+                continue
+            params.append(f"{name}={value!r}")
+        return f"{type(self).__qualname__}({', '.join(params)})"
+
+    def align_pair(
+        self,
+        tokenized_pair: TokenizedPair,
+    ) -> Alignment:
+        """
+        Preprocess the tokens of a tokenized pair and aligns them.
+        If the aligner has a cache, the alignment is looked up first.
+
+        Args:
+            tokenized_pair (TokenizedPair): a pair of tokenized texts.
+
+        Returns:
+            Alignment: positions and tokens of the alignment.
+        """
+        return self.align_pairs([tokenized_pair])[0]
+
+    def align_pairs(
+        self, tokenized_pairs: List[TokenizedPair]
+    ) -> List[Alignment]:
+        """
+        Preprocess the tokens of a batch of tokenized pairs and aligns them.
+        If the aligner has a cache, only the pairs not found are aligned.
+        If the aligner has `special_tokens`, they are pinned to each other
+        and only the content between them is aligned.
+
+        Args:
+            tokenized_pairs (List[TokenizedPair]): pairs of tokenized texts.
+
+        Returns:
+            List[Alignment]: positions and tokens of each alignment.
+        """
+        alignments: List[Optional[Alignment]] = [None] * len(tokenized_pairs)
+        pending, keys = [], []
+        config = self._cache_config() if self.cache is not None else ""
+        for idx, tokenized_pair in enumerate(tokenized_pairs):
+            # If both tokenizations are the same, return 1-1 alignment
+            if self._preprocess_pair(tokenized_pair):
+                alignments[idx] = align_one_to_one(tokenized_pair)
+                continue
+            if self.cache is not None:
+                key = hash_pair(tokenized_pair, config)
+                positions = self.cache.get(key)
+                if positions is not None:
+                    alignments[idx] = positions_to_alignment(
+                        positions, tokenized_pair
+                    )
+                    continue
+                keys.append(key)
+            pending.append(idx)
+
+        if pending:
+            for idx, alignment in zip(
+                pending,
+                self._align_pinned([tokenized_pairs[idx] for idx in pending]),
+            ):
+                alignments[idx] = alignment
+            if self.cache is not None:
+                for idx, key in zip(pending, keys):
+                    self.cache.put(
+                        key,
+                        [
+                            (position_a, list(positions_b))
+                            for position_a, positions_b in alignments[idx]  # type: ignore
+                        ],
+                    )
+
+        return alignments  # type: ignore
 
     def align(self, tokenized_set: TokenizedSet) -> List[Alignment]:
         """
@@ -65,54 +279,194 @@ class Aligner(ABC):
         Returns:
             List[Alignment]: positions and tokens of each alignment.
         """
-        word_ids = (
-            tokenized_set.word_ids
-            if tokenized_set.word_ids
-            else [[] for _ in range(len(tokenized_set.tokens))]
-        )
-        spans = (
-            tokenized_set.spans
-            if tokenized_set.spans
-            else [[] for _ in range(len(tokenized_set.tokens))]
-        )
+        return self.align_pairs(tokenized_set.to_pairs())
 
-        tokens_a = tokenized_set.tokens[0]
-        word_ids_a = word_ids[0]
-        spans_a = spans[0]
+    def _align_record_batch(
+        self, batch: Any, columns: Dict[str, str]
+    ) -> BatchAlignment:
+        """
+        Aligns the pairs in the rows of an Arrow record batch. By default, the
+        rows are converted to `TokenizedPair` and aligned with `align_pairs`.
+        Aligners that work on numeric columns override it to align the Arrow
+        buffers without converting them to Python objects.
 
-        return [
-            self.align_pair(
-                TokenizedPair(
-                    tokens_a=tokens_a,
-                    tokens_b=tokens_b,
-                    word_ids_a=word_ids_a,
-                    word_ids_b=word_ids_b,
-                    spans_a=spans_a,
-                    spans_b=spans_b,
-                    text=tokenized_set.text,
-                )
-            )
-            for tokens_b, word_ids_b, spans_b in zip(
-                tokenized_set.tokens[1:], word_ids[1:], spans[1:]
+        Args:
+            batch (Any): `pyarrow.RecordBatch` with a pair in each row.
+            columns (Dict[str, str]): name of the column of each field of `TokenizedPair`.
+
+        Returns:
+            BatchAlignment: array-backed alignments of the rows.
+        """
+        values = {
+            field: batch.column(name).to_pylist()
+            for field, name in columns.items()
+        }
+        pairs = [
+            TokenizedPair(
+                **{
+                    field: column[row]
+                    for field, column in values.items()
+                    if column[row] is not None
+                }
             )
+            for row in range(batch.num_rows)
         ]
+        return BatchAlignment.from_alignments(self.align_pairs(pairs))
+
+    def align_arrow(
+        self,
+        table: Any,
+        tokens_a: str = "tokens_a",
+        tokens_b: str = "tokens_b",
+        word_ids_a: Optional[str] = None,
+        word_ids_b: Optional[str] = None,
+        spans_a: Optional[str] = None,
+        spans_b: Optional[str] = None,
+        text: Optional[str] = None,
+        batch_size: int = 1024,
+    ) -> Any:
+        """
+        Aligns the pairs in the rows of an Arrow table, e.g., read from a parquet
+        file or a HuggingFace dataset, reading the list columns directly from
+        their buffers whenever the aligner supports it. Requires `pyarrow`.
+
+        Args:
+            table (Any): `pyarrow.Table` or `pyarrow.RecordBatch` with a pair in each row.
+            tokens_a (str): column with the tokens of the reference texts.
+            tokens_b (str): column with the tokens of the texts to be aligned.
+            word_ids_a (Optional[str]): column with the word ids of `a`, if any.
+            word_ids_b (Optional[str]): column with the word ids of `b`, if any.
+            spans_a (Optional[str]): column with the spans of `a`, if any.
+            spans_b (Optional[str]): column with the spans of `b`, if any.
+            text (Optional[str]): column with the texts, if any.
+            batch_size (int): max number of rows aligned at once.
+
+        Returns:
+            Any: `pyarrow.Table` with a row per pair, and the matches of its
+                 alignment in the `list<int32>` columns `positions_a` and `positions_b`.
+        """
+        pa = import_pyarrow()
+        if isinstance(table, pa.RecordBatch):
+            table = pa.Table.from_batches([table])
+        columns = {
+            field: name
+            for field, name in [
+                ("tokens_a", tokens_a),
+                ("tokens_b", tokens_b),
+                ("word_ids_a", word_ids_a),
+                ("word_ids_b", word_ids_b),
+                ("spans_a", spans_a),
+                ("spans_b", spans_b),
+                ("text", text),
+            ]
+            # Tokens are optional for the aligners that only need word ids or spans
+            if name is not None
+            and (name in table.column_names or not field.startswith("tokens"))
+        }
+        tables = [
+            self._align_record_batch(batch, columns).to_arrow()
+            for batch in table.to_batches(max_chunksize=batch_size)
+        ]
+        if not tables:
+            return BatchAlignment(
+                positions_a=np.zeros(0, dtype=np.int32),
+                positions_b=np.zeros(0, dtype=np.int32),
+                offsets=np.zeros(1, dtype=np.int64),
+            ).to_arrow()
+        return pa.concat_tables(tables)
+
+    async def _run_async(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Runs `fn(*args, **kwargs)` in the executor of the aligner without
+        blocking the event loop. At most `max_concurrency` calls run at once
+        per event loop, and the next calls wait for a free slot. If the caller
+        is cancelled before the call starts, the call is dropped, otherwise,
+        its slot is kept until it ends.
+
+        Args:
+            fn (Callable): function to run.
+
+        Returns:
+            Any: result of the function.
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency,
+                thread_name_prefix=type(self).__name__,
+            )
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        semaphore = self._semaphores[loop]
+
+        await semaphore.acquire()
+        try:
+            future = self.executor.submit(
+                functools.partial(fn, *args, **kwargs)
+            )
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def release(_):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(semaphore.release)
+
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    async def align_pair_async(
+        self, tokenized_pair: TokenizedPair
+    ) -> Alignment:
+        """
+        Coroutine version of `align_pair`, that runs in the executor of the aligner.
+
+        Args:
+            tokenized_pair (TokenizedPair): a pair of tokenized texts.
+
+        Returns:
+            Alignment: positions and tokens of the alignment.
+        """
+        return await self._run_async(self.align_pair, tokenized_pair)
+
+    async def align_async(self, tokenized_set: TokenizedSet) -> List[Alignment]:
+        """
+        Coroutine version of `align`, that runs in the executor of the aligner.
+
+        Args:
+            tokenized_set (TokenizedSet): multiple tokenized texts.
+
+        Returns:
+            List[Alignment]: positions and tokens of each alignment.
+        """
+        return await self._run_async(self.align, tokenized_set)
 
     def aggregate_features_pair(
         self,
         tokenized_pair: TokenizedPair,
         aggregate_fn: Callable = np.mean,
         alignment: Optional[Alignment] = None,
-    ) -> np.ndarray:
+        stacked: bool = False,
+    ) -> Features:
         """
         Aggregates features associated to the tokens after aligning
         the tokens of two tokenizers.
 
+        When `aggregate_fn` is `np.mean` or `np.sum`, the features are
+        aggregated with a single sparse-dense matmul by the projection matrix
+        of the alignment, which is cached to aggregate more features.
+        Torch tensors are aggregated natively, keeping their dtype
+        and device, and supporting autograd.
+
         Args:
             tokenized_pair (TokenizedPair): a pair of tokenized texts.
             alignment (Alignment): positions and tokens of the alignment.
+            stacked (bool): whether the features are stacks of feature arrays with shape
+                            (n_arrays, n_tokens, ...), e.g., the hidden states of all the layers.
+                            All the arrays are aggregated in one call.
 
         Returns:
-            np.ndarray: features of `tokens_b` aggregated to match the tokens of `tokens_a`.
+            Features: features of `tokens_b` aggregated to match the tokens of `tokens_a`.
         """
         assert (
             tokenized_pair.features_a is not None
@@ -122,6 +476,36 @@ class Aligner(ABC):
         if alignment is None:
             alignment = self.align_pair(tokenized_pair)
 
+        axis = 1 if stacked else 0
+        if is_torch_tensor(tokenized_pair.features_b):
+            reduction = TORCH_REDUCTIONS.get(aggregate_fn)
+            assert (
+                reduction is not None
+            ), "Torch features can only be aggregated with `np.mean`, `np.sum`, `np.max` or `np.min`."
+            return aggregate_torch(
+                alignment.to_indices(),
+                tokenized_pair.features_a.shape[axis],
+                tokenized_pair.features_b,
+                reduction,
+                axis,
+            )
+
+        kind = PROJECTION_KINDS.get(aggregate_fn)
+        if kind is not None:
+            projection = alignment.to_projection(
+                kind,
+                np.float64,
+                shape=(
+                    tokenized_pair.features_a.shape[axis],
+                    tokenized_pair.features_b.shape[axis],
+                ),
+            )
+            return project_features(projection, tokenized_pair.features_b, axis)
+
+        assert (
+            not stacked
+        ), "Stacked features can only be aggregated with `np.mean` or `np.sum`."
+
         aggregated_features = np.zeros(
             (
                 tokenized_pair.features_a.shape[0],
@@ -129,9 +513,12 @@ class Aligner(ABC):
             )
         )
 
+        # The numpy reductions also supported for torch tensors (`np.max`
+        # and `np.min`) reduce each feature, as they do for torch tensors
+        kwargs = {"axis": 0} if aggregate_fn in TORCH_REDUCTIONS else {}
         for position_a, positions_b in alignment:
             aggregated_features[position_a] = aggregate_fn(
-                tokenized_pair.features_b[positions_b]
+                tokenized_pair.features_b[positions_b], **kwargs
             )
 
         return aggregated_features
@@ -142,7 +529,8 @@ class Aligner(ABC):
         aggregate_fn: Callable = np.mean,
         stack: bool = False,
         alignments: Optional[List[Alignment]] = None,
-    ) -> Union[List[np.ndarray], np.ndarray]:
+        stacked: bool = False,
+    ) -> Union[List[Features], Features]:
         """
         Aggregates features associated to the tokens after aligning
         the tokens of multiple tokenizers.
@@ -156,10 +544,13 @@ class Aligner(ABC):
                                      each token in `tokens_a`.
             stack (bool): whether to stack horizontally all the features after aligning the tokens.
             alignments (List[Alignment]): positions and tokens of each alignment.
+            stacked (bool): whether the features of each tokenizer are stacks of feature arrays
+                            with shape (n_arrays, n_tokens, ...), e.g., the hidden states of all
+                            the layers. All the arrays of each tokenizer are aggregated in one call.
 
         Returns:
-            Union[List[np.ndarray], np.ndarray]: np.ndarray with the stacked features if `stack`
-                                                 is True, else, a list of the features.
+            Union[List[Features], Features]: the stacked features if `stack` is True,
+                                             else, a list of the features.
         """
         assert (
             len(tokenized_set.features) > 0
@@ -181,6 +572,9 @@ class Aligner(ABC):
             else [[] for _ in range(len(tokenized_set.tokens))]
         )
 
+        if alignments is None:
+            alignments = self.align(tokenized_set)
+
         tokens_a = tokenized_set.tokens[0]
         word_ids_a = word_ids[0]
         spans_a = spans[0]
@@ -197,7 +591,7 @@ class Aligner(ABC):
         ):
             merged_features.append(
                 self.aggregate_features_pair(
-                    TokenizedPair(
+                    TokenizedPair.trusted(
                         tokens_a=tokens_a,
                         tokens_b=tokens_b,
                         word_ids_a=word_ids_a,
@@ -209,13 +603,141 @@ class Aligner(ABC):
                         text=tokenized_set.text,
                     ),
                     aggregate_fn,
-                    alignment=(
-                        alignments[idx] if alignments is not None else None
-                    ),
+                    alignment=alignments[idx],
+                    stacked=stacked,
                 )
             )
 
         if stack:
+            if is_torch_tensor(tokenized_set.features[0]):
+                import torch
+
+                return torch.cat(
+                    (tokenized_set.features[0], *merged_features), dim=-1
+                )
+            if stacked:
+                return np.concatenate(
+                    (tokenized_set.features[0], *merged_features), axis=-1
+                )
             return np.hstack((tokenized_set.features[0], *merged_features))
 
         return [tokenized_set.features[0], *merged_features]
+
+    async def aggregate_features_async(
+        self,
+        tokenized_set: TokenizedSet,
+        aggregate_fn: Callable = np.mean,
+        stack: bool = False,
+        alignments: Optional[List[Alignment]] = None,
+        stacked: bool = False,
+    ) -> Union[List[Features], Features]:
+        """
+        Coroutine version of `aggregate_features`, that runs in the executor of the aligner.
+
+        Args:
+            tokenized_set (TokenizedSet): multiple tokenized texts.
+            aggregate_fn (Callable): function to aggregate the tokens of `tokens_b` matched with
+                                     each token in `tokens_a`.
+            stack (bool): whether to stack horizontally all the features after aligning the tokens.
+            alignments (List[Alignment]): positions and tokens of each alignment.
+            stacked (bool): whether the features of each tokenizer are stacks of feature arrays.
+
+        Returns:
+            Union[List[Features], Features]: the stacked features if `stack` is True,
+                                             else, a list of the features.
+        """
+        return await self._run_async(
+            self.aggregate_features,
+            tokenized_set,
+            aggregate_fn,
+            stack=stack,
+            alignments=alignments,
+            stacked=stacked,
+        )
+
+    def aggregate_features_into(
+        self,
+        tokenized_set: TokenizedSet,
+        out: Union[str, Path, np.ndarray],
+        aggregate_fn: Callable = np.mean,
+        alignments: Optional[List[Alignment]] = None,
+        chunk_size: int = 1024,
+        dtype: np.dtype = np.float32,
+    ) -> np.ndarray:
+        """
+        Aggregates features associated to the tokens after aligning the tokens
+        of multiple tokenizers, as `aggregate_features` with `stack=True`, but
+        writing the stacked features straight into `out` in chunks of rows.
+
+        The features can be memory-mapped arrays, e.g., loaded with
+        `np.load(path, mmap_mode="r")`, and only the rows needed by each
+        chunk are read, so the memory use is bounded by `chunk_size`.
+
+        Args:
+            tokenized_set (TokenizedSet): multiple tokenized texts.
+            out (Union[str, Path, np.ndarray]): (n_tokens, total_dim) array where the features
+                                                are written, or path of a .npy file to create.
+            aggregate_fn (Callable): `np.mean` or `np.sum`.
+            alignments (List[Alignment]): positions and tokens of each alignment.
+            chunk_size (int): number of rows aggregated at once.
+            dtype (np.dtype): dtype of the .npy file when `out` is a path.
+
+        Returns:
+            np.ndarray: `out`, or the memory-mapped .npy file.
+        """
+        kind = PROJECTION_KINDS.get(aggregate_fn)
+        assert (
+            kind is not None
+        ), "Out-of-core aggregation only supports `np.mean` and `np.sum`."
+
+        assert (
+            len(tokenized_set.features) > 0
+        ), "Features must be a non-empty list of numpy arrays."
+
+        assert len(tokenized_set.features) == len(
+            tokenized_set.tokens
+        ), "There are less features than tokenizations."
+
+        if alignments is None:
+            alignments = self.align(tokenized_set)
+
+        n_rows = tokenized_set.features[0].shape[0]
+        widths = [
+            int(np.prod(features.shape[1:]))
+            for features in tokenized_set.features
+        ]
+        if not isinstance(out, np.ndarray):
+            out = np.lib.format.open_memmap(
+                out, mode="w+", dtype=dtype, shape=(n_rows, sum(widths))
+            )
+        assert out.shape == (
+            n_rows,
+            sum(widths),
+        ), f"`out` must have shape {(n_rows, sum(widths))}."
+
+        # The first features are copied, and the others aggregated
+        column = 0
+        for idx, (features, width) in enumerate(
+            zip(tokenized_set.features, widths)
+        ):
+            features = features.reshape(features.shape[0], width)
+            target = out[:, column : column + width]
+            if idx == 0:
+                for start in range(0, n_rows, chunk_size):
+                    target[start : start + chunk_size] = features[
+                        start : start + chunk_size
+                    ]
+            else:
+                project_features_chunked(
+                    alignments[idx - 1].to_projection(
+                        kind, np.float64, shape=(n_rows, features.shape[0])
+                    ),
+                    features,
+                    target,
+                    chunk_size,
+                )
+            column += width
+
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
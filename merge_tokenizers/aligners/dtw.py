@@ -1,12 +1,50 @@
 import ctypes
 import glob
 from collections import defaultdict
-from ctypes import POINTER, c_int
+from ctypes import POINTER, c_float, c_int, c_short
 from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
 
 from ..types import Alignment, PositionAlignment, TokenAlignment, TokenizedPair
-from ..utils.distances import get_distance_fn, precompute_distances
+from ..utils.distances import (
+    codepoints_distance_matrix,
+    get_distance_fn,
+    get_distance_id,
+    is_float_distance,
+    precompute_distances,
+)
+from ..utils.encoding import encode_tokens
 from .base import Aligner
+from .dtw_session import DTWSessionCache
+from .dtw_sparse import (
+    AdaptiveBandDTW,
+    multiscale_intervals,
+    sparse_dtw,
+    word_ids_intervals,
+)
+
+# C types of the costs of the DTW kernels
+COST_TYPES = {"int16": c_short, "int32": c_int, "float32": c_float}
+
+
+def select_cost_dtype(distances: np.ndarray) -> str:
+    """
+    Picks the narrowest cost type of the DTW kernels that can hold the cost
+    of any path without overflowing. The cost of a path is at most its
+    length, len_a + len_b, times the largest distance.
+
+    Args:
+        distances (np.ndarray): (len_a, len_b) matrix of distances.
+
+    Returns:
+        str: "float32" for float distances, else "int16" or "int32".
+    """
+    if np.issubdtype(distances.dtype, np.floating):
+        return "float32"
+    max_cost = int(np.abs(distances).max(initial=0)) * sum(distances.shape)
+    return "int16" if max_cost < np.iinfo(np.int16).max else "int32"
 
 
 class Tuple(ctypes.Structure):
@@ -18,10 +56,68 @@ class AlignmentResult(ctypes.Structure):
 
 
 class DTWAligner(Aligner):
-    def __init__(self, distance_name: str, radius: int = -1, **kwargs):
+    """
+    Aligner based on a C implementation of Dynamic Time Warping.
+
+    Each pair is aligned by the first mode that applies to it:
+    1. `word_ids_radius` >= 0 and both texts have sorted word ids: sparse DTW
+       over the cells of the same word, at most `word_ids_radius` tokens away.
+    2. `multiscale_radius` >= 0 and both texts are long enough: sparse DTW
+       around the path of a coarse-to-fine DTW over merged tokens.
+    3. `adaptive_radius` >= 0: sparse DTW in a band that widens where
+       the path touches its edges.
+    4. `session_cache` is given: full DTW with int32 costs (float32 for float
+       distances), resuming from the cost matrix of the longest cached prefix.
+    5. Otherwise: full DTW, or banded if `radius` > 0, with `cost_dtype` costs,
+       keeping only two rows of costs if `low_memory`.
+
+    `radius`, `low_memory` and `cost_dtype` only apply to the modes 4-5 (only
+    `radius` to 4), so they can't be combined with `adaptive_radius`, nor
+    `low_memory` and other cost types with `session_cache`.
+    """
+
+    def __init__(
+        self,
+        distance_name: str,
+        radius: int = -1,
+        low_memory: bool = False,
+        session_cache: Optional[DTWSessionCache] = None,
+        cost_dtype: str = "auto",
+        word_ids_radius: int = -1,
+        multiscale_radius: int = -1,
+        adaptive_radius: int = -1,
+        **kwargs,
+    ):
         super().__init__(**kwargs)
+        assert (
+            cost_dtype == "auto" or cost_dtype in COST_TYPES
+        ), f"`cost_dtype` must be 'auto' or one of {list(COST_TYPES)}."
+        session_dtype = (
+            "float32"
+            if is_float_distance(get_distance_fn(distance_name))
+            else "int32"
+        )
+        assert session_cache is None or (
+            not low_memory and cost_dtype in ["auto", session_dtype]
+        ), f"`session_cache` always uses {session_dtype} costs with the full matrix."
+        assert adaptive_radius < 0 or (
+            radius <= 0
+            and not low_memory
+            and session_cache is None
+            and cost_dtype == "auto"
+        ), "`adaptive_radius` can't be combined with `radius`, `low_memory`, `session_cache` nor `cost_dtype`."
         self.distance_fn = get_distance_fn(distance_name)
+        self.distance_id = get_distance_id(self.distance_fn)
         self.radius = radius
+        self.low_memory = low_memory
+        self.session_cache = session_cache
+        self.cost_dtype = cost_dtype
+        self.word_ids_radius = word_ids_radius
+        self.multiscale_radius = multiscale_radius
+        self.adaptive_radius = adaptive_radius
+        self.adaptive_band = (
+            AdaptiveBandDTW(adaptive_radius) if adaptive_radius >= 0 else None
+        )
         self._build_c_lib()
 
     def _build_c_lib(self):
@@ -31,9 +127,17 @@ class DTWAligner(Aligner):
         so_library = glob.glob(f"{Path(__file__).parent}/dtw_c/*.so")[0]
         self.c_lib = ctypes.CDLL(so_library)
         self.c_lib.free_alignment_result.argtypes = [AlignmentResult]
-        self.c_dtw = self.c_lib.dtw_alignment
-        self.c_dtw.restype = AlignmentResult
-        self.c_dtw.argtypes = [c_int, c_int, POINTER(c_int), c_int]
+        # Kernels by cost type and memory mode
+        self.c_dtw_kernels = {}
+        for cost_dtype, c_type in COST_TYPES.items():
+            for low_memory in [False, True]:
+                kernel = getattr(
+                    self.c_lib,
+                    f"dtw_alignment{'_low_memory' if low_memory else ''}_{cost_dtype}",
+                )
+                kernel.restype = AlignmentResult
+                kernel.argtypes = [c_int, c_int, POINTER(c_type), c_int]
+                self.c_dtw_kernels[cost_dtype, low_memory] = kernel
 
     def _align_pair(
         self,
@@ -41,32 +145,40 @@ class DTWAligner(Aligner):
     ) -> Alignment:
         """
         Aligns the tokens from two different tokenizers, using a
-        C implementation of Dynamic Time Warping with radius.
+        C implementation of Dynamic Time Warping with radius, or the
+        first sparse mode of the aligner that applies to the pair.
         """
-        # Add internal first token
-        bos_tokens_a = ["<||BOS||>"] + tokenized_pair.preprocessed_tokens_a
-        bos_tokens_b = ["<||BOS||>"] + tokenized_pair.preprocessed_tokens_b
-
-        # Precompute distances
-        distances = precompute_distances(
-            bos_tokens_a, bos_tokens_b, self.distance_fn
-        )
-
-        # Compute alignments using c_dtw
-        c_distances = (c_int * len(distances))(*distances)  # type: ignore
-        alignment_result = self.c_dtw(
-            len(bos_tokens_a), len(bos_tokens_b), c_distances, self.radius
-        )
-        alignments = [
-            (
-                alignment_result.alignment[i].first - 1,
-                alignment_result.alignment[i].second - 1,
+        intervals = self._word_ids_intervals(tokenized_pair)
+        if intervals is None and self.multiscale_radius >= 0:
+            intervals = multiscale_intervals(
+                tokenized_pair.preprocessed_tokens_a,
+                tokenized_pair.preprocessed_tokens_b,
+                self.multiscale_radius,
             )
-            for i in range(alignment_result.n_elements)
-        ][::-1][1:]
-
-        # Free memory
-        self.c_lib.free_alignment_result(alignment_result)
+        if intervals is not None:
+            alignments = sparse_dtw(
+                tokenized_pair.preprocessed_tokens_a,
+                tokenized_pair.preprocessed_tokens_b,
+                intervals[0],
+                intervals[1],
+                self.distance_fn,
+            ).tolist()
+        elif self.adaptive_band is not None:
+            alignments = self.adaptive_band.align(
+                tokenized_pair.preprocessed_tokens_a,
+                tokenized_pair.preprocessed_tokens_b,
+                self.distance_fn,
+            ).tolist()
+        elif self.session_cache is not None:
+            alignments = self.session_cache.align(
+                tokenized_pair.preprocessed_tokens_a,
+                tokenized_pair.preprocessed_tokens_b,
+                self.distance_fn,
+                self.radius,
+                self._cache_config(),
+            ).tolist()
+        else:
+            alignments = self._c_dtw(tokenized_pair)
 
         # Merge alignments
         merged = defaultdict(list)
@@ -91,3 +203,83 @@ class DTWAligner(Aligner):
         ]
 
         return Alignment(positions=position_alignments, tokens=token_alignments)
+
+    def _word_ids_intervals(
+        self, tokenized_pair: TokenizedPair
+    ) -> Optional[tuple]:
+        """
+        Computes the columns allowed in each row by the word ids of the pair,
+        or None if the word ids are disabled, missing or not sorted.
+        """
+        if (
+            self.word_ids_radius < 0
+            or not tokenized_pair.tokens_a
+            or not tokenized_pair.tokens_b
+            or len(tokenized_pair.word_ids_a) != len(tokenized_pair.tokens_a)
+            or len(tokenized_pair.word_ids_b) != len(tokenized_pair.tokens_b)
+        ):
+            return None
+        return word_ids_intervals(
+            tokenized_pair.word_ids_a,
+            tokenized_pair.word_ids_b,
+            self.word_ids_radius,
+        )
+
+    def _c_dtw(self, tokenized_pair: TokenizedPair) -> List[tuple]:
+        """
+        Computes the aligned (position_a, position_b) with the C implementation.
+        """
+        # Add internal first token
+        bos_tokens_a = ["<||BOS||>"] + tokenized_pair.preprocessed_tokens_a
+        bos_tokens_b = ["<||BOS||>"] + tokenized_pair.preprocessed_tokens_b
+
+        # Precompute distances, without holding the GIL if the distance
+        # has a native implementation. The BOS row and column are not used.
+        if self.distance_id is not None:
+            offsets_a, codepoints_a = encode_tokens(bos_tokens_a)
+            offsets_b, codepoints_b = encode_tokens(bos_tokens_b)
+            distances = np.zeros(
+                (len(bos_tokens_a), len(bos_tokens_b)), dtype=np.int32
+            )
+            distances[1:, 1:] = codepoints_distance_matrix(
+                offsets_a,
+                codepoints_a,
+                (1, len(bos_tokens_a)),
+                offsets_b,
+                codepoints_b,
+                (1, len(bos_tokens_b)),
+                self.radius,
+                self.distance_id,
+            )
+        else:
+            distances = np.asarray(
+                precompute_distances(
+                    bos_tokens_a, bos_tokens_b, self.distance_fn
+                )
+            ).reshape(len(bos_tokens_a), len(bos_tokens_b))
+
+        # Compute alignments with the kernel of the narrowest cost type,
+        # which releases the GIL
+        cost_dtype = (
+            select_cost_dtype(distances)
+            if self.cost_dtype == "auto"
+            else self.cost_dtype
+        )
+        distances = np.ascontiguousarray(distances, dtype=cost_dtype)
+        alignment_result = self.c_dtw_kernels[cost_dtype, self.low_memory](
+            len(bos_tokens_a),
+            len(bos_tokens_b),
+            distances.ctypes.data_as(POINTER(COST_TYPES[cost_dtype])),  # type: ignore
+            self.radius,
+        )
+        alignments = [
+            (
+                alignment_result.alignment[i].first - 1,
+                alignment_result.alignment[i].second - 1,
+            )
+            for i in range(alignment_result.n_elements)
+        ][::-1][1:]
+
+        # Free memory
+        self.c_lib.free_alignment_result(alignment_result)
+        return alignments
@@ -5,6 +5,12 @@
 #include <stdlib.h>
 #include <math.h>
 #include <limits.h>
+#include <stdint.h>
+
+// Predecessor of a cell, stored with 2 bits per cell in the direction matrix
+#define DIRECTION_UP 0
+#define DIRECTION_LEFT 1
+#define DIRECTION_DIAGONAL 2
 
 typedef struct {
     int first;
@@ -16,61 +22,47 @@ typedef struct {
     int n_elements;
 } AlignmentResult;
 
+static inline void set_direction(uint8_t* directions, long cell, int direction) {
+    int shift = (int)(cell & 3) << 1;
+    directions[cell >> 2] = (directions[cell >> 2] & ~(3 << shift)) | (direction << shift);
+}
+
+static inline int get_direction(uint8_t* directions, long cell) {
+    return (directions[cell >> 2] >> ((int)(cell & 3) << 1)) & 3;
+}
+
+// Kernels with int16, int32 and float32 costs. The caller picks a type
+// that can hold the cost of any path without overflowing.
+#define COST_TYPE int16_t
+#define COST_INF INT16_MAX
+#define SUFFIX _int16
+#include "dtw_kernel.h"
+#undef COST_TYPE
+#undef COST_INF
+#undef SUFFIX
+
+#define COST_TYPE int32_t
+#define COST_INF INT32_MAX
+#define SUFFIX _int32
+#include "dtw_kernel.h"
+#undef COST_TYPE
+#undef COST_INF
+#undef SUFFIX
+
+#define COST_TYPE float
+#define COST_INF INFINITY
+#define SUFFIX _float32
+#include "dtw_kernel.h"
+#undef COST_TYPE
+#undef COST_INF
+#undef SUFFIX
+
 AlignmentResult dtw_alignment(int len_a, int len_b, int* distances, int radius) {
-    // Compute distance matrix
-    int** matrix = (int**)malloc((len_a + 1) * sizeof(int*));
-    for (int i = 0; i <= len_a; i++) {
-        matrix[i] = (int*)malloc((len_b + 1) * sizeof(int));
-    }
+    return dtw_alignment_int32(len_a, len_b, distances, radius);
+}
 
-    for (int i = 0; i <= len_a; i++) {
-        for (int j = 0; j <= len_b; j++) {
-            matrix[i][j] = INT_MAX;
-        }
-    }
-    matrix[0][0] = 0;
-    int dist = 0;
-    for (int i = 1; i < len_a; i++) {
-        for (int j = 1; j < len_b; j++) {
-            dist = distances[i * len_b + j];
-            if (radius > 0) {
-                if (abs(i-j) <= radius){
-                    matrix[i][j] = fminf(matrix[i - 1][j], fminf(matrix[i - 1][j - 1], matrix[i][j - 1])) + dist;
-                }
-            }
-            else {
-                matrix[i][j] = fminf(matrix[i - 1][j], fminf(matrix[i - 1][j - 1], matrix[i][j - 1])) + dist;
-            } 
-        }
-    }
-    // Recover pointers
-    int i = len_a, j = len_b;
-    Tuple* alignment = (Tuple*)malloc((len_a + len_b) * sizeof(Tuple));
-    int index = 0;
-    float min_ = 0;
-    while (i > 0 && j > 0) {
-        min_ = fminf(matrix[i - 1][j], fminf(matrix[i][j - 1], matrix[i - 1][j - 1]));
-        if (min_ == matrix[i - 1][j]) {
-            alignment[index].first = i - 1;
-            alignment[index].second = j;
-            i--;
-        }
-        else if (min_ == matrix[i][j - 1]) {
-            alignment[index].first = i;
-            alignment[index].second = j - 1;
-            j--;
-        } else {
-            alignment[index].first = i - 1;
-            alignment[index].second = j - 1;
-            i--;
-            j--;
-        }
-        index++;
-    }
-    AlignmentResult result;
-    result.alignment = alignment;
-    result.n_elements = index;
-    return result;
+AlignmentResult dtw_alignment_low_memory(int len_a, int len_b, int* distances, int radius) {
+    return dtw_alignment_low_memory_int32(len_a, len_b, distances, radius);
 }
 
 void free_alignment_result(AlignmentResult result) {
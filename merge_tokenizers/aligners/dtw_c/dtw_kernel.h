@@ -0,0 +1,129 @@
+// Template of the DTW kernels for a cost type. It is included once per
+// type by dtw.c, defining COST_TYPE, COST_INF (value of the unreachable
+// cells) and SUFFIX (appended to the names of the kernels).
+
+#define CONCAT_(a, b) a##b
+#define CONCAT(a, b) CONCAT_(a, b)
+#define KERNEL(name) CONCAT(name, SUFFIX)
+
+static inline COST_TYPE KERNEL(min3)(COST_TYPE a, COST_TYPE b, COST_TYPE c) {
+    COST_TYPE min_ = a < b ? a : b;
+    return min_ < c ? min_ : c;
+}
+
+AlignmentResult KERNEL(dtw_alignment)(int len_a, int len_b, COST_TYPE* distances, int radius) {
+    // Compute distance matrix
+    long cols = len_b + 1;
+    COST_TYPE* matrix = (COST_TYPE*)malloc((len_a + 1) * cols * sizeof(COST_TYPE));
+    for (long cell = 0; cell < (len_a + 1) * cols; cell++) {
+        matrix[cell] = COST_INF;
+    }
+    matrix[0] = 0;
+    for (int i = 1; i < len_a; i++) {
+        for (int j = 1; j < len_b; j++) {
+            if (radius > 0 && abs(i - j) > radius) {
+                continue;
+            }
+            COST_TYPE min_ = KERNEL(min3)(matrix[(i - 1) * cols + j], matrix[(i - 1) * cols + j - 1], matrix[i * cols + j - 1]);
+            matrix[i * cols + j] = min_ == COST_INF ? COST_INF : (COST_TYPE)(min_ + distances[(long)i * len_b + j]);
+        }
+    }
+    // Recover pointers
+    int i = len_a, j = len_b;
+    Tuple* alignment = (Tuple*)malloc((len_a + len_b) * sizeof(Tuple));
+    int index = 0;
+    while (i > 0 && j > 0) {
+        COST_TYPE up = matrix[(i - 1) * cols + j];
+        COST_TYPE left = matrix[i * cols + j - 1];
+        COST_TYPE min_ = KERNEL(min3)(up, left, matrix[(i - 1) * cols + j - 1]);
+        if (min_ == up) {
+            i--;
+        } else if (min_ == left) {
+            j--;
+        } else {
+            i--;
+            j--;
+        }
+        alignment[index].first = i;
+        alignment[index].second = j;
+        index++;
+    }
+    free(matrix);
+
+    AlignmentResult result;
+    result.alignment = alignment;
+    result.n_elements = index;
+    return result;
+}
+
+AlignmentResult KERNEL(dtw_alignment_low_memory)(int len_a, int len_b, COST_TYPE* distances, int radius) {
+    // Same recurrence and tie-breaking as `dtw_alignment`, but only two rows of
+    // costs are kept and the predecessor of each cell is packed in 2 bits.
+    long cols = len_b + 1;
+    COST_TYPE* previous = (COST_TYPE*)malloc(cols * sizeof(COST_TYPE));
+    COST_TYPE* current = (COST_TYPE*)malloc(cols * sizeof(COST_TYPE));
+    COST_TYPE* swap = NULL;
+    uint8_t* directions = (uint8_t*)calloc(((len_a + 1) * cols + 3) / 4, sizeof(uint8_t));
+
+    previous[0] = 0;
+    for (int j = 1; j <= len_b; j++) {
+        previous[j] = COST_INF;
+    }
+    for (int i = 1; i <= len_a; i++) {
+        current[0] = COST_INF;
+        for (int j = 1; j <= len_b; j++) {
+            COST_TYPE min_ = previous[j];
+            int direction = DIRECTION_UP;
+            if (current[j - 1] < min_) {
+                min_ = current[j - 1];
+                direction = DIRECTION_LEFT;
+            }
+            if (previous[j - 1] < min_) {
+                min_ = previous[j - 1];
+                direction = DIRECTION_DIAGONAL;
+            }
+            set_direction(directions, i * cols + j, direction);
+
+            // The last row and column are never filled, as in `dtw_alignment`
+            if (i < len_a && j < len_b && min_ != COST_INF && (radius <= 0 || abs(i - j) <= radius)) {
+                current[j] = (COST_TYPE)(min_ + distances[(long)i * len_b + j]);
+            } else {
+                current[j] = COST_INF;
+            }
+        }
+        swap = previous;
+        previous = current;
+        current = swap;
+    }
+    free(previous);
+    free(current);
+
+    // Recover pointers
+    int i = len_a, j = len_b;
+    Tuple* alignment = (Tuple*)malloc((len_a + len_b) * sizeof(Tuple));
+    int index = 0;
+    while (i > 0 && j > 0) {
+        int direction = get_direction(directions, i * cols + j);
+        if (direction == DIRECTION_UP) {
+            i--;
+        } else if (direction == DIRECTION_LEFT) {
+            j--;
+        } else {
+            i--;
+            j--;
+        }
+        alignment[index].first = i;
+        alignment[index].second = j;
+        index++;
+    }
+    free(directions);
+
+    AlignmentResult result;
+    result.alignment = alignment;
+    result.n_elements = index;
+    return result;
+}
+
+#undef CONCAT_
+#undef CONCAT
+#undef KERNEL
@@ -7,9 +7,10 @@ from numba import njit
 from ..types import Alignment, PositionAlignment, TokenAlignment, TokenizedPair
 from ..utils.distances import get_distance_fn, precompute_distances
 from .base import Aligner
+from .dtw_sparse import AdaptiveBandDTW
 
 
-@njit
+@njit(nogil=True)
 def _dtw(len_a: int, len_b: int, distances: List[int], radius: int):
     """
     Computes Dynamic Time Warping and backtraces the pointers.
@@ -59,10 +60,23 @@ def _dtw(len_a: int, len_b: int, distances: List[int], radius: int):
 
 
 class PythonDTWAligner(Aligner):
-    def __init__(self, distance_name: str, radius: int = -1, **kwargs):
+    def __init__(
+        self,
+        distance_name: str,
+        radius: int = -1,
+        adaptive_radius: int = -1,
+        **kwargs,
+    ):
         super().__init__(**kwargs)
+        assert (
+            adaptive_radius < 0 or radius <= 0
+        ), "`adaptive_radius` can't be combined with `radius`."
         self.distance_fn = get_distance_fn(distance_name)
         self.radius = radius
+        self.adaptive_radius = adaptive_radius
+        self.adaptive_band = (
+            AdaptiveBandDTW(adaptive_radius) if adaptive_radius >= 0 else None
+        )
 
     def _align_pair(
         self,
@@ -71,21 +85,31 @@ class PythonDTWAligner(Aligner):
         """
         Aligns the tokens from two different tokenizers, using a
         Python implementation of Dynamic Time Warping with radius.
+
+        If `adaptive_radius` >= 0, the DTW is computed in a band around the
+        diagonal that widens where the path touches its edges.
         """
-        # Add internal first token
-        bos_tokens_a = ["<||BOS||>"] + tokenized_pair.preprocessed_tokens_a
-        bos_tokens_b = ["<||BOS||>"] + tokenized_pair.preprocessed_tokens_b
+        if self.adaptive_band is not None:
+            alignments = self.adaptive_band.align(
+                tokenized_pair.preprocessed_tokens_a,
+                tokenized_pair.preprocessed_tokens_b,
+                self.distance_fn,
+            ).tolist()
+        else:
+            # Add internal first token
+            bos_tokens_a = ["<||BOS||>"] + tokenized_pair.preprocessed_tokens_a
+            bos_tokens_b = ["<||BOS||>"] + tokenized_pair.preprocessed_tokens_b
 
-        # Precompute distances
-        distances = precompute_distances(
-            bos_tokens_a, bos_tokens_b, self.distance_fn
-        )
+            # Precompute distances
+            distances = precompute_distances(
+                bos_tokens_a, bos_tokens_b, self.distance_fn
+            )
 
-        # Compute alignments
-        alignments = _dtw(
-            len(bos_tokens_a), len(bos_tokens_b), distances, self.radius
-        )[1:]
-        alignments = [(pos_a - 1, pos_b - 1) for pos_a, pos_b in alignments]
+            # Compute alignments
+            alignments = _dtw(
+                len(bos_tokens_a), len(bos_tokens_b), distances, self.radius
+            )[1:]
+            alignments = [(pos_a - 1, pos_b - 1) for pos_a, pos_b in alignments]
 
         # Merge alignments
         merged = defaultdict(list)
@@ -0,0 +1,362 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from numba import njit
+
+from ..utils.distances import (
+    codepoints_distance_matrix,
+    get_distance_id,
+    is_float_distance,
+)
+from ..utils.encoding import encode_tokens
+
+# Value of the cells not reachable by the DTW of each cost type,
+# as in the C implementation
+_INF = {np.int32: np.iinfo(np.int32).max, np.float32: np.inf}
+
+# Growth factor of the cost matrices, to extend them in place in the next turns
+_GROWTH = 1.5
+
+
+def _python_distances(
+    tokens_a: List[str],
+    rows: Tuple[int, int],
+    tokens_b: List[str],
+    cols: Tuple[int, int],
+    radius: int,
+    distance_fn: Callable,
+    dtype: type,
+) -> np.ndarray:
+    """
+    Same as `codepoints_distance_matrix`, for distances without native implementation.
+    """
+    distances = np.zeros((rows[1] - rows[0], cols[1] - cols[0]), dtype=dtype)
+    for i in range(rows[0], rows[1]):
+        for j in range(cols[0], cols[1]):
+            if radius > 0 and abs(i - j) > radius:
+                continue
+            distances[i - rows[0], j - cols[0]] = distance_fn(
+                tokens_a[i], tokens_b[j]
+            )
+    return distances
+
+
+@njit(inline="always")
+def _fill_cell(matrix: np.ndarray, i: int, j: int, distance, radius: int, inf):
+    if i == 0 or j == 0 or (radius > 0 and abs(i - j) > radius):
+        matrix[i, j] = inf
+        return
+    min_ = min(matrix[i - 1, j], matrix[i, j - 1], matrix[i - 1, j - 1])
+    matrix[i, j] = inf if min_ == inf else min_ + distance
+
+
+@njit(nogil=True)
+def _dtw_extend(
+    matrix: np.ndarray,
+    start_a: int,
+    start_b: int,
+    len_a: int,
+    len_b: int,
+    rows_distances: np.ndarray,
+    cols_distances: np.ndarray,
+    radius: int,
+    inf,
+):
+    """
+    Extends the DTW cost matrix of the prefixes of lengths (start_a, start_b)
+    to the sequences of lengths (len_a, len_b), computing only the new columns of
+    the rows of the prefix and the new rows. `rows_distances` are the distances
+    of the new tokens of `a` with all the tokens of `b`, and `cols_distances`
+    the distances of the tokens of the prefix of `a` with the new tokens of `b`.
+    """
+    for i in range(start_a + 1):
+        for j in range(start_b + 1, len_b + 1):
+            distance = cols_distances[i - 1, j - start_b - 1] if i > 0 else 0
+            _fill_cell(matrix, i, j, distance, radius, inf)
+    for i in range(start_a + 1, len_a + 1):
+        for j in range(len_b + 1):
+            distance = rows_distances[i - start_a - 1, j - 1] if j > 0 else 0
+            _fill_cell(matrix, i, j, distance, radius, inf)
+
+
+@njit(nogil=True)
+def _dtw_backtrace(
+    matrix: np.ndarray, len_a: int, len_b: int, inf
+) -> np.ndarray:
+    """
+    Backtraces the pointers of a DTW cost matrix with the same tie-breaking
+    as the C implementation, and returns the aligned (position_a, position_b).
+    The BOS row and column are in the matrix, and the last row and column
+    of the C implementation are never filled, so they are not stored.
+    """
+    path = np.empty((len_a + len_b + 2, 2), dtype=np.int64)
+    n_elements = 0
+    i, j = len_a + 1, len_b + 1
+    while i > 0 and j > 0:
+        up = matrix[i - 1, j] if j <= len_b else inf
+        left = matrix[i, j - 1] if i <= len_a else inf
+        diagonal = matrix[i - 1, j - 1]
+        min_ = min(up, left, diagonal)
+        if min_ == up:
+            i -= 1
+        elif min_ == left:
+            j -= 1
+        else:
+            i -= 1
+            j -= 1
+        path[n_elements, 0] = i - 1
+        path[n_elements, 1] = j - 1
+        n_elements += 1
+    # The last cell reached is the BOS, which is not aligned
+    return path[: n_elements - 1][::-1]
+
+
+def _prefix_digests(
+    tokens: List[str], lengths: Iterable[int], config: str
+) -> Dict[int, bytes]:
+    """
+    Hashes the prefixes of `tokens` with the given lengths in a single pass.
+    """
+    digest = hashlib.blake2b(config.encode("utf-8"), digest_size=16)
+    lengths = set(lengths)
+    digests = {0: digest.digest()} if 0 in lengths else {}
+    for length, token in enumerate(tokens, start=1):
+        digest.update((token + "\x1f").encode("utf-8", errors="surrogatepass"))
+        if length in lengths:
+            digests[length] = digest.digest()
+    return digests
+
+
+class _Session:
+    """
+    Cost matrix shared by a chain of pairs, each one extending the previous.
+    Each checkpoint (len_a, len_b, digest_a, digest_b) is a pair whose
+    costs are in matrix[: len_a + 1, : len_b + 1].
+    """
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+        self.checkpoints: List[Tuple[int, int, bytes, bytes]] = []
+
+
+class DTWSessionCache:
+    """
+    Cache of the DTW cost matrices of recent pairs, used by `DTWAligner`
+    to align pairs extending a previous pair, e.g., the turns of a chat
+    that re-sends the whole conversation. The cost matrices are keyed by the
+    hashes of the preprocessed tokens of both texts, and a new pair resumes from
+    the longest cached prefix of both texts, so only the cells of the new tokens
+    are computed. At most `max_sessions` matrices with `max_cells` cells in total
+    are kept, evicting the least recently used.
+
+    Example:
+        aligner = DTWAligner("levenshtein", session_cache=DTWSessionCache())
+    """
+
+    def __init__(self, max_sessions: int = 16, max_cells: int = 2**26):
+        self.max_sessions = max_sessions
+        self.max_cells = max_cells
+        self._sessions: "OrderedDict[int, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_cells = 0
+        self.computed_cells = 0
+
+    def _checkout(
+        self, tokens_a: List[str], tokens_b: List[str], config: str, dtype: type
+    ) -> Tuple[_Session, int, int]:
+        """
+        Takes the session with the longest cached prefix of both texts out of
+        the cache, with room for the whole pair, or creates a new session.
+        Checkpoints beyond the prefix are dropped, since their cells will be
+        overwritten. The session is added back to the cache by `_checkin`.
+        """
+        len_a, len_b = len(tokens_a), len(tokens_b)
+        with self._lock:
+            checkpoints = [
+                checkpoint
+                for session in self._sessions.values()
+                for checkpoint in session.checkpoints
+            ]
+        digests_a = _prefix_digests(
+            tokens_a,
+            [len_a] + [c[0] for c in checkpoints if c[0] <= len_a],
+            config,
+        )
+        digests_b = _prefix_digests(
+            tokens_b,
+            [len_b] + [c[1] for c in checkpoints if c[1] <= len_b],
+            config,
+        )
+
+        with self._lock:
+            best_key, best_prefix, best_cells = None, (0, 0), -1
+            for key, session in self._sessions.items():
+                for (
+                    prefix_a,
+                    prefix_b,
+                    digest_a,
+                    digest_b,
+                ) in session.checkpoints:
+                    if (
+                        digests_a.get(prefix_a) == digest_a
+                        and digests_b.get(prefix_b) == digest_b
+                        and prefix_a * prefix_b > best_cells
+                    ):
+                        best_key, best_prefix = key, (prefix_a, prefix_b)
+                        best_cells = prefix_a * prefix_b
+            found = (
+                self._sessions.pop(best_key) if best_key is not None else None
+            )
+            start_a, start_b = best_prefix
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.reused_cells += (start_a + 1) * (start_b + 1)
+            self.computed_cells += (len_a + 1) * (len_b + 1) - (start_a + 1) * (
+                start_b + 1
+            )
+
+        if found is None:
+            session = _Session(np.empty((len_a + 1, len_b + 1), dtype=dtype))
+            session.matrix[0, 0] = 0
+        else:
+            session = found
+            session.checkpoints = [
+                checkpoint
+                for checkpoint in session.checkpoints
+                if checkpoint[0] <= start_a and checkpoint[1] <= start_b
+            ]
+            rows, cols = session.matrix.shape
+            if rows <= len_a or cols <= len_b:
+                matrix = np.empty(
+                    (
+                        max(len_a + 1, int(rows * _GROWTH)),
+                        max(len_b + 1, int(cols * _GROWTH)),
+                    ),
+                    dtype=dtype,
+                )
+                matrix[: start_a + 1, : start_b + 1] = session.matrix[
+                    : start_a + 1, : start_b + 1
+                ]
+                session.matrix = matrix
+        session.checkpoints.append(
+            (len_a, len_b, digests_a[len_a], digests_b[len_b])
+        )
+        return session, start_a, start_b
+
+    def _checkin(self, session: _Session):
+        """
+        Adds a session back to the cache, evicting the least recently used.
+        """
+        with self._lock:
+            self._sessions[id(session)] = session
+            while len(self._sessions) > self.max_sessions or (
+                self._sessions
+                and sum(s.matrix.size for s in self._sessions.values())
+                > self.max_cells
+            ):
+                self._sessions.popitem(last=False)
+
+    def align(
+        self,
+        tokens_a: List[str],
+        tokens_b: List[str],
+        distance_fn: Callable,
+        radius: int = -1,
+        config: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Aligns two lists of preprocessed tokens with DTW, reusing the
+        cost matrix of the longest cached prefix of both lists.
+
+        Args:
+            tokens_a (List[str]): preprocessed tokens of `a`.
+            tokens_b (List[str]): preprocessed tokens of `b`.
+            distance_fn (Callable): a distance function.
+            radius (int): radius of the band around the diagonal, -1 for no band.
+            config (Optional[str]): description of the aligner, to key the cache.
+
+        Returns:
+            np.ndarray: (n, 2) array of aligned (position_a, position_b).
+        """
+        config = config or f"{distance_fn.__qualname__}(radius={radius})"
+        # Float distances are accumulated as float32, as in `DTWAligner`
+        dtype = np.float32 if is_float_distance(distance_fn) else np.int32
+        session, start_a, start_b = self._checkout(
+            tokens_a, tokens_b, config, dtype
+        )
+        len_a, len_b = len(tokens_a), len(tokens_b)
+        # Distances of the new rows and of the new columns of the prefix rows
+        blocks = [
+            ((start_a, len_a), (0, len_b)),
+            ((0, start_a), (start_b, len_b)),
+        ]
+        distance_id = get_distance_id(distance_fn)
+        if distance_id is not None:
+            offsets_a, codepoints_a = encode_tokens(tokens_a)
+            offsets_b, codepoints_b = encode_tokens(tokens_b)
+            rows_distances, cols_distances = [
+                codepoints_distance_matrix(
+                    offsets_a,
+                    codepoints_a,
+                    rows,
+                    offsets_b,
+                    codepoints_b,
+                    cols,
+                    radius,
+                    distance_id,
+                )
+                for rows, cols in blocks
+            ]
+        else:
+            rows_distances, cols_distances = [
+                _python_distances(
+                    tokens_a, rows, tokens_b, cols, radius, distance_fn, dtype
+                )
+                for rows, cols in blocks
+            ]
+        _dtw_extend(
+            session.matrix,
+            start_a,
+            start_b,
+            len_a,
+            len_b,
+            rows_distances,
+            cols_distances,
+            radius,
+            _INF[dtype],
+        )
+        positions = _dtw_backtrace(session.matrix, len_a, len_b, _INF[dtype])
+        self._checkin(session)
+        return positions
+
+    def clear(self):
+        """
+        Removes all the sessions and resets the metrics.
+        """
+        with self._lock:
+            self._sessions.clear()
+            self.hits = self.misses = 0
+            self.reused_cells = self.computed_cells = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the metrics of the cache.
+
+        Returns:
+            Dict[str, int]: hits, misses, cells reused from cached prefixes,
+                            cells computed and number of sessions.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reused_cells": self.reused_cells,
+            "computed_cells": self.computed_cells,
+            "sessions": len(self._sessions),
+        }
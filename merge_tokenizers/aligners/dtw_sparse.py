@@ -0,0 +1,541 @@
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from numba import njit
+
+from ..utils.distances import codepoints_distance, get_distance_id
+from ..utils.encoding import encode_tokens
+
+# Allowed columns of each row, (lo, hi, row_offsets, distances), where the
+# distances of the cells lo[i]..hi[i] of row `i` start at row_offsets[i]
+Cells = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def word_ids_intervals(
+    word_ids_a: List[int], word_ids_b: List[int], radius: int
+) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Computes the columns of the DTW matrix allowed in each row, the tokens
+    of `b` from the same word as each token of `a`, widened by `radius` tokens
+    to cross mismatched word boundaries. Tokens of words missing in `b` are
+    allowed around the position of the word in `b`. The intervals are widened
+    so that a path from the first to the last cell always exists.
+
+    Args:
+        word_ids_a (List[int]): word ids of the tokens of `a`.
+        word_ids_b (List[int]): word ids of the tokens of `b`.
+        radius (int): tokens allowed across word boundaries.
+
+    Returns:
+        Optional[Tuple[np.ndarray, np.ndarray]]: first and last (inclusive) column of each
+                                                 row, or None if the word ids of `b` are
+                                                 not non-decreasing.
+    """
+    ids_a = np.asarray(word_ids_a, dtype=np.int64)
+    ids_b = np.asarray(word_ids_b, dtype=np.int64)
+    if np.any(np.diff(ids_b) < 0):
+        return None
+    len_b = len(ids_b)
+    first = np.searchsorted(ids_b, ids_a, "left")
+    last = np.searchsorted(ids_b, ids_a, "right") - 1
+    # Words missing in `b` lie between the tokens `first - 1` and `first`
+    missing = last < first
+    last[missing] = first[missing]
+    first[missing] -= 1
+    lo = np.clip(first - radius, 0, len_b - 1)
+    hi = np.clip(last + radius, 0, len_b - 1)
+
+    return _connect_intervals(lo, hi, len_b)
+
+
+def _connect_intervals(
+    lo: np.ndarray, hi: np.ndarray, len_b: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Widens the allowed columns of each row so that paths start at the
+    first cell, end at the last one, and are monotonic.
+    """
+    lo[0], hi[-1] = 0, len_b - 1
+    hi = np.maximum.accumulate(hi)
+    lo = np.minimum.accumulate(lo[::-1])[::-1].copy()
+    lo[1:] = np.minimum(lo[1:], hi[:-1] + 1)
+    return lo, hi
+
+
+def _downsample(offsets: np.ndarray) -> np.ndarray:
+    """
+    Merges each two adjacent tokens encoded with `encode_tokens`,
+    keeping every other offset over the same code points.
+    """
+    coarse = offsets[::2]
+    return (
+        coarse if coarse[-1] == offsets[-1] else np.append(coarse, offsets[-1])
+    )
+
+
+@njit(nogil=True)
+def _sort_tokens(offsets: np.ndarray, codepoints: np.ndarray) -> np.ndarray:
+    """
+    Sorts the code points of each token encoded with `encode_tokens`.
+    """
+    sorted_codepoints = codepoints.copy()
+    for i in range(len(offsets) - 1):
+        sorted_codepoints[offsets[i] : offsets[i + 1]] = np.sort(
+            codepoints[offsets[i] : offsets[i + 1]]
+        )
+    return sorted_codepoints
+
+
+@njit(nogil=True)
+def _sparse_bag_distances(
+    offsets_a: np.ndarray,
+    sorted_a: np.ndarray,
+    offsets_b: np.ndarray,
+    sorted_b: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    row_offsets: np.ndarray,
+) -> np.ndarray:
+    """
+    Computes the bag distances of the allowed cells, row by row: the
+    number of code points of the longest token not in the other token,
+    counting repetitions. It is a lower bound of levenshtein distance
+    computed in linear time from the sorted code points of each token.
+    """
+    distances = np.empty(row_offsets[-1], dtype=np.float64)
+    for i in range(len(lo)):
+        start_a, end_a = offsets_a[i], offsets_a[i + 1]
+        for j in range(lo[i], hi[i] + 1):
+            start_b, end_b = offsets_b[j], offsets_b[j + 1]
+            common, k, m = 0, start_a, start_b
+            while k < end_a and m < end_b:
+                if sorted_a[k] == sorted_b[m]:
+                    common += 1
+                    k += 1
+                    m += 1
+                elif sorted_a[k] < sorted_b[m]:
+                    k += 1
+                else:
+                    m += 1
+            distances[row_offsets[i] + j - lo[i]] = (
+                max(end_a - start_a, end_b - start_b) - common
+            )
+    return distances
+
+
+@njit(nogil=True)
+def _project_path(
+    path: np.ndarray, len_a: int, len_b: int, radius: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Projects a path of a level with tokens merged two by two to the allowed
+    columns of each row of the finer level, widened by `radius` cells.
+    """
+    projected_lo = np.full(len_a, len_b, dtype=np.int64)
+    projected_hi = np.zeros(len_a, dtype=np.int64)
+    for k in range(len(path)):
+        for i in range(2 * path[k, 0], min(2 * path[k, 0] + 2, len_a)):
+            projected_lo[i] = min(projected_lo[i], 2 * path[k, 1])
+            projected_hi[i] = max(
+                projected_hi[i], min(2 * path[k, 1] + 1, len_b - 1)
+            )
+    lo = np.empty(len_a, dtype=np.int64)
+    hi = np.empty(len_a, dtype=np.int64)
+    for i in range(len_a):
+        start, end = max(i - radius, 0), min(i + radius + 1, len_a)
+        lo[i] = max(np.min(projected_lo[start:end]) - radius, 0)
+        hi[i] = min(np.max(projected_hi[start:end]) + radius, len_b - 1)
+    return lo, hi
+
+
+def multiscale_intervals(
+    tokens_a: List[str], tokens_b: List[str], radius: int, min_size: int = 32
+) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Computes the columns of the DTW matrix allowed in each row by a
+    coarse-to-fine DTW. Adjacent tokens are merged two by two until a side
+    has at most `min_size` tokens, the coarsest level is aligned with a full
+    DTW, and the path of each level is projected to the next finer level
+    and widened by `radius` cells, where DTW is computed only in the
+    projected cells. The levels are aligned with bag distances, so
+    the cost is linear in the number of tokens and characters.
+
+    Args:
+        tokens_a (List[str]): preprocessed tokens of `a`.
+        tokens_b (List[str]): preprocessed tokens of `b`.
+        radius (int): cells around the projected paths of the coarser levels.
+        min_size (int): maximum number of tokens in a side of the coarsest level.
+
+    Returns:
+        Optional[Tuple[np.ndarray, np.ndarray]]: first and last (inclusive) column of each
+                                                 row, or None if the tokens are too few
+                                                 to be merged.
+    """
+    if min(len(tokens_a), len(tokens_b)) <= min_size:
+        return None
+    offsets_a, codepoints_a = encode_tokens(tokens_a)
+    offsets_b, codepoints_b = encode_tokens(tokens_b)
+    levels = [(offsets_a, offsets_b)]
+    while min(len(levels[-1][0]), len(levels[-1][1])) - 1 > min_size:
+        levels.append((_downsample(levels[-1][0]), _downsample(levels[-1][1])))
+
+    # Align each level in the cells around the path of the coarser level,
+    # starting with all the cells of the coarsest level
+    len_a, len_b = len(levels[-1][0]) - 1, len(levels[-1][1]) - 1
+    lo = np.zeros(len_a, dtype=np.int64)
+    hi = np.full(len_a, len_b - 1, dtype=np.int64)
+    for k in range(len(levels) - 1, 0, -1):
+        level_a, level_b = levels[k]
+        row_offsets = np.concatenate(([0], np.cumsum(hi - lo + 1)))
+        distances = _sparse_bag_distances(
+            level_a,
+            _sort_tokens(level_a, codepoints_a),
+            level_b,
+            _sort_tokens(level_b, codepoints_b),
+            lo,
+            hi,
+            row_offsets,
+        )
+        path = _sparse_dtw(lo, hi, row_offsets, distances, len_b)
+        len_a, len_b = len(levels[k - 1][0]) - 1, len(levels[k - 1][1]) - 1
+        lo, hi = _project_path(path, len_a, len_b, radius)
+        lo, hi = _connect_intervals(lo, hi, len_b)
+    return lo, hi
+
+
+@njit(nogil=True)
+def _sparse_native_distances(
+    offsets_a: np.ndarray,
+    codepoints_a: np.ndarray,
+    offsets_b: np.ndarray,
+    codepoints_b: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    row_offsets: np.ndarray,
+    known: Cells,
+    distance_id: int,
+) -> np.ndarray:
+    """
+    Computes the distances of the allowed cells, row by row,
+    copying the distances of the `known` cells.
+    """
+    known_lo, known_hi, known_row_offsets, known_distances = known
+    distances = np.empty(row_offsets[-1], dtype=np.float64)
+    max_len_b = np.max(np.diff(offsets_b)) if len(offsets_b) > 1 else 0
+    workspace = np.empty(max_len_b + 1, dtype=np.int64)
+    for i in range(len(lo)):
+        codepoints_i = codepoints_a[offsets_a[i] : offsets_a[i + 1]]
+        for j in range(lo[i], hi[i] + 1):
+            if known_lo[i] <= j <= known_hi[i]:
+                distances[row_offsets[i] + j - lo[i]] = known_distances[
+                    known_row_offsets[i] + j - known_lo[i]
+                ]
+                continue
+            distances[row_offsets[i] + j - lo[i]] = codepoints_distance(
+                codepoints_i,
+                codepoints_b[offsets_b[j] : offsets_b[j + 1]],
+                distance_id,
+                workspace,
+            )
+    return distances
+
+
+@njit(inline="always")
+def _cost(
+    costs: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    row_offsets: np.ndarray,
+    i: int,
+    j: int,
+) -> float:
+    # Cost of the token cell (i, j), where (-1, -1) is the BOS cell
+    if i < 0 or j < 0:
+        return 0.0 if i == -1 and j == -1 else np.inf
+    if i >= len(lo) or j < lo[i] or j > hi[i]:
+        return np.inf
+    return costs[row_offsets[i] + j - lo[i]]
+
+
+@njit(nogil=True)
+def _sparse_dtw(
+    lo: np.ndarray,
+    hi: np.ndarray,
+    row_offsets: np.ndarray,
+    distances: np.ndarray,
+    len_b: int,
+) -> np.ndarray:
+    """
+    Computes DTW only on the allowed cells, the rest being unreachable,
+    and backtraces the pointers with the same tie-breaking as the C
+    implementation. Returns the aligned (position_a, position_b).
+    """
+    len_a = len(lo)
+    costs = np.empty(row_offsets[-1], dtype=np.float64)
+    for i in range(len_a):
+        row = row_offsets[i] - lo[i]
+        # Costs of the previous row, where the row before the first is the BOS
+        if i > 0:
+            previous, previous_lo, previous_hi = (
+                row_offsets[i - 1] - lo[i - 1],
+                lo[i - 1],
+                hi[i - 1],
+            )
+        left = np.inf
+        for j in range(lo[i], hi[i] + 1):
+            if i == 0:
+                up = np.inf
+                diagonal = 0.0 if j == 0 else np.inf
+            else:
+                up = (
+                    costs[previous + j]
+                    if previous_lo <= j <= previous_hi
+                    else np.inf
+                )
+                diagonal = (
+                    costs[previous + j - 1]
+                    if previous_lo <= j - 1 <= previous_hi
+                    else np.inf
+                )
+            left = min(min(up, left), diagonal) + distances[row + j]
+            costs[row + j] = left
+
+    # Backtrace from the cell after the last one, in token coordinates
+    path = np.empty((len_a + len_b + 2, 2), dtype=np.int64)
+    n_elements = 0
+    i, j = len_a, len_b
+    while i >= 0 and j >= 0:
+        up = _cost(costs, lo, hi, row_offsets, i - 1, j)
+        left = _cost(costs, lo, hi, row_offsets, i, j - 1)
+        diagonal = _cost(costs, lo, hi, row_offsets, i - 1, j - 1)
+        min_ = min(up, left, diagonal)
+        if min_ == up:
+            i -= 1
+        elif min_ == left:
+            j -= 1
+        else:
+            i -= 1
+            j -= 1
+        path[n_elements, 0] = i
+        path[n_elements, 1] = j
+        n_elements += 1
+    # The last cell reached is the BOS, which is not aligned
+    return path[: n_elements - 1][::-1]
+
+
+def _no_cells(len_a: int) -> Cells:
+    """
+    Returns empty intervals for each row.
+    """
+    return (
+        np.ones(len_a, dtype=np.int64),
+        np.zeros(len_a, dtype=np.int64),
+        np.zeros(len_a + 1, dtype=np.int64),
+        np.zeros(0, dtype=np.float64),
+    )
+
+
+def sparse_distances(
+    tokens_a: List[str],
+    tokens_b: List[str],
+    lo: np.ndarray,
+    hi: np.ndarray,
+    row_offsets: np.ndarray,
+    distance_fn: Callable,
+    known: Optional[Cells] = None,
+) -> np.ndarray:
+    """
+    Computes the distances of the allowed cells of each row, stored
+    row by row. The distances of the `known` cells, from a previous call
+    with narrower intervals, are copied instead of computed again.
+
+    Args:
+        tokens_a (List[str]): preprocessed tokens of `a`.
+        tokens_b (List[str]): preprocessed tokens of `b`.
+        lo (np.ndarray): first allowed column of each row.
+        hi (np.ndarray): last allowed column (inclusive) of each row.
+        row_offsets (np.ndarray): position of the first cell of each row.
+        distance_fn (Callable): a distance function.
+        known (Optional[Cells]): intervals, row offsets and distances of a previous call.
+
+    Returns:
+        np.ndarray: distances of the allowed cells (float64).
+    """
+    known = known if known is not None else _no_cells(len(tokens_a))
+    distance_id = get_distance_id(distance_fn)
+    if distance_id is not None:
+        offsets_a, codepoints_a = encode_tokens(tokens_a)
+        offsets_b, codepoints_b = encode_tokens(tokens_b)
+        return _sparse_native_distances(
+            offsets_a,
+            codepoints_a,
+            offsets_b,
+            codepoints_b,
+            lo,
+            hi,
+            row_offsets,
+            known,
+            distance_id,
+        )
+    known_lo, known_hi, known_row_offsets, known_distances = known
+    return np.array(
+        [
+            (
+                known_distances[known_row_offsets[i] + j - known_lo[i]]
+                if known_lo[i] <= j <= known_hi[i]
+                else distance_fn(tokens_a[i], tokens_b[j])
+            )
+            for i in range(len(tokens_a))
+            for j in range(lo[i], hi[i] + 1)
+        ],
+        dtype=np.float64,
+    )
+
+
+def sparse_dtw(
+    tokens_a: List[str],
+    tokens_b: List[str],
+    lo: np.ndarray,
+    hi: np.ndarray,
+    distance_fn: Callable,
+) -> np.ndarray:
+    """
+    Aligns two lists of preprocessed tokens with DTW restricted to the
+    columns lo[i]..hi[i] of each row `i`, e.g., from `word_ids_intervals`.
+    Distances and costs are only computed for the allowed cells.
+
+    Args:
+        tokens_a (List[str]): preprocessed tokens of `a`.
+        tokens_b (List[str]): preprocessed tokens of `b`.
+        lo (np.ndarray): first allowed column of each row.
+        hi (np.ndarray): last allowed column (inclusive) of each row.
+        distance_fn (Callable): a distance function.
+
+    Returns:
+        np.ndarray: (n, 2) array of aligned (position_a, position_b).
+    """
+    row_offsets = np.concatenate(([0], np.cumsum(hi - lo + 1)))
+    distances = sparse_distances(
+        tokens_a, tokens_b, lo, hi, row_offsets, distance_fn
+    )
+    return _sparse_dtw(lo, hi, row_offsets, distances, len(tokens_b))
+
+
+def _near(rows: np.ndarray, distance: int, len_a: int) -> np.ndarray:
+    """
+    Returns the mask of the rows at most `distance` rows away from `rows`.
+    """
+    bounds = np.zeros(len_a + 1, dtype=np.int64)
+    np.add.at(bounds, np.clip(rows - distance, 0, len_a), 1)
+    np.add.at(bounds, np.clip(rows + distance + 1, 0, len_a), -1)
+    return np.cumsum(bounds[:-1]) > 0
+
+
+# Min distance of the path of `AdaptiveBandDTW` to the edges of the band
+_MIN_MARGIN = 16
+
+
+class AdaptiveBandDTW:
+    """
+    DTW in a band around the diagonal that widens where the optimal path
+    touches its edges. It starts with a band of `2 * radius` cells around
+    the diagonal, and while the path passes within max(radius, 16) cells of
+    an edge that is not the edge of the matrix, the band is widened around the
+    touching rows, doubling the widening at each retry, and the DTW is computed
+    again, reusing the distances of the cells of the previous band. The number
+    of alignments, retries and computed distances are kept as metrics.
+
+    The result is approximate, since a cheaper path that leaves the band far
+    from the path found is never explored. The min margin of 16 cells, not
+    tied to the radius, makes it match the exact DTW in practice, also at
+    small radii where a margin of `radius` cells often settles on costlier paths.
+
+    Example:
+        aligner = DTWAligner("levenshtein", adaptive_radius=8)
+        aligner.adaptive_band.stats()
+    """
+
+    def __init__(self, radius: int):
+        self.radius = radius
+        self._lock = threading.Lock()
+        self.alignments = 0
+        self.retries = 0
+        self.computed_cells = 0
+
+    def align(
+        self, tokens_a: List[str], tokens_b: List[str], distance_fn: Callable
+    ) -> np.ndarray:
+        """
+        Aligns two lists of preprocessed tokens with adaptive band DTW.
+
+        Args:
+            tokens_a (List[str]): preprocessed tokens of `a`.
+            tokens_b (List[str]): preprocessed tokens of `b`.
+            distance_fn (Callable): a distance function.
+
+        Returns:
+            np.ndarray: (n, 2) array of aligned (position_a, position_b).
+        """
+        len_a, len_b = len(tokens_a), len(tokens_b)
+        if len_a == 0 or len_b == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        diagonal = np.arange(len_a) * (len_b - 1) // max(len_a - 1, 1)
+        lo, hi = _connect_intervals(
+            np.clip(diagonal - 2 * self.radius, 0, len_b - 1),
+            np.clip(diagonal + 2 * self.radius, 0, len_b - 1),
+            len_b,
+        )
+        margin = max(self.radius, _MIN_MARGIN)
+        known, retries = None, 0
+        while True:
+            row_offsets = np.concatenate(([0], np.cumsum(hi - lo + 1)))
+            distances = sparse_distances(
+                tokens_a, tokens_b, lo, hi, row_offsets, distance_fn, known
+            )
+            path = _sparse_dtw(lo, hi, row_offsets, distances, len_b)
+            rows, cols = path[:, 0], path[:, 1]
+            # Rows where the path is within `margin` cells of the edges
+            low = rows[(cols - lo[rows] <= margin) & (lo[rows] > 0)]
+            high = rows[(hi[rows] - cols <= margin) & (hi[rows] < len_b - 1)]
+            if not len(low) and not len(high):
+                break
+            known = (lo, hi, row_offsets, distances)
+            widening = max(self.radius, 1) << retries
+            new_lo, new_hi = lo.copy(), hi.copy()
+            touched = _near(np.concatenate((low, high)), widening, len_a)
+            new_lo[touched] -= widening
+            new_hi[touched] += widening
+            lo, hi = _connect_intervals(
+                np.clip(new_lo, 0, len_b - 1),
+                np.clip(new_hi, 0, len_b - 1),
+                len_b,
+            )
+            retries += 1
+
+        with self._lock:
+            self.alignments += 1
+            self.retries += retries
+            self.computed_cells += int(row_offsets[-1])
+        return path
+
+    def clear(self):
+        """
+        Resets the metrics.
+        """
+        with self._lock:
+            self.alignments = self.retries = self.computed_cells = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the metrics of the adaptive band.
+
+        Returns:
+            Dict[str, int]: number of alignments, retries widening the band, and
+                            distances computed, counting the cells of all retries once.
+        """
+        return {
+            "alignments": self.alignments,
+            "retries": self.retries,
+            "computed_cells": self.computed_cells,
+        }
@@ -1,18 +1,55 @@
+import ctypes
+import glob
 from collections import defaultdict
-
-from fastdtw import fastdtw
-from sklearn.feature_extraction.text import CountVectorizer
+from ctypes import POINTER, c_int
+from pathlib import Path
 
 from ..types import Alignment, PositionAlignment, TokenAlignment, TokenizedPair
-from ..utils.distances import get_distance_fn
+from ..utils.encoding import encode_tokens
 from .base import Aligner
 
+# Distances between bags of characters computed by the C library.
+# Other distance names fall back to manhattan.
+VECTOR_DISTANCES = {"manhattan": 0, "euclidean": 1, "cosine": 2}
+
+
+class Tuple(ctypes.Structure):
+    _fields_ = [("first", c_int), ("second", c_int)]
+
+
+class AlignmentResult(ctypes.Structure):
+    _fields_ = [("alignment", POINTER(Tuple)), ("n_elements", c_int)]
+
 
 class FastDTWAligner(Aligner):
     def __init__(self, distance_name: str, radius: int = 1, **kwargs):
         super().__init__(**kwargs)
-        self.distance_fn = get_distance_fn(distance_name)
+        self.distance_name = distance_name
+        self.distance = VECTOR_DISTANCES.get(
+            distance_name, VECTOR_DISTANCES["manhattan"]
+        )
         self.radius = radius
+        self._build_c_lib()
+
+    def _build_c_lib(self):
+        """
+        Loads the shared library and prepares the res and arg types.
+        """
+        so_library = glob.glob(f"{Path(__file__).parent}/fast_dtw_c/*.so")[0]
+        self.c_lib = ctypes.CDLL(so_library)
+        self.c_lib.free_alignment_result.argtypes = [AlignmentResult]
+        self.c_fast_dtw = self.c_lib.fast_dtw_alignment
+        self.c_fast_dtw.restype = AlignmentResult
+        self.c_fast_dtw.argtypes = [
+            c_int,
+            POINTER(c_int),
+            POINTER(c_int),
+            c_int,
+            POINTER(c_int),
+            POINTER(c_int),
+            c_int,
+            c_int,
+        ]
 
     def _align_pair(
         self,
@@ -20,22 +57,39 @@ class FastDTWAligner(Aligner):
     ) -> Alignment:
         """
         Aligns the tokens from two different tokenizers, using
-        FastDTW and bag of characters to represent tokens.
-        """
+        a C implementation of FastDTW and bag of characters to represent tokens.
 
-        vectorizer = CountVectorizer(analyzer="char").fit(
+        The bags of characters are sparse vectors indexed by unicode
+        code points, so no vocabulary has to be fitted for each pair.
+        """
+        offsets_a, codepoints_a = encode_tokens(
             tokenized_pair.preprocessed_tokens_a
-            + tokenized_pair.preprocessed_tokens_b
         )
-        boc_tokens_a = vectorizer.transform(
-            tokenized_pair.preprocessed_tokens_a
-        ).toarray()
-        boc_tokens_b = vectorizer.transform(
+        offsets_b, codepoints_b = encode_tokens(
             tokenized_pair.preprocessed_tokens_b
-        ).toarray()
+        )
+
+        # Compute alignments using c_fast_dtw
+        alignment_result = self.c_fast_dtw(
+            len(tokenized_pair.preprocessed_tokens_a),
+            offsets_a.ctypes.data_as(POINTER(c_int)),
+            codepoints_a.ctypes.data_as(POINTER(c_int)),
+            len(tokenized_pair.preprocessed_tokens_b),
+            offsets_b.ctypes.data_as(POINTER(c_int)),
+            codepoints_b.ctypes.data_as(POINTER(c_int)),
+            self.radius,
+            self.distance,
+        )
+        alignments = [
+            (
+                alignment_result.alignment[i].first,
+                alignment_result.alignment[i].second,
+            )
+            for i in range(alignment_result.n_elements)
+        ]
 
-        # Compute alignments using fastdtw
-        _, alignments = fastdtw(boc_tokens_a, boc_tokens_b, radius=self.radius)
+        # Free memory
+        self.c_lib.free_alignment_result(alignment_result)
 
         # Merge alignments
         merged = defaultdict(list)
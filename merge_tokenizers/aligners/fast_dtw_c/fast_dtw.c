@@ -0,0 +1,334 @@
+// https://www.digitalocean.com/community/tutorials/calling-c-functions-from-python
+// cc -fPIC -shared -o merge_tokenizers/aligners/fast_dtw_c/fast_dtw.so merge_tokenizers/aligners/fast_dtw_c/fast_dtw.c -lm
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <limits.h>
+#include <stdint.h>
+
+#define DISTANCE_MANHATTAN 0
+#define DISTANCE_EUCLIDEAN 1
+#define DISTANCE_COSINE 2
+
+#define DIRECTION_UP 0
+#define DIRECTION_LEFT 1
+#define DIRECTION_DIAGONAL 2
+
+typedef struct {
+    int first;
+    int second;
+} Tuple;
+
+typedef struct {
+    Tuple* alignment;
+    int n_elements;
+} AlignmentResult;
+
+// Bag of characters of each token, as a sparse (CSR) matrix
+// of code point counts. Rows of coarser resolutions store the
+// sum of the merged rows instead of their mean: all the rows of a
+// resolution merge the same number of tokens, so the distances are
+// only scaled by a constant and the DTW paths do not change.
+typedef struct {
+    int n_rows;
+    int* indptr;
+    int* indices;
+    int* counts;
+    double* norms;
+} BagOfCharacters;
+
+static void compute_norms(BagOfCharacters* bags) {
+    for (int i = 0; i < bags->n_rows; i++) {
+        double norm = 0;
+        for (int k = bags->indptr[i]; k < bags->indptr[i + 1]; k++) {
+            norm += (double)bags->counts[k] * bags->counts[k];
+        }
+        bags->norms[i] = sqrt(norm);
+    }
+}
+
+static BagOfCharacters build_bags(int n_tokens, int* offsets, int* codepoints) {
+    BagOfCharacters bags;
+    int n_chars = offsets[n_tokens];
+    bags.n_rows = n_tokens;
+    bags.indptr = (int*)malloc((n_tokens + 1) * sizeof(int));
+    bags.indices = (int*)malloc((n_chars > 0 ? n_chars : 1) * sizeof(int));
+    bags.counts = (int*)malloc((n_chars > 0 ? n_chars : 1) * sizeof(int));
+    bags.norms = (double*)malloc((n_tokens > 0 ? n_tokens : 1) * sizeof(double));
+
+    int nnz = 0;
+    bags.indptr[0] = 0;
+    for (int i = 0; i < n_tokens; i++) {
+        // Insertion sort of the (few) code points of the token
+        int start = nnz;
+        for (int k = offsets[i]; k < offsets[i + 1]; k++) {
+            int codepoint = codepoints[k];
+            int position = nnz;
+            while (position > start && bags.indices[position - 1] > codepoint) {
+                position--;
+            }
+            if (position > start && bags.indices[position - 1] == codepoint) {
+                bags.counts[position - 1]++;
+                continue;
+            }
+            for (int l = nnz; l > position; l--) {
+                bags.indices[l] = bags.indices[l - 1];
+                bags.counts[l] = bags.counts[l - 1];
+            }
+            bags.indices[position] = codepoint;
+            bags.counts[position] = 1;
+            nnz++;
+        }
+        bags.indptr[i + 1] = nnz;
+    }
+    compute_norms(&bags);
+    return bags;
+}
+
+static BagOfCharacters reduce_by_half(BagOfCharacters* bags) {
+    // Merges each pair of consecutive rows, dropping the last one if odd
+    BagOfCharacters reduced;
+    int n_rows = bags->n_rows / 2;
+    int max_nnz = bags->indptr[2 * n_rows];
+    reduced.n_rows = n_rows;
+    reduced.indptr = (int*)malloc((n_rows + 1) * sizeof(int));
+    reduced.indices = (int*)malloc((max_nnz > 0 ? max_nnz : 1) * sizeof(int));
+    reduced.counts = (int*)malloc((max_nnz > 0 ? max_nnz : 1) * sizeof(int));
+    reduced.norms = (double*)malloc((n_rows > 0 ? n_rows : 1) * sizeof(double));
+
+    int nnz = 0;
+    reduced.indptr[0] = 0;
+    for (int i = 0; i < n_rows; i++) {
+        int k = bags->indptr[2 * i], k_end = bags->indptr[2 * i + 1];
+        int l = bags->indptr[2 * i + 1], l_end = bags->indptr[2 * i + 2];
+        while (k < k_end || l < l_end) {
+            if (l == l_end || (k < k_end && bags->indices[k] < bags->indices[l])) {
+                reduced.indices[nnz] = bags->indices[k];
+                reduced.counts[nnz] = bags->counts[k];
+                k++;
+            } else if (k == k_end || bags->indices[l] < bags->indices[k]) {
+                reduced.indices[nnz] = bags->indices[l];
+                reduced.counts[nnz] = bags->counts[l];
+                l++;
+            } else {
+                reduced.indices[nnz] = bags->indices[k];
+                reduced.counts[nnz] = bags->counts[k] + bags->counts[l];
+                k++;
+                l++;
+            }
+            nnz++;
+        }
+        reduced.indptr[i + 1] = nnz;
+    }
+    compute_norms(&reduced);
+    return reduced;
+}
+
+static void free_bags(BagOfCharacters* bags) {
+    free(bags->indptr);
+    free(bags->indices);
+    free(bags->counts);
+    free(bags->norms);
+}
+
+static double bag_distance(BagOfCharacters* x, int i, BagOfCharacters* y, int j, int distance) {
+    int k = x->indptr[i], k_end = x->indptr[i + 1];
+    int l = y->indptr[j], l_end = y->indptr[j + 1];
+    if (distance == DISTANCE_COSINE) {
+        if (x->norms[i] == 0 || y->norms[j] == 0) {
+            return x->norms[i] == y->norms[j] ? 0.0 : 1.0;
+        }
+        double dot = 0;
+        while (k < k_end && l < l_end) {
+            if (x->indices[k] < y->indices[l]) {
+                k++;
+            } else if (y->indices[l] < x->indices[k]) {
+                l++;
+            } else {
+                dot += (double)x->counts[k] * y->counts[l];
+                k++;
+                l++;
+            }
+        }
+        return 1.0 - dot / (x->norms[i] * y->norms[j]);
+    }
+
+    double accumulated = 0;
+    double difference = 0;
+    while (k < k_end || l < l_end) {
+        if (l == l_end || (k < k_end && x->indices[k] < y->indices[l])) {
+            difference = x->counts[k];
+            k++;
+        } else if (k == k_end || y->indices[l] < x->indices[k]) {
+            difference = y->counts[l];
+            l++;
+        } else {
+            difference = abs(x->counts[k] - y->counts[l]);
+            k++;
+            l++;
+        }
+        accumulated += distance == DISTANCE_EUCLIDEAN ? difference * difference : difference;
+    }
+    return distance == DISTANCE_EUCLIDEAN ? sqrt(accumulated) : accumulated;
+}
+
+static int windowed_dtw(BagOfCharacters* x, BagOfCharacters* y, int* lo, int* hi, int distance, Tuple* path) {
+    // DTW restricted to the columns [lo[i], hi[i]] of each row i.
+    // Writes the path in `path` from (0, 0) and returns its length.
+    int n = x->n_rows, m = y->n_rows;
+    long* row_offsets = (long*)malloc((n + 1) * sizeof(long));
+    row_offsets[0] = 0;
+    for (int i = 0; i < n; i++) {
+        row_offsets[i + 1] = row_offsets[i] + (hi[i] - lo[i] + 1);
+    }
+    double* costs = (double*)malloc(row_offsets[n] * sizeof(double));
+    uint8_t* directions = (uint8_t*)malloc(row_offsets[n] * sizeof(uint8_t));
+
+    for (int i = 0; i < n; i++) {
+        for (int j = lo[i]; j <= hi[i]; j++) {
+            long cell = row_offsets[i] + (j - lo[i]);
+            double dist = bag_distance(x, i, y, j, distance);
+            if (i == 0 && j == 0) {
+                costs[cell] = dist;
+                directions[cell] = DIRECTION_DIAGONAL;
+                continue;
+            }
+            // Ties are broken in the order up, left, diagonal
+            double min_ = INFINITY;
+            int direction = DIRECTION_UP;
+            if (i > 0 && j >= lo[i - 1] && j <= hi[i - 1]) {
+                min_ = costs[row_offsets[i - 1] + (j - lo[i - 1])];
+            }
+            if (j > lo[i] && costs[cell - 1] < min_) {
+                min_ = costs[cell - 1];
+                direction = DIRECTION_LEFT;
+            }
+            if (i > 0 && j - 1 >= lo[i - 1] && j - 1 <= hi[i - 1]
+                && costs[row_offsets[i - 1] + (j - 1 - lo[i - 1])] < min_) {
+                min_ = costs[row_offsets[i - 1] + (j - 1 - lo[i - 1])];
+                direction = DIRECTION_DIAGONAL;
+            }
+            costs[cell] = min_ + dist;
+            directions[cell] = direction;
+        }
+    }
+
+    // Recover pointers
+    int i = n - 1, j = m - 1;
+    int length = 0;
+    while (1) {
+        path[length].first = i;
+        path[length].second = j;
+        length++;
+        if (i == 0 && j == 0) {
+            break;
+        }
+        int direction = directions[row_offsets[i] + (j - lo[i])];
+        if (direction == DIRECTION_UP) {
+            i--;
+        } else if (direction == DIRECTION_LEFT) {
+            j--;
+        } else {
+            i--;
+            j--;
+        }
+    }
+    for (int k = 0; k < length / 2; k++) {
+        Tuple swap = path[k];
+        path[k] = path[length - 1 - k];
+        path[length - 1 - k] = swap;
+    }
+
+    free(row_offsets);
+    free(costs);
+    free(directions);
+    return length;
+}
+
+static void expand_window(Tuple* coarse_path, int coarse_length, int n_coarse_rows, int n, int m, int radius, int* lo, int* hi) {
+    // Projects a path of the coarse resolution to a window of the
+    // finer one, after widening it by `radius` coarse cells.
+    int* path_lo = (int*)malloc(n_coarse_rows * sizeof(int));
+    int* path_hi = (int*)malloc(n_coarse_rows * sizeof(int));
+    for (int k = 0; k < n_coarse_rows; k++) {
+        path_lo[k] = INT_MAX;
+        path_hi[k] = -1;
+    }
+    for (int k = 0; k < coarse_length; k++) {
+        int i = coarse_path[k].first, j = coarse_path[k].second;
+        if (j < path_lo[i]) {
+            path_lo[i] = j;
+        }
+        if (j > path_hi[i]) {
+            path_hi[i] = j;
+        }
+    }
+
+    int coarse_lo = 0, coarse_hi = 0;
+    for (int ci = 0; 2 * ci < n; ci++) {
+        // The path is monotonic, so the union of the widened cells
+        // within `radius` rows is a contiguous range of columns.
+        int first_row = ci - radius > 0 ? ci - radius : 0;
+        int last_row = ci + radius < n_coarse_rows - 1 ? ci + radius : n_coarse_rows - 1;
+        if (first_row <= last_row) {
+            coarse_lo = path_lo[first_row] - radius;
+            coarse_hi = path_hi[last_row] + radius;
+        }
+        for (int i = 2 * ci; i <= 2 * ci + 1 && i < n; i++) {
+            lo[i] = 2 * coarse_lo > 0 ? 2 * coarse_lo : 0;
+            hi[i] = 2 * coarse_hi + 1 < m - 1 ? 2 * coarse_hi + 1 : m - 1;
+        }
+    }
+    lo[0] = 0;
+    hi[n - 1] = m - 1;
+
+    free(path_lo);
+    free(path_hi);
+}
+
+static int fast_dtw(BagOfCharacters* x, BagOfCharacters* y, int radius, int distance, Tuple* path) {
+    int n = x->n_rows, m = y->n_rows;
+    int* lo = (int*)malloc(n * sizeof(int));
+    int* hi = (int*)malloc(n * sizeof(int));
+
+    if (n < radius + 2 || m < radius + 2) {
+        for (int i = 0; i < n; i++) {
+            lo[i] = 0;
+            hi[i] = m - 1;
+        }
+    } else {
+        BagOfCharacters coarse_x = reduce_by_half(x);
+        BagOfCharacters coarse_y = reduce_by_half(y);
+        Tuple* coarse_path = (Tuple*)malloc((coarse_x.n_rows + coarse_y.n_rows) * sizeof(Tuple));
+        int coarse_length = fast_dtw(&coarse_x, &coarse_y, radius, distance, coarse_path);
+        expand_window(coarse_path, coarse_length, coarse_x.n_rows, n, m, radius, lo, hi);
+        free(coarse_path);
+        free_bags(&coarse_x);
+        free_bags(&coarse_y);
+    }
+
+    int length = windowed_dtw(x, y, lo, hi, distance, path);
+    free(lo);
+    free(hi);
+    return length;
+}
+
+AlignmentResult fast_dtw_alignment(int len_a, int* offsets_a, int* codepoints_a, int len_b, int* offsets_b, int* codepoints_b, int radius, int distance) {
+    AlignmentResult result;
+    result.alignment = (Tuple*)malloc((len_a + len_b > 0 ? len_a + len_b : 1) * sizeof(Tuple));
+    result.n_elements = 0;
+    if (len_a == 0 || len_b == 0) {
+        return result;
+    }
+    BagOfCharacters bags_a = build_bags(len_a, offsets_a, codepoints_a);
+    BagOfCharacters bags_b = build_bags(len_b, offsets_b, codepoints_b);
+    result.n_elements = fast_dtw(&bags_a, &bags_b, radius > 0 ? radius : 0, distance, result.alignment);
+    free_bags(&bags_a);
+    free_bags(&bags_b);
+    return result;
+}
+
+void free_alignment_result(AlignmentResult result) {
+    free(result.alignment);
+}
@@ -1,10 +1,26 @@
 import ctypes
 import glob
-from collections import defaultdict
-from ctypes import POINTER, c_char_p, c_int
+from ctypes import POINTER, c_int
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 
-from ..types import Alignment, PositionAlignment, TokenAlignment, TokenizedPair
+import numpy as np
+
+from ..types import (
+    Alignment,
+    BatchAlignment,
+    Segmentation,
+    TokenizedPair,
+    TokenizedSet,
+)
+from ..utils.arrow import list_array_to_numpy
+from ..utils.encoding import encode_tokens
+from ..utils.heuristics import align_one_to_one
+from ..utils.preprocess import (
+    preprocess_span_tokens,
+    preprocess_text,
+    preprocess_tokens,
+)
 from .base import Aligner
 
 
@@ -32,14 +48,16 @@ class GreedyCoverageAligner(Aligner):
 
         self.c_get_spans = self.c_lib.get_spans
         self.c_merge_spans = self.c_lib.merge_spans
-        self.c_free_spans = self.c_lib.free_spans
         self.c_free_alignment = self.c_lib.free_alignment
 
-        self.c_get_spans.restype = POINTER(Tuple)
+        self.c_get_spans.restype = None
         self.c_get_spans.argtypes = [
-            POINTER(c_char_p),
-            c_char_p,
             c_int,
+            POINTER(c_int),
+            POINTER(c_int),
+            POINTER(c_int),
+            c_int,
+            POINTER(Tuple),
         ]
 
         self.c_merge_spans.restype = AlignmentResult
@@ -50,9 +68,408 @@ class GreedyCoverageAligner(Aligner):
             c_int,
         ]
 
-        self.c_free_spans.argtypes = [POINTER(Tuple)]
+        self.c_merge_spans_multi = self.c_lib.merge_spans_multi
+        self.c_merge_spans_multi.restype = c_int
+        self.c_merge_spans_multi.argtypes = [
+            POINTER(Tuple),
+            c_int,
+            c_int,
+            POINTER(Tuple),
+            POINTER(c_int),
+            POINTER(c_int),
+            POINTER(Tuple),
+            POINTER(c_int),
+        ]
+
+        self.c_merge_spans_union = self.c_lib.merge_spans_union
+        self.c_merge_spans_union.restype = c_int
+        self.c_merge_spans_union.argtypes = [
+            c_int,
+            POINTER(Tuple),
+            POINTER(c_int),
+            POINTER(c_int),
+            POINTER(Tuple),
+            POINTER(c_int),
+        ]
+
+        self.c_merge_spans_batch = self.c_lib.merge_spans_batch
+        self.c_merge_spans_batch.restype = c_int
+        self.c_merge_spans_batch.argtypes = [
+            c_int,
+            POINTER(Tuple),
+            c_int,
+            POINTER(c_int),
+            POINTER(c_int),
+            POINTER(Tuple),
+            c_int,
+            POINTER(c_int),
+            POINTER(c_int),
+            POINTER(Tuple),
+            POINTER(c_int),
+        ]
+
         self.c_free_alignment.argtypes = [AlignmentResult]
 
+    def _merge_spans_batch(
+        self,
+        spans_a: np.ndarray,
+        stride_a: int,
+        starts_a: np.ndarray,
+        lengths_a: np.ndarray,
+        spans_b: np.ndarray,
+        stride_b: int,
+        starts_b: np.ndarray,
+        lengths_b: np.ndarray,
+    ) -> BatchAlignment:
+        """
+        Merges the spans of each row of a batch with a single call to
+        the C library. The spans of the row r are the `lengths_a[r]` spans
+        starting at `r * stride_a + starts_a[r]` in `spans_a` (resp. `b`).
+        The positions of the alignments are relative to the start of each row.
+        """
+        spans_a = np.ascontiguousarray(spans_a, dtype=np.int32)
+        spans_b = np.ascontiguousarray(spans_b, dtype=np.int32)
+        starts_a = np.ascontiguousarray(starts_a, dtype=np.int32)
+        starts_b = np.ascontiguousarray(starts_b, dtype=np.int32)
+        lengths_a = np.ascontiguousarray(lengths_a, dtype=np.int32)
+        lengths_b = np.ascontiguousarray(lengths_b, dtype=np.int32)
+        alignments = np.empty(
+            (int(lengths_a.sum()) + int(lengths_b.sum()), 2), dtype=np.int32
+        )
+        offsets = np.empty(len(lengths_a) + 1, dtype=np.int32)
+        n_elements = self.c_merge_spans_batch(
+            len(lengths_a),
+            spans_a.ctypes.data_as(POINTER(Tuple)),
+            stride_a,
+            starts_a.ctypes.data_as(POINTER(c_int)),
+            lengths_a.ctypes.data_as(POINTER(c_int)),
+            spans_b.ctypes.data_as(POINTER(Tuple)),
+            stride_b,
+            starts_b.ctypes.data_as(POINTER(c_int)),
+            lengths_b.ctypes.data_as(POINTER(c_int)),
+            alignments.ctypes.data_as(POINTER(Tuple)),
+            offsets.ctypes.data_as(POINTER(c_int)),
+        )
+        return BatchAlignment(
+            positions_a=alignments[:n_elements, 0],
+            positions_b=alignments[:n_elements, 1],
+            offsets=offsets,
+        )
+
+    def align_offset_mapping(
+        self,
+        offset_mapping_a: np.ndarray,
+        offset_mapping_b: np.ndarray,
+        attention_mask_a: Optional[np.ndarray] = None,
+        attention_mask_b: Optional[np.ndarray] = None,
+    ) -> BatchAlignment:
+        """
+        Aligns a batch of padded `offset_mapping`, as given by the batch
+        encodings of HuggingFace fast tokenizers, with a single C call.
+
+        The non-padding tokens of each row must be contiguous (right or
+        left padding). The positions of the alignments are the columns
+        of the tokens in the padded arrays.
+
+        Args:
+            offset_mapping_a (np.ndarray): (batch, seq_a, 2) spans of the reference texts.
+            offset_mapping_b (np.ndarray): (batch, seq_b, 2) spans of the texts to be aligned.
+            attention_mask_a (Optional[np.ndarray]): (batch, seq_a) mask of the non-padding tokens.
+            attention_mask_b (Optional[np.ndarray]): (batch, seq_b) mask of the non-padding tokens.
+
+        Returns:
+            BatchAlignment: array-backed alignments of the batch.
+        """
+        assert len(offset_mapping_a) == len(
+            offset_mapping_b
+        ), "Both batches of `offset_mapping` must have the same size."
+
+        starts, lengths = [], []
+        for offset_mapping, attention_mask in [
+            (offset_mapping_a, attention_mask_a),
+            (offset_mapping_b, attention_mask_b),
+        ]:
+            if attention_mask is None:
+                lengths.append(
+                    np.full(len(offset_mapping), offset_mapping.shape[1])
+                )
+                starts.append(np.zeros(len(offset_mapping), dtype=np.int64))
+            else:
+                mask = np.asarray(attention_mask).astype(bool)
+                lengths.append(mask.sum(axis=1))
+                starts.append(np.argmax(mask, axis=1))
+
+        alignment = self._merge_spans_batch(
+            offset_mapping_a,
+            offset_mapping_a.shape[1],
+            starts[0],
+            lengths[0],
+            offset_mapping_b,
+            offset_mapping_b.shape[1],
+            starts[1],
+            lengths[1],
+        )
+
+        # Map the positions in each text to columns of the padded arrays
+        rows = np.repeat(np.arange(len(lengths[0])), np.diff(alignment.offsets))
+        for positions, row_starts in [
+            (alignment.positions_a, starts[0]),
+            (alignment.positions_b, starts[1]),
+        ]:
+            positions += np.where(positions >= 0, row_starts[rows], 0).astype(
+                positions.dtype
+            )
+        return alignment
+
+    def _align_record_batch(
+        self, batch: Any, columns: Dict[str, str]
+    ) -> BatchAlignment:
+        """
+        Merges the `spans` columns of an Arrow record batch with a single C call,
+        reading the spans from the Arrow buffers. The spans of each row
+        must be a list of (start, end) pairs, where null numbers are taken as
+        -1. Batches that can't be aligned this way (no `spans` columns, null
+        spans, special tokens to pin or a cache) are aligned as `TokenizedPair`.
+        """
+        if (
+            "spans_a" in columns
+            and "spans_b" in columns
+            and not self._special_tokens
+            and self.cache is None
+        ):
+            spans = [
+                list_array_to_numpy(batch.column(columns[field]), fill_value=-1)
+                for field in ["spans_a", "spans_b"]
+            ]
+            if all(len(values) == 2 * offsets[-1] for offsets, values in spans):
+                (offsets_a, spans_a), (offsets_b, spans_b) = spans
+                return self._merge_spans_batch(
+                    spans_a.reshape(-1, 2),
+                    0,
+                    offsets_a[:-1],
+                    np.diff(offsets_a),
+                    spans_b.reshape(-1, 2),
+                    0,
+                    offsets_b[:-1],
+                    np.diff(offsets_b),
+                )
+        return super()._align_record_batch(batch, columns)
+
+    def _encode_text(self, text: str) -> np.ndarray:
+        """
+        Preprocess a text as the tokens, removes its whitespaces,
+        and encodes it as code points to compute the spans of the tokens.
+        """
+        assert (
+            text
+        ), "`text` must be passed as argument when not passing `span_a` and `span_b`"
+        return encode_tokens([preprocess_text(text)])[1]
+
+    def _compute_spans(self, tokens: List[str], text: np.ndarray) -> np.ndarray:
+        """
+        Computes the (n, 2) array of spans that the tokens cover
+        in a text encoded with `_encode_text`, with the C library.
+        """
+        offsets, codepoints = encode_tokens(preprocess_span_tokens(tokens))
+        spans = np.empty((len(tokens), 2), dtype=np.int32)
+        self.c_get_spans(
+            len(tokens),
+            offsets.ctypes.data_as(POINTER(c_int)),
+            codepoints.ctypes.data_as(POINTER(c_int)),
+            text.ctypes.data_as(POINTER(c_int)),
+            len(text),
+            spans.ctypes.data_as(POINTER(Tuple)),
+        )
+        return spans
+
+    def _get_spans(self, tokenized_pair: TokenizedPair) -> List[np.ndarray]:
+        """
+        Returns the (n, 2) arrays of spans of both tokenizations,
+        computing them from the text if they are not passed.
+        """
+        if tokenized_pair.spans_a or tokenized_pair.spans_b:
+            return [
+                np.array(spans, dtype=np.int32).reshape(-1, 2)
+                for spans in [tokenized_pair.spans_a, tokenized_pair.spans_b]
+            ]
+
+        text = self._encode_text(tokenized_pair.text)
+        return [
+            self._compute_spans(tokens, text)
+            for tokens in [tokenized_pair.tokens_a, tokenized_pair.tokens_b]
+        ]
+
+    def _merge_spans_multi(
+        self, spans_a: np.ndarray, spans_b: List[np.ndarray]
+    ) -> BatchAlignment:
+        """
+        Merges the spans of several targets against the same
+        reference spans with a single pass of the C library.
+        Each row of the result is the alignment of one target.
+        """
+        spans_a = np.ascontiguousarray(spans_a, dtype=np.int32)
+        lengths_b = np.array([len(spans) for spans in spans_b], dtype=np.int32)
+        starts_b = np.concatenate(([0], np.cumsum(lengths_b)[:-1])).astype(
+            np.int32
+        )
+        concatenated_b = np.ascontiguousarray(
+            np.concatenate(
+                [np.reshape(spans, (-1, 2)) for spans in spans_b]
+                or [np.zeros((0, 2))]
+            ),
+            dtype=np.int32,
+        )
+        alignments = np.empty(
+            (len(spans_b) * len(spans_a) + int(lengths_b.sum()), 2),
+            dtype=np.int32,
+        )
+        offsets = np.empty(len(spans_b) + 1, dtype=np.int32)
+        n_elements = self.c_merge_spans_multi(
+            spans_a.ctypes.data_as(POINTER(Tuple)),
+            len(spans_a),
+            len(spans_b),
+            concatenated_b.ctypes.data_as(POINTER(Tuple)),
+            starts_b.ctypes.data_as(POINTER(c_int)),
+            lengths_b.ctypes.data_as(POINTER(c_int)),
+            alignments.ctypes.data_as(POINTER(Tuple)),
+            offsets.ctypes.data_as(POINTER(c_int)),
+        )
+        return BatchAlignment(
+            positions_a=alignments[:n_elements, 0],
+            positions_b=alignments[:n_elements, 1],
+            offsets=offsets,
+        )
+
+    def align(self, tokenized_set: TokenizedSet) -> List[Alignment]:
+        """
+        Aligns the tokens from multiple tokenizers, picking the first
+        tokenizer as reference and align the other ones with it.
+
+        The text and the reference are preprocessed once for the whole set,
+        and the spans of all the other tokenizers are merged against the
+        spans of the reference in a single pass. With a cache or special
+        tokens to pin, the pairs are aligned with `align_pairs` instead.
+
+        Args:
+            tokenized_set (TokenizedSet): multiple tokenized texts.
+
+        Returns:
+            List[Alignment]: positions and tokens of each alignment.
+        """
+        if self.cache is not None or self._special_tokens:
+            return super().align(tokenized_set)
+        tokens_a, targets = tokenized_set.tokens[0], tokenized_set.tokens[1:]
+        alignments: List[Optional[Alignment]] = [None] * len(targets)
+
+        # If both tokenizations are the same, return 1-1 alignment
+        preprocessed_a = preprocess_tokens(tokens_a)
+        pending = []
+        for idx, tokens_b in enumerate(targets):
+            if preprocess_tokens(tokens_b) == preprocessed_a:
+                alignments[idx] = align_one_to_one(
+                    TokenizedPair.trusted(tokens_a=tokens_a, tokens_b=tokens_b)
+                )
+            else:
+                pending.append(idx)
+        if not pending:
+            return alignments  # type: ignore
+
+        if tokenized_set.spans:
+            spans_a = np.array(tokenized_set.spans[0], dtype=np.int32)
+            spans_b = [tokenized_set.spans[idx + 1] for idx in pending]
+        else:
+            text = self._encode_text(tokenized_set.text)
+            spans_a = self._compute_spans(tokens_a, text)
+            spans_b = [
+                self._compute_spans(targets[idx], text) for idx in pending
+            ]
+
+        for idx, alignment in zip(
+            pending,
+            self._merge_spans_multi(
+                spans_a.reshape(-1, 2), spans_b
+            ).to_alignments(
+                [tokens_a] * len(pending), [targets[idx] for idx in pending]
+            ),
+        ):
+            alignments[idx] = alignment
+        return alignments  # type: ignore
+
+    def segment(self, tokenized_set: TokenizedSet) -> Segmentation:
+        """
+        Computes the common segmentation of all the tokenizers of a
+        `TokenizedSet`, where each segment is the union of the spans of
+        the tokens that overlap, and the segment of each token.
+        All the tokenizations are merged in a single pass of the C library.
+
+        Args:
+            tokenized_set (TokenizedSet): multiple tokenized texts.
+
+        Returns:
+            Segmentation: segments and segment of each token.
+        """
+        if tokenized_set.spans:
+            spans = [
+                np.array(token_spans, dtype=np.int32).reshape(-1, 2)
+                for token_spans in tokenized_set.spans
+            ]
+        else:
+            text = self._encode_text(tokenized_set.text)
+            spans = [
+                self._compute_spans(tokens, text)
+                for tokens in tokenized_set.tokens
+            ]
+        lengths = np.array([len(s) for s in spans], dtype=np.int32)
+        starts = np.concatenate(([0], np.cumsum(lengths))).astype(np.int32)
+        concatenated = np.ascontiguousarray(
+            np.concatenate(spans or [np.zeros((0, 2))]), dtype=np.int32
+        )
+        segments = np.empty((len(concatenated), 2), dtype=np.int32)
+        token_segments = np.empty(len(concatenated), dtype=np.int32)
+        n_segments = self.c_merge_spans_union(
+            len(spans),
+            concatenated.ctypes.data_as(POINTER(Tuple)),
+            starts.ctypes.data_as(POINTER(c_int)),
+            lengths.ctypes.data_as(POINTER(c_int)),
+            segments.ctypes.data_as(POINTER(Tuple)),
+            token_segments.ctypes.data_as(POINTER(c_int)),
+        )
+        return Segmentation(
+            segments=segments[:n_segments],
+            token_segments=np.split(token_segments, starts[1:-1]),
+        )
+
+    def _align_pairs(
+        self, tokenized_pairs: List[TokenizedPair]
+    ) -> List[Alignment]:
+        """
+        Aligns a batch of tokenized pairs, merging the
+        spans of all the pairs with a single C call.
+        """
+        if not tokenized_pairs:
+            return []
+        spans_a, spans_b = zip(
+            *[
+                self._get_spans(tokenized_pair)
+                for tokenized_pair in tokenized_pairs
+            ]
+        )
+        lengths_a = np.array([len(spans) for spans in spans_a])
+        lengths_b = np.array([len(spans) for spans in spans_b])
+        return self._merge_spans_batch(
+            np.concatenate(spans_a),
+            0,
+            np.concatenate(([0], np.cumsum(lengths_a)[:-1])),
+            lengths_a,
+            np.concatenate(spans_b),
+            0,
+            np.concatenate(([0], np.cumsum(lengths_b)[:-1])),
+            lengths_b,
+        ).to_alignments(
+            [tokenized_pair.tokens_a for tokenized_pair in tokenized_pairs],
+            [tokenized_pair.tokens_b for tokenized_pair in tokenized_pairs],
+        )
+
     def _align_pair(
         self,
         tokenized_pair: TokenizedPair,
@@ -61,9 +478,10 @@ class GreedyCoverageAligner(Aligner):
         Aligns the tokens from two different tokenizers, using
         a greedy matching algorithm based on text coverage.
 
-        The procedure remove whitespaces from the text, and
-        finds the positions (start, end) that each token covers
-        in the text without whitespaces. Once we have the lists of (start, end)
+        The procedure normalizes the text as the tokens, removes its whitespaces,
+        and finds the positions [start, end) in code points that each token
+        covers in the text without whitespaces, ignoring the markers of subword
+        tokenizers (`Ġ`, `▁`, `##`). Once we have the lists of [start, end)
         for each token and for each tokenization, we merge the tokens of the
         second tokenization that are spanned by the tokens of the first tokenization.
 
@@ -73,65 +491,4 @@ class GreedyCoverageAligner(Aligner):
 
         will result in [(0, [0]), (1, [1, 2, 3]), (2, [4, 5, 6])]
         """
-
-        # Get the span covered by each token
-        spans = {}
-        # If the spans covering the text are not passed, compute them.
-        if not tokenized_pair.spans_a and not tokenized_pair.spans_b:
-            text = tokenized_pair.text.lower().replace(" ", "").encode("utf-8")
-            for tokenization, preprocessed_tokens in {
-                "a": tokenized_pair.preprocessed_tokens_a,
-                "b": tokenized_pair.preprocessed_tokens_b,
-            }.items():
-                ptr = (ctypes.c_char_p * len(preprocessed_tokens))(
-                    *[token.encode("utf-8") for token in preprocessed_tokens]
-                )
-                c_spans = self.c_get_spans(
-                    ptr,
-                    text,
-                    len(preprocessed_tokens),
-                )
-                spans[tokenization] = [
-                    (c_spans[i].start, c_spans[i].end)
-                    for i in range(len(preprocessed_tokens))
-                ]
-                self.c_free_spans(c_spans)
-        # Otherwise, use them
-        else:
-            spans["a"] = tokenized_pair.spans_a
-            spans["b"] = tokenized_pair.spans_b
-
-        # Merge the spans
-        c_spans_a = (Tuple * len(spans["a"]))(*spans["a"])  # type: ignore
-        c_spans_b = (Tuple * len(spans["b"]))(*spans["b"])  # type: ignore
-        c_alignments = self.c_merge_spans(
-            c_spans_a, c_spans_b, len(spans["a"]), len(spans["b"])
-        )
-        alignments = [
-            (c_alignments.alignment[i].start, c_alignments.alignment[i].end)
-            for i in range(c_alignments.n_elements)
-        ]
-        self.c_free_alignment(c_alignments)
-
-        # Merge alignments
-        merged = defaultdict(list)
-        for position_a, position_b in alignments:
-            merged[position_a].append(position_b)
-
-        # Convert to alignment types
-        position_alignments = [
-            PositionAlignment(position_a=position_a, positions_b=positions_b)
-            for position_a, positions_b in merged.items()
-        ]
-        token_alignments = [
-            TokenAlignment(
-                token_a=tokenized_pair.tokens_a[position_a],
-                tokens_b=[
-                    tokenized_pair.tokens_b[position_b]
-                    for position_b in positions_b
-                ],
-            )
-            for position_a, positions_b in merged.items()
-        ]
-
-        return Alignment(positions=position_alignments, tokens=token_alignments)
+        return self._align_pairs([tokenized_pair])[0]
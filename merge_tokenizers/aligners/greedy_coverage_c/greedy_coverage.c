@@ -15,32 +15,34 @@ typedef struct {
     int n_elements;
 } AlignmentResult;
 
-Tuple* get_spans(char** tokens, char* text, int tokens_count) {
-    Tuple* spans = (Tuple*)malloc(tokens_count * sizeof(Tuple));
+void get_spans(int tokens_count, int* token_offsets, int* tokens, int* text, int text_length, Tuple* spans) {
+    // Finds the span [start, end) that each token covers in the text. Tokens
+    // and text are given as unicode code points, the tokens concatenated in one
+    // buffer with the k-th token in token_offsets[k]:token_offsets[k + 1].
+    // The position in the text only moves forward, so the cost is linear.
     int j = 0;
-    for (int k = 0; k < tokens_count; k++) {
-        char* token = tokens[k];
-        int i = 0;
+    int k = 0;
+    for (; k < tokens_count; k++) {
         int start_pos = -1;
         int end_pos = -1;
         int matches = 0;
-        while (token[i] != '\0') {
-            if (token[i] == text[j + matches]) {
+        for (int i = token_offsets[k]; i < token_offsets[k + 1] && j + matches < text_length; i++) {
+            if (tokens[i] == text[j + matches]) {
                 if (start_pos == -1) {
                     start_pos = j + matches;
                 }
-                end_pos = j + matches;
+                end_pos = j + matches + 1;
                 matches++;
             }
-            i++;
         }
         if (end_pos != -1) {
-            j = end_pos + 1;
+            j = end_pos;
         }
         if (start_pos != -1 && end_pos != -1) {
             spans[k].start = start_pos;
             spans[k].end = end_pos;
-            if (j >= strlen(text)) {
+            if (j >= text_length) {
+                k++;
                 break;
             }
         } else {
@@ -48,11 +50,14 @@ Tuple* get_spans(char** tokens, char* text, int tokens_count) {
             spans[k].end = -1;
         }
     }
-    return spans;
+    // Add missing last spans in case of </s>
+    for (; k < tokens_count; k++) {
+        spans[k].start = -1;
+        spans[k].end = -1;
+    }
 }
 
-AlignmentResult merge_spans(Tuple* spans_a, Tuple* spans_b, int spans_a_count, int spans_b_count) {
-    Tuple* alignments = (Tuple*)malloc((spans_a_count + spans_b_count) * sizeof(Tuple));
+static int merge_spans_into(Tuple* spans_a, Tuple* spans_b, int spans_a_count, int spans_b_count, Tuple* alignments) {
     int i = 0, j = 0, alignment_index = 0;
     while (i < spans_a_count && j < spans_b_count) {
         int a_start = spans_a[i].start;
@@ -89,15 +94,179 @@ AlignmentResult merge_spans(Tuple* spans_a, Tuple* spans_b, int spans_a_count, i
         alignment_index++;
         j++;
     }
+    return alignment_index;
+}
 
+AlignmentResult merge_spans(Tuple* spans_a, Tuple* spans_b, int spans_a_count, int spans_b_count) {
+    Tuple* alignments = (Tuple*)malloc((spans_a_count + spans_b_count) * sizeof(Tuple));
     AlignmentResult result;
     result.alignment = alignments;
-    result.n_elements = alignment_index;
+    result.n_elements = merge_spans_into(spans_a, spans_b, spans_a_count, spans_b_count, alignments);
     return result;
 }
 
-void free_spans(Tuple* tuple_list) {
-    free(tuple_list);
+int merge_spans_batch(int n_rows,
+                      Tuple* spans_a, int stride_a, int* starts_a, int* lengths_a,
+                      Tuple* spans_b, int stride_b, int* starts_b, int* lengths_b,
+                      Tuple* alignments, int* offsets) {
+    // Merges the spans of each row of a batch. The spans of the row r start at
+    // spans_a[r * stride_a + starts_a[r]] (resp. `b`), so padded arrays use
+    // the sequence length as stride, and concatenated rows use a stride of 0.
+    // `alignments` must fit the sum of lengths_a[r] + lengths_b[r], and the
+    // alignments of the row r are written in offsets[r]:offsets[r + 1].
+    offsets[0] = 0;
+    for (int r = 0; r < n_rows; r++) {
+        offsets[r + 1] = offsets[r] + merge_spans_into(
+            spans_a + (long)r * stride_a + starts_a[r],
+            spans_b + (long)r * stride_b + starts_b[r],
+            lengths_a[r],
+            lengths_b[r],
+            alignments + offsets[r]
+        );
+    }
+    return offsets[n_rows];
+}
+
+int merge_spans_multi(Tuple* spans_a, int spans_a_count, int n_targets,
+                      Tuple* spans_b, int* starts_b, int* lengths_b,
+                      Tuple* alignments, int* offsets) {
+    // Merges the spans of several targets against the same reference spans
+    // in a single pass over the reference, keeping one cursor per target.
+    // Produces the same alignments as `merge_spans` for each target, with
+    // the alignments of the target t written in offsets[t]:offsets[t + 1].
+    // `alignments` must fit n_targets * spans_a_count + sum(lengths_b).
+    int* cursors = (int*)calloc(n_targets > 0 ? n_targets : 1, sizeof(int));
+    int* counts = (int*)calloc(n_targets > 0 ? n_targets : 1, sizeof(int));
+    offsets[0] = 0;
+    for (int t = 0; t < n_targets; t++) {
+        offsets[t + 1] = offsets[t] + spans_a_count + lengths_b[t];
+    }
+
+    for (int i = 0; i < spans_a_count; i++) {
+        int a_end = spans_a[i].end;
+        for (int t = 0; t < n_targets; t++) {
+            Tuple* target = spans_b + starts_b[t];
+            Tuple* out = alignments + offsets[t];
+            int j = cursors[t];
+            if (j >= lengths_b[t]) {
+                // All the target tokens consumed, align with the last one
+                out[counts[t]].start = i;
+                out[counts[t]].end = j - 1;
+                counts[t]++;
+                continue;
+            }
+            // Consume the target tokens that end before the reference token
+            while (j < lengths_b[t]) {
+                int b_end = target[j].end;
+                out[counts[t]].start = i;
+                out[counts[t]].end = j;
+                counts[t]++;
+                if (a_end > b_end) {
+                    j++;
+                } else {
+                    if (a_end == b_end) {
+                        j++;
+                    }
+                    break;
+                }
+            }
+            if (j >= lengths_b[t] && a_end > target[j - 1].end) {
+                // Consumed all the target tokens inside the reference token,
+                // which is aligned again with the last one, as in `merge_spans`
+                out[counts[t]].start = i;
+                out[counts[t]].end = j - 1;
+                counts[t]++;
+            }
+            cursors[t] = j;
+        }
+    }
+
+    // Remaining target tokens are aligned with the last reference token,
+    // and the alignments of all the targets are made contiguous.
+    int n_elements = 0;
+    for (int t = 0; t < n_targets; t++) {
+        Tuple* out = alignments + offsets[t];
+        for (int j = cursors[t]; j < lengths_b[t]; j++) {
+            out[counts[t]].start = spans_a_count - 1;
+            out[counts[t]].end = j;
+            counts[t]++;
+        }
+        memmove(alignments + n_elements, out, counts[t] * sizeof(Tuple));
+        offsets[t] = n_elements;
+        n_elements += counts[t];
+    }
+    offsets[n_targets] = n_elements;
+
+    free(cursors);
+    free(counts);
+    return n_elements;
+}
+
+int merge_spans_union(int n_tokenizations, Tuple* spans, int* starts, int* lengths,
+                      Tuple* segments, int* token_segments) {
+    // Computes the common segmentation of several tokenizations of the same
+    // text in a single pass, where each segment is the union of the spans of
+    // the tokens that overlap. The spans of the t-th tokenization are in
+    // spans[starts[t]:starts[t] + lengths[t]], and the segment of each token
+    // is written in `token_segments`, with the same layout as `spans`.
+    // Tokens without span, (-1, -1), join the segment being built, or the last
+    // segment at the end of the text. Returns the number of segments.
+    int* cursors = (int*)calloc(n_tokenizations > 0 ? n_tokenizations : 1, sizeof(int));
+    int n_segments = 0;
+    while (1) {
+        // The next segment starts with the first token not consumed yet
+        int segment_start = -1;
+        int segment_end = -1;
+        for (int t = 0; t < n_tokenizations; t++) {
+            Tuple* current = spans + starts[t];
+            while (cursors[t] < lengths[t] && current[cursors[t]].start < 0) {
+                token_segments[starts[t] + cursors[t]] = n_segments;
+                cursors[t]++;
+            }
+            if (cursors[t] < lengths[t] &&
+                (segment_start == -1 || current[cursors[t]].start < segment_start)) {
+                segment_start = current[cursors[t]].start;
+                segment_end = current[cursors[t]].end;
+            }
+        }
+        if (segment_start == -1) {
+            break;
+        }
+
+        // Extend the segment with the overlapping tokens until no token overlaps
+        int changed = 1;
+        while (changed) {
+            changed = 0;
+            for (int t = 0; t < n_tokenizations; t++) {
+                Tuple* current = spans + starts[t];
+                while (cursors[t] < lengths[t]) {
+                    Tuple token = current[cursors[t]];
+                    if (token.start >= 0 && token.start >= segment_end && token.start > segment_start) {
+                        break;
+                    }
+                    token_segments[starts[t] + cursors[t]] = n_segments;
+                    if (token.end > segment_end) {
+                        segment_end = token.end;
+                    }
+                    cursors[t]++;
+                    changed = 1;
+                }
+            }
+        }
+        segments[n_segments].start = segment_start;
+        segments[n_segments].end = segment_end;
+        n_segments++;
+    }
+
+    // Tokens without span at the end of the text join the last segment
+    for (int t = 0; t < n_tokenizations; t++) {
+        for (int j = lengths[t] - 1; j >= 0 && token_segments[starts[t] + j] == n_segments; j--) {
+            token_segments[starts[t] + j] = n_segments - 1;
+        }
+    }
+
+    free(cursors);
+    return n_segments;
 }
 
 void free_alignment(AlignmentResult result) {
@@ -1,14 +1,24 @@
 from collections import defaultdict
 from typing import List, Tuple
 
-from ..types import Alignment, PositionAlignment, TokenAlignment, TokenizedPair
+import numpy as np
+
+from ..types import (
+    Alignment,
+    PositionAlignment,
+    Segmentation,
+    TokenAlignment,
+    TokenizedPair,
+    TokenizedSet,
+)
+from ..utils.preprocess import preprocess_span_tokens, preprocess_text
 from .base import Aligner
 
 
 def get_spans(tokens: List[str], text: str) -> List[Tuple[int, int]]:
     """
     Finds the positions (start, end) that each token in
-    `tokens` covers in the text.
+    `tokens` covers in the text, in code points.
 
     Args:
         tokens (List[str]): list of tokens
@@ -23,6 +33,8 @@ def get_spans(tokens: List[str], text: str) -> List[Tuple[int, int]]:
         end_pos = None
         matches = 0
         for i in range(len(token)):
+            if j + matches >= len(text):
+                break
             if token[i] == text[j + matches]:
                 if start_pos is None:
                     start_pos = matches + j
@@ -93,10 +105,109 @@ def merge_spans(
     return alignments
 
 
+def merge_spans_union(
+    spans: List[List[Tuple[int, int]]],
+) -> Tuple[List[Tuple[int, int]], List[List[int]]]:
+    """
+    Computes the common segmentation of several tokenizations of the same
+    text in a single pass, where each segment is the union of the spans
+    of the tokens that overlap. Tokens without span, (-1, -1), join the
+    segment being built, or the last segment at the end of the text.
+
+    Example:
+        spans = [[(0, 5), (5, 13)], [(0, 4), (4, 8), (8, 13)]]
+        result = ([(0, 8), (8, 13)], [[0, 1], [0, 0, 1]])
+
+    Args:
+        spans (List[List[Tuple[int, int]]]): (start, end) positions of the tokens in each tokenization
+
+    Returns:
+        Tuple[List[Tuple[int, int]], List[List[int]]]: (start, end) positions of each segment,
+                                                       and segment of each token of each tokenization.
+    """
+    segments: List[Tuple[int, int]] = []
+    token_segments: List[List[int]] = [[] for _ in spans]
+    cursors = [0] * len(spans)
+    while True:
+        # The next segment starts with the first token not consumed yet
+        segment_start, segment_end = -1, -1
+        for t, tokenization in enumerate(spans):
+            while (
+                cursors[t] < len(tokenization)
+                and tokenization[cursors[t]][0] < 0
+            ):
+                token_segments[t].append(len(segments))
+                cursors[t] += 1
+            if cursors[t] < len(tokenization) and (
+                segment_start == -1
+                or tokenization[cursors[t]][0] < segment_start
+            ):
+                segment_start, segment_end = tokenization[cursors[t]]
+        if segment_start == -1:
+            break
+
+        # Extend the segment with the overlapping tokens until no token overlaps
+        changed = True
+        while changed:
+            changed = False
+            for t, tokenization in enumerate(spans):
+                while cursors[t] < len(tokenization):
+                    start, end = tokenization[cursors[t]]
+                    if (
+                        start >= 0
+                        and start >= segment_end
+                        and start > segment_start
+                    ):
+                        break
+                    token_segments[t].append(len(segments))
+                    segment_end = max(segment_end, end)
+                    cursors[t] += 1
+                    changed = True
+        segments.append((segment_start, segment_end))
+
+    # Tokens without span at the end of the text join the last segment
+    token_segments = [
+        [min(segment, len(segments) - 1) for segment in tokenization]
+        for tokenization in token_segments
+    ]
+    return segments, token_segments
+
+
 class PythonGreedyCoverageAligner(Aligner):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
+    def segment(self, tokenized_set: TokenizedSet) -> Segmentation:
+        """
+        Computes the common segmentation of all the tokenizers of a
+        `TokenizedSet`, and the segment of each token, in a single pass.
+
+        Args:
+            tokenized_set (TokenizedSet): multiple tokenized texts.
+
+        Returns:
+            Segmentation: segments and segment of each token.
+        """
+        if tokenized_set.spans:
+            spans = tokenized_set.spans
+        else:
+            assert (
+                tokenized_set.text
+            ), "`text` must be passed as argument when not passing `spans`"
+            text = preprocess_text(tokenized_set.text)
+            spans = [
+                get_spans(preprocess_span_tokens(tokens), text)
+                for tokens in tokenized_set.tokens
+            ]
+        segments, token_segments = merge_spans_union(spans)
+        return Segmentation(
+            segments=np.array(segments, dtype=np.int32).reshape(-1, 2),
+            token_segments=[
+                np.array(segments, dtype=np.int32)
+                for segments in token_segments
+            ],
+        )
+
     def _align_pair(
         self,
         tokenized_pair: TokenizedPair,
@@ -124,9 +235,13 @@ class PythonGreedyCoverageAligner(Aligner):
             assert (
                 tokenized_pair.text
             ), "`text` must be passed as argument when not passing `span_a` and `span_b`"
-            text = tokenized_pair.text.lower().replace(" ", "")
-            spans_a = get_spans(tokenized_pair.preprocessed_tokens_a, text)
-            spans_b = get_spans(tokenized_pair.preprocessed_tokens_b, text)
+            text = preprocess_text(tokenized_pair.text)
+            spans_a = get_spans(
+                preprocess_span_tokens(tokenized_pair.tokens_a), text
+            )
+            spans_b = get_spans(
+                preprocess_span_tokens(tokenized_pair.tokens_b), text
+            )
         # Otherwise, use them.
         else:
             spans_a = tokenized_pair.spans_a
@@ -1,14 +1,278 @@
+from typing import List, Tuple
+
+import numpy as np
+from numba import njit
+
 from ..types import Alignment, PositionAlignment, TokenAlignment, TokenizedPair
-from ..utils.distances import get_distance_fn
+from ..utils.distances import (
+    codepoints_distance,
+    get_distance_fn,
+    get_distance_id,
+)
+from ..utils.encoding import encode_tokens
 from .base import Aligner
 
+# Code point used to pad the tokens before extracting n-grams
+_NGRAM_PAD = 0x110000
+
+
+@njit(nogil=True)
+def _ngrams(
+    offsets: np.ndarray, codepoints: np.ndarray, ngram_size: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Extracts the character n-grams of each token, padded with
+    `ngram_size - 1` pad code points at both sides. Each n-gram is
+    packed in an int64 key (21 bits per code point).
+    """
+    n_tokens = len(offsets) - 1
+    gram_offsets = np.zeros(n_tokens + 1, dtype=np.int64)
+    for t in range(n_tokens):
+        gram_offsets[t + 1] = (
+            gram_offsets[t] + offsets[t + 1] - offsets[t] + ngram_size - 1
+        )
+    grams = np.empty(gram_offsets[-1], dtype=np.int64)
+    for t in range(n_tokens):
+        length = offsets[t + 1] - offsets[t]
+        for g in range(length + ngram_size - 1):
+            key = 0
+            for c in range(g - ngram_size + 1, g + 1):
+                codepoint = (
+                    codepoints[offsets[t] + c]
+                    if 0 <= c < length
+                    else _NGRAM_PAD
+                )
+                key = (key << 21) | codepoint
+            grams[gram_offsets[t] + g] = key
+    return gram_offsets, grams
+
+
+@njit(nogil=True)
+def _ngram_index(
+    gram_offsets: np.ndarray, grams: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Builds an inverted index from each n-gram to the sorted
+    list of tokens that contain it.
+    """
+    tokens = np.empty(len(grams), dtype=np.int64)
+    for t in range(len(gram_offsets) - 1):
+        tokens[gram_offsets[t] : gram_offsets[t + 1]] = t
+    order = np.argsort(grams, kind="mergesort")
+    sorted_grams, sorted_tokens = grams[order], tokens[order]
+    keys = np.unique(sorted_grams)
+    postings_offsets = np.searchsorted(sorted_grams, keys)
+    postings_offsets = np.append(postings_offsets, len(sorted_grams))
+    return keys, postings_offsets, sorted_tokens
+
+
+@njit(nogil=True)
+def _greedy_distance(
+    pair_offsets_a: np.ndarray,
+    offsets_a: np.ndarray,
+    codepoints_a: np.ndarray,
+    word_ids_a: np.ndarray,
+    pair_offsets_b: np.ndarray,
+    offsets_b: np.ndarray,
+    codepoints_b: np.ndarray,
+    word_ids_b: np.ndarray,
+    use_word_ids: np.ndarray,
+    radius: int,
+    distance_id: int,
+    n_candidates: int,
+    ngram_size: int,
+) -> np.ndarray:
+    """
+    Matches each token of `a` with the closest token of `b` in its
+    window, for a batch of pairs. The tokens of the p-th pair are
+    pair_offsets_a[p]:pair_offsets_a[p + 1] (resp. `b`), and the
+    matches are returned with the same offsets as `a`.
+
+    If `n_candidates` > 0, only the `n_candidates` tokens of the window
+    sharing more character n-grams with the token are scored.
+    """
+    matches = np.full(pair_offsets_a[-1], -1, dtype=np.int64)
+    max_len_b = np.max(np.diff(offsets_b)) if len(offsets_b) > 1 else 0
+    workspace = np.empty(max_len_b + 1, dtype=np.int64)
+
+    if n_candidates > 0:
+        gram_offsets_a, grams_a = _ngrams(offsets_a, codepoints_a, ngram_size)
+        keys, postings_offsets, postings = _ngram_index(
+            *_ngrams(offsets_b, codepoints_b, ngram_size)
+        )
+        # Shared n-grams of each token in the window, and touched tokens
+        counts = np.zeros(2 * radius, dtype=np.int64)
+        touched = np.empty(2 * radius, dtype=np.int64)
+
+    for p in range(len(pair_offsets_a) - 1):
+        first_a, first_b = pair_offsets_a[p], pair_offsets_b[p]
+        len_a = pair_offsets_a[p + 1] - first_a
+        len_b = pair_offsets_b[p + 1] - first_b
+        for i in range(len_a):
+            token_a = first_a + i
+            start = max(0, i - radius)
+            end = min(len_b, i + radius)
+            # If len_a > len_b, add all the remaining b tokens to the last of a
+            if start >= end:
+                matches[token_a] = len_b - 1
+                continue
+            codepoints_i = codepoints_a[
+                offsets_a[token_a] : offsets_a[token_a + 1]
+            ]
+
+            candidates = np.arange(start, end)
+            if n_candidates > 0:
+                # Count the n-grams shared with the tokens of the window
+                n_touched = 0
+                for g in range(
+                    gram_offsets_a[token_a], gram_offsets_a[token_a + 1]
+                ):
+                    k = np.searchsorted(keys, grams_a[g])
+                    if k == len(keys) or keys[k] != grams_a[g]:
+                        continue
+                    first, last = postings_offsets[k], postings_offsets[k + 1]
+                    q = first + np.searchsorted(
+                        postings[first:last], first_b + start
+                    )
+                    while q < last and postings[q] < first_b + end:
+                        j = postings[q] - first_b
+                        q += 1
+                        if (
+                            use_word_ids[p]
+                            and word_ids_a[token_a] != word_ids_b[first_b + j]
+                        ):
+                            continue
+                        if counts[j - start] == 0:
+                            touched[n_touched] = j
+                            n_touched += 1
+                        counts[j - start] += 1
+
+                if n_touched > 0:
+                    # Keep the tokens with more shared n-grams, closer first
+                    scores = np.empty(n_touched, dtype=np.int64)
+                    for t in range(n_touched):
+                        j = touched[t]
+                        scores[t] = -counts[j - start] * (2 * radius + 1) + abs(
+                            j - i
+                        )
+                        counts[j - start] = 0
+                    order = np.argsort(scores, kind="mergesort")
+                    candidates = np.sort(touched[order[:n_candidates]])
+                else:
+                    # No shared n-grams, score the tokens around the diagonal
+                    candidates = np.arange(
+                        max(start, i - n_candidates // 2),
+                        min(end, i + n_candidates - n_candidates // 2),
+                    )
+
+            min_dist = np.inf
+            for j in candidates:
+                token_b = first_b + j
+                # Tokens from different words can't be matched
+                if (
+                    use_word_ids[p]
+                    and word_ids_a[token_a] != word_ids_b[token_b]
+                ):
+                    continue
+                dist = codepoints_distance(
+                    codepoints_i,
+                    codepoints_b[offsets_b[token_b] : offsets_b[token_b + 1]],
+                    distance_id,
+                    workspace,
+                )
+                if dist < min_dist:
+                    min_dist, matches[token_a] = dist, j
+    return matches
+
 
 class GreedyDistanceAligner(Aligner):
-    def __init__(self, distance_name: str, radius: int = 30, **kwargs):
+    def __init__(
+        self,
+        distance_name: str,
+        radius: int = 30,
+        n_candidates: int = -1,
+        ngram_size: int = 2,
+        **kwargs,
+    ):
         super().__init__(**kwargs)
         self.distance_fn = get_distance_fn(distance_name)
+        self.distance_id = get_distance_id(self.distance_fn)
         assert radius > 0, "Radius must be greater than 0."
+        assert (
+            n_candidates <= 0 or self.distance_id is not None
+        ), f"Candidates are not supported with the distance `{distance_name}`."
+        assert 1 <= ngram_size <= 3, "The n-gram size must be between 1 and 3."
         self.radius = radius
+        self.n_candidates = n_candidates
+        self.ngram_size = ngram_size
+
+    def _align_pairs(
+        self, tokenized_pairs: List[TokenizedPair]
+    ) -> List[Alignment]:
+        """
+        Aligns a batch of tokenized pairs with a single call to a
+        compiled kernel, when the distance has a native implementation.
+        """
+        if self.distance_id is None:
+            return super()._align_pairs(tokenized_pairs)
+
+        tokens_a, tokens_b = [], []
+        word_ids_a, word_ids_b = [], []
+        lengths_a, lengths_b, use_word_ids = [], [], []
+        for tokenized_pair in tokenized_pairs:
+            tokens_a += tokenized_pair.preprocessed_tokens_a
+            tokens_b += tokenized_pair.preprocessed_tokens_b
+            lengths_a.append(len(tokenized_pair.preprocessed_tokens_a))
+            lengths_b.append(len(tokenized_pair.preprocessed_tokens_b))
+            has_word_ids = bool(
+                tokenized_pair.word_ids_a and tokenized_pair.word_ids_b
+            )
+            use_word_ids.append(has_word_ids)
+            word_ids_a += (
+                tokenized_pair.word_ids_a
+                if has_word_ids
+                else [0] * lengths_a[-1]
+            )
+            word_ids_b += (
+                tokenized_pair.word_ids_b
+                if has_word_ids
+                else [0] * lengths_b[-1]
+            )
+
+        offsets_a, codepoints_a = encode_tokens(tokens_a)
+        offsets_b, codepoints_b = encode_tokens(tokens_b)
+        pair_offsets_a = np.concatenate(([0], np.cumsum(lengths_a)))
+        pair_offsets_b = np.concatenate(([0], np.cumsum(lengths_b)))
+        matches = _greedy_distance(
+            pair_offsets_a,
+            offsets_a,
+            codepoints_a,
+            np.array(word_ids_a, dtype=np.int64),
+            pair_offsets_b,
+            offsets_b,
+            codepoints_b,
+            np.array(word_ids_b, dtype=np.int64),
+            np.array(use_word_ids, dtype=np.bool_),
+            self.radius,
+            self.distance_id,
+            self.n_candidates,
+            self.ngram_size,
+        )
+
+        return [
+            self._build_alignment(
+                tokenized_pair,
+                [
+                    (position_a, [position_b])
+                    for position_a, position_b in enumerate(
+                        matches[
+                            pair_offsets_a[idx] : pair_offsets_a[idx + 1]
+                        ].tolist()
+                    )
+                ],
+            )
+            for idx, tokenized_pair in enumerate(tokenized_pairs)
+        ]
 
     def _align_pair(
         self,
@@ -29,6 +293,9 @@ class GreedyDistanceAligner(Aligner):
         match(t_i) = min_{t_j} dist(t_i, t_j)
 
         """
+        if self.distance_id is not None:
+            return self._align_pairs([tokenized_pair])[0]
+
         alignments = []
         len_a = len(tokenized_pair.preprocessed_tokens_a)
         len_b = len(tokenized_pair.preprocessed_tokens_b)
@@ -42,23 +309,30 @@ class GreedyDistanceAligner(Aligner):
                 alignments.append((i, [len_b - 1]))
             else:
                 for j in range(start, end):
+                    # Tokens from different words can't be matched
+                    if (
+                        tokenized_pair.word_ids_a
+                        and tokenized_pair.word_ids_b
+                        and tokenized_pair.word_ids_a[i]
+                        != tokenized_pair.word_ids_b[j]
+                    ):
+                        continue
                     dist = self.distance_fn(
                         tokenized_pair.preprocessed_tokens_a[i],
                         tokenized_pair.preprocessed_tokens_b[j],
                     )
-                    if tokenized_pair.word_ids_a and tokenized_pair.word_ids_b:
-                        s = (
-                            float("inf")
-                            if tokenized_pair.word_ids_a[i]
-                            != tokenized_pair.word_ids_b[j]
-                            else 1
-                        )
-                        dist *= s
                     if dist < min_dist:
                         min_dist, match_position = dist, j
                 alignments.append((i, [match_position]))
 
-        # Convert to alignment types
+        return self._build_alignment(tokenized_pair, alignments)
+
+    def _build_alignment(
+        self, tokenized_pair: TokenizedPair, alignments: List
+    ) -> Alignment:
+        """
+        Converts a list of (position_a, positions_b) to alignment types.
+        """
         position_alignments = [
             PositionAlignment(position_a=position_a, positions_b=positions_b)
             for position_a, positions_b in alignments
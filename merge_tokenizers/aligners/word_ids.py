@@ -1,12 +1,262 @@
-from ..types import Alignment, PositionAlignment, TokenAlignment, TokenizedPair
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..types import (
+    Alignment,
+    BatchAlignment,
+    PositionAlignment,
+    TokenAlignment,
+    TokenizedPair,
+)
+from ..utils.arrow import list_array_to_numpy
 from .base import Aligner
 
 
+def _close_last_words(word_ids: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Moves the last token of each row to a new word if it has no word id (-1),
+    as in `TokenizedPair`. The word ids of all the rows are concatenated in
+    `word_ids`, and `lengths` contains the number of tokens of each row.
+    `word_ids` is only copied if a last token has no word id, since it
+    may be a read-only view of an Arrow buffer.
+    """
+    ends = np.cumsum(lengths)[lengths > 0] - 1
+    if not np.any(word_ids[ends] == -1):
+        return word_ids
+    starts = ends - lengths[lengths > 0] + 1
+    word_ids = word_ids.copy()
+    word_ids[ends] = np.where(
+        word_ids[ends] == -1,
+        np.maximum.reduceat(word_ids, starts) + 1,
+        word_ids[ends],
+    )
+    return word_ids
+
+
+def _align_word_ids(
+    word_ids_a: np.ndarray,
+    lengths_a: np.ndarray,
+    word_ids_b: np.ndarray,
+    lengths_b: np.ndarray,
+) -> BatchAlignment:
+    """
+    Vectorized version of the posting list intersection in
+    `WordIdsAligner._align_pair`, for a batch of pairs.
+
+    The word ids of all the pairs are concatenated in `word_ids_a`
+    and `word_ids_b`, and `lengths_a`/`lengths_b` contain the number of
+    tokens of each pair. The word ids of each pair must be non-decreasing.
+    Each word id is shifted by its row, so that the words of all the pairs are
+    runs of a single sorted array and can be found with `searchsorted`.
+    """
+    starts_a = np.concatenate(([0], np.cumsum(lengths_a))).astype(np.int64)
+    starts_b = np.concatenate(([0], np.cumsum(lengths_b))).astype(np.int64)
+    rows_a = np.repeat(np.arange(len(lengths_a)), lengths_a)
+    rows_b = np.repeat(np.arange(len(lengths_b)), lengths_b)
+    stride = max(word_ids_a.max(initial=-1), word_ids_b.max(initial=-1)) + 3
+    keys_a = rows_a * stride + word_ids_a + 1
+    keys_b = rows_b * stride + word_ids_b + 1
+    if np.any(np.diff(keys_a) < 0) or np.any(np.diff(keys_b) < 0):
+        raise ValueError("The `word_ids` of each text must be non-decreasing.")
+
+    # Tokens of `a`: the k-th token of a word is matched with the k-th
+    # token of the same word in `b`, or with the last one if `b` has less.
+    # Words missing in `b` are matched with the previous token of `b`.
+    first_b = np.searchsorted(keys_b, keys_a, "left")
+    run_len_b = np.searchsorted(keys_b, keys_a, "right") - first_b
+    ranks_a = np.arange(len(keys_a)) - np.searchsorted(keys_a, keys_a, "left")
+    matches_b = np.where(
+        run_len_b > 0,
+        first_b + np.minimum(ranks_a, run_len_b - 1),
+        first_b - 1,
+    )
+    # Tokens reached after consuming all the tokens of `b` are not aligned
+    processed_a = (
+        first_b + np.minimum(ranks_a, run_len_b) < starts_b[rows_a + 1]
+    )
+
+    # Tokens of `b` not matched yet are merged with the last
+    # token of `a` whose word is not after theirs.
+    first_a = np.searchsorted(keys_a, keys_b, "left")
+    last_a = np.searchsorted(keys_a, keys_b, "right")
+    ranks_b = np.arange(len(keys_b)) - np.searchsorted(keys_b, keys_b, "left")
+    owners_a = np.maximum(
+        np.where(last_a > first_a, last_a - 1, first_a - 1), starts_a[rows_b]
+    )
+    # Tokens reached after consuming all the tokens of `a` are not aligned
+    processed_b = (ranks_b >= last_a - first_a) & (
+        last_a < starts_a[rows_b + 1]
+    )
+
+    positions_a = np.concatenate(
+        (np.nonzero(processed_a)[0], owners_a[processed_b])
+    )
+    positions_b = np.concatenate(
+        (matches_b[processed_a], np.nonzero(processed_b)[0])
+    )
+    order = np.lexsort((positions_b, positions_a))
+    positions_a, positions_b = positions_a[order], positions_b[order]
+    rows = rows_a[positions_a]
+
+    return BatchAlignment(
+        positions_a=positions_a - starts_a[rows],
+        positions_b=positions_b - starts_b[rows],
+        offsets=np.concatenate(
+            ([0], np.cumsum(np.bincount(rows, minlength=len(lengths_a))))
+        ),
+    )
+
+
 class WordIdsAligner(Aligner):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.kwargs = kwargs
 
+    def align_word_ids(
+        self,
+        word_ids_a: np.ndarray,
+        word_ids_b: np.ndarray,
+        attention_mask_a: Optional[np.ndarray] = None,
+        attention_mask_b: Optional[np.ndarray] = None,
+    ) -> BatchAlignment:
+        """
+        Aligns a batch of padded `word_ids`, as given by the batch
+        encodings of HuggingFace tokenizers, in a single vectorized call.
+
+        Tokens without word id (`None` in HuggingFace) must be passed as -1.
+        As in `TokenizedPair`, the last token of each text is moved to a new word
+        if it has no word id. The positions of the alignments are the columns
+        of the tokens in the padded arrays.
+
+        Args:
+            word_ids_a (np.ndarray): (batch, seq_a) word ids of the reference texts.
+            word_ids_b (np.ndarray): (batch, seq_b) word ids of the texts to be aligned.
+            attention_mask_a (Optional[np.ndarray]): (batch, seq_a) mask of the non-padding tokens.
+            attention_mask_b (Optional[np.ndarray]): (batch, seq_b) mask of the non-padding tokens.
+
+        Returns:
+            BatchAlignment: array-backed alignments of the batch.
+        """
+        assert len(word_ids_a) == len(
+            word_ids_b
+        ), "Both batches of `word_ids` must have the same size."
+
+        flat, lengths, columns = [], [], []
+        for word_ids, attention_mask in [
+            (word_ids_a, attention_mask_a),
+            (word_ids_b, attention_mask_b),
+        ]:
+            word_ids = np.asarray(word_ids, dtype=np.int64)
+            mask = (
+                np.ones(word_ids.shape, dtype=bool)
+                if attention_mask is None
+                else np.asarray(attention_mask).astype(bool)
+            )
+            rows, cols = np.nonzero(mask)
+            row_lengths = mask.sum(axis=1)
+            flat.append(_close_last_words(word_ids[rows, cols], row_lengths))
+            lengths.append(row_lengths)
+            columns.append(cols)
+
+        alignment = _align_word_ids(flat[0], lengths[0], flat[1], lengths[1])
+
+        # Map the positions in each text to columns of the padded arrays
+        starts_a = np.concatenate(([0], np.cumsum(lengths[0])))
+        starts_b = np.concatenate(([0], np.cumsum(lengths[1])))
+        rows = np.repeat(np.arange(len(lengths[0])), np.diff(alignment.offsets))
+        alignment.positions_a = columns[0][
+            starts_a[rows] + alignment.positions_a
+        ]
+        alignment.positions_b = np.where(
+            alignment.positions_b >= 0,
+            columns[1][starts_b[rows] + np.maximum(alignment.positions_b, 0)],
+            -1,
+        )
+        return alignment
+
+    def _align_record_batch(
+        self, batch: Any, columns: Dict[str, str]
+    ) -> BatchAlignment:
+        """
+        Aligns the `word_ids` columns of an Arrow record batch in a single
+        vectorized call, reading the word ids from the Arrow buffers.
+        Null word ids are taken as tokens without word id. Batches that can't
+        be aligned this way (no `word_ids` columns, special tokens to pin,
+        a cache, or word ids not non-decreasing) are aligned as `TokenizedPair`.
+        """
+        if (
+            "word_ids_a" in columns
+            and "word_ids_b" in columns
+            and not self._special_tokens
+            and self.cache is None
+        ):
+            offsets_a, word_ids_a = list_array_to_numpy(
+                batch.column(columns["word_ids_a"]), fill_value=-1
+            )
+            offsets_b, word_ids_b = list_array_to_numpy(
+                batch.column(columns["word_ids_b"]), fill_value=-1
+            )
+            lengths_a, lengths_b = np.diff(offsets_a), np.diff(offsets_b)
+            try:
+                return _align_word_ids(
+                    _close_last_words(word_ids_a, lengths_a),
+                    lengths_a,
+                    _close_last_words(word_ids_b, lengths_b),
+                    lengths_b,
+                )
+            except ValueError:
+                pass
+        return super()._align_record_batch(batch, columns)
+
+    def _align_pairs(
+        self, tokenized_pairs: List[TokenizedPair]
+    ) -> List[Alignment]:
+        """
+        Aligns a batch of tokenized pairs with a single vectorized call.
+        Pairs whose `word_ids` are not non-decreasing are aligned one by one.
+        """
+        is_sorted = [
+            bool(tokenized_pair.word_ids_a and tokenized_pair.word_ids_b)
+            and bool(np.all(np.diff(tokenized_pair.word_ids_a) >= 0))
+            and bool(np.all(np.diff(tokenized_pair.word_ids_b) >= 0))
+            for tokenized_pair in tokenized_pairs
+        ]
+        sorted_pairs = [
+            tokenized_pair
+            for tokenized_pair, sorted_ in zip(tokenized_pairs, is_sorted)
+            if sorted_
+        ]
+        if not sorted_pairs:
+            return [self._align_pair(pair) for pair in tokenized_pairs]
+        batch_alignment = _align_word_ids(
+            np.array(
+                [w for pair in sorted_pairs for w in pair.word_ids_a],
+                dtype=np.int64,
+            ),
+            np.array(
+                [len(pair.word_ids_a) for pair in sorted_pairs],
+                dtype=np.int64,
+            ),
+            np.array(
+                [w for pair in sorted_pairs for w in pair.word_ids_b],
+                dtype=np.int64,
+            ),
+            np.array(
+                [len(pair.word_ids_b) for pair in sorted_pairs],
+                dtype=np.int64,
+            ),
+        ).to_alignments(
+            [pair.tokens_a for pair in sorted_pairs],
+            [pair.tokens_b for pair in sorted_pairs],
+        )
+
+        batch_alignments = iter(batch_alignment)
+        return [
+            next(batch_alignments) if sorted_ else self._align_pair(pair)
+            for pair, sorted_ in zip(tokenized_pairs, is_sorted)
+        ]
+
     def _align_pair(
         self,
         tokenized_pair: TokenizedPair,
@@ -0,0 +1,486 @@
+import argparse
+import asyncio
+import json
+import shutil
+import sys
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .aligners import (
+    Aligner,
+    DTWAligner,
+    FastDTWAligner,
+    GreedyCoverageAligner,
+    GreedyDistanceAligner,
+    PythonDTWAligner,
+    PythonGreedyCoverageAligner,
+    TamuheyAligner,
+    WordIdsAligner,
+)
+from .server import AlignmentServer
+from .types import TokenizedSet
+from .utils.serialization import AlignmentWriter, write_metadata
+
+ALIGNERS = {
+    "dtw": DTWAligner,
+    "python-dtw": PythonDTWAligner,
+    "fast-dtw": FastDTWAligner,
+    "greedy-coverage": GreedyCoverageAligner,
+    "python-greedy-coverage": PythonGreedyCoverageAligner,
+    "greedy-distance": GreedyDistanceAligner,
+    "tamuhey": TamuheyAligner,
+    "word-ids": WordIdsAligner,
+}
+
+# Aligners that need a `distance_name`
+DISTANCE_ALIGNERS = ["dtw", "python-dtw", "fast-dtw", "greedy-distance"]
+
+# State of each worker process
+_worker: Dict[str, Any] = {}
+
+
+def build_aligner(name: str, distance: str, kwargs: Dict) -> Aligner:
+    """
+    Instantiates an aligner from its name in the CLI.
+
+    Args:
+        name (str): name of the aligner, one of `ALIGNERS`.
+        distance (str): distance name, for the aligners that use distances.
+        kwargs (Dict): other arguments of the aligner.
+
+    Returns:
+        Aligner: the aligner.
+    """
+    if name in DISTANCE_ALIGNERS:
+        kwargs = {"distance_name": distance, **kwargs}
+    return ALIGNERS[name](**kwargs)
+
+
+def read_records(path: Path, batch_size: int) -> Iterator[Dict]:
+    """
+    Reads the records of a JSONL or Parquet file one by one.
+
+    Args:
+        path (Path): path of the .jsonl or .parquet file.
+        batch_size (int): number of rows read at once from Parquet files.
+
+    Returns:
+        Iterator[Dict]: records of the file.
+    """
+    if path.suffix == ".parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(
+                "Reading Parquet files requires `pyarrow`: pip install pyarrow"
+            )
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+    else:
+        with open(path) as records_file:
+            for line in records_file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _word_ids(word_ids: List[Optional[int]]) -> List[Optional[int]]:
+    # Tokens without word (special tokens) inside the text are
+    # moved to the previous word, the first and last ones are
+    # handled by the validators of `TokenizedSet`.
+    prepared = list(word_ids)
+    for idx in range(1, len(prepared) - 1):
+        if prepared[idx] is None:
+            prepared[idx] = (
+                -1 if prepared[idx - 1] is None else prepared[idx - 1]
+            )
+    return prepared
+
+
+def record_to_set(record: Dict, text_field: str) -> TokenizedSet:
+    """
+    Builds a `TokenizedSet` from a record, tokenizing the text with
+    the tokenizers of the worker if the record has no tokens.
+
+    Args:
+        record (Dict): record with `text_field`, and optionally `tokens`,
+                       `word_ids` and `spans` of each tokenizer.
+        text_field (str): name of the field of the text.
+
+    Returns:
+        TokenizedSet: tokenized texts.
+    """
+    text = record.get(text_field) or ""
+    if "tokens" in record:
+        return TokenizedSet(
+            tokens=record["tokens"],
+            word_ids=record.get("word_ids") or [],
+            spans=[
+                [tuple(span) for span in spans]
+                for spans in record.get("spans") or []
+            ],
+            text=text,
+        )
+
+    assert _worker.get(
+        "tokenizers"
+    ), "Records without `tokens` require passing `--tokenizers`."
+    encodings = [tokenizer.encode(text) for tokenizer in _worker["tokenizers"]]
+    return TokenizedSet(
+        tokens=[encoding.tokens for encoding in encodings],
+        word_ids=[_word_ids(encoding.word_ids) for encoding in encodings],
+        spans=[encoding.offsets for encoding in encodings],
+        text=text,
+    )
+
+
+def _init_worker(
+    aligner: str,
+    distance: str,
+    aligner_kwargs: Dict,
+    tokenizers: List[str],
+    text_field: str,
+):
+    _worker["aligner"] = build_aligner(aligner, distance, aligner_kwargs)
+    _worker["text_field"] = text_field
+    if tokenizers:
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError(
+                "Tokenizing the texts requires `tokenizers`: pip install tokenizers"
+            )
+        _worker["tokenizers"] = [Tokenizer.from_file(t) for t in tokenizers]
+
+
+def _align_part(
+    part: int, records: List[Dict], tmp_path: Path
+) -> Tuple[int, int, int, Dict[str, float]]:
+    """
+    Aligns the records of a part and writes the alignments of each
+    target tokenizer as one shard in `tmp_path`/target-{t}/shard-00000.
+    """
+    times = {}
+    start = time.perf_counter()
+    tokenized_sets = [
+        record_to_set(record, _worker["text_field"]) for record in records
+    ]
+    times["tokenize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    alignments = [
+        _worker["aligner"].align(tokenized_set)
+        for tokenized_set in tokenized_sets
+    ]
+    times["align"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    n_targets = len(alignments[0]) if alignments else 0
+    assert all(
+        len(set_alignments) == n_targets for set_alignments in alignments
+    ), "All the records must have the same number of tokenizations."
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    for target in range(n_targets):
+        with AlignmentWriter(
+            tmp_path / f"target-{target + 1}", shard_size=len(records)
+        ) as writer:
+            writer.write_all(
+                set_alignments[target] for set_alignments in alignments
+            )
+    times["write"] = time.perf_counter() - start
+    return part, len(records), n_targets, times
+
+
+class AlignJob:
+    """
+    Aligns a corpus in parts of `part_size` records, and writes the
+    alignments of each target tokenizer with the reference one (the first)
+    as a directory of shards readable by `AlignmentReader`:
+    `output`/target-{t}/shard-{part}. Finished parts are recorded in
+    `output`/progress, so an interrupted job resumes after them.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.output = Path(args.output)
+        self.progress = self.output / "progress"
+        self.tmp = self.output / "tmp"
+        self.progress.mkdir(parents=True, exist_ok=True)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+        # Shards are indexed by part, so the part size can't change
+        job_path = self.output / "job.json"
+        if job_path.exists():
+            part_size = json.loads(job_path.read_text())["part_size"]
+            assert (
+                part_size == args.part_size
+            ), f"The job was started with `--part-size {part_size}`."
+        else:
+            job_path.write_text(json.dumps({"part_size": args.part_size}))
+
+        self.done = {
+            int(path.stem.split("-")[1]): json.loads(path.read_text())
+            for path in self.progress.glob("part-*.json")
+        }
+        self.n_records = 0
+        self.stage_times: Dict[str, float] = {
+            "read": 0.0,
+            "tokenize": 0.0,
+            "align": 0.0,
+            "write": 0.0,
+        }
+        self.start = time.perf_counter()
+
+    def _parts(self) -> Iterator[Tuple[int, List[Dict]]]:
+        """
+        Reads the input in parts, skipping the finished ones.
+        """
+        records: List[Dict] = []
+        part = 0
+        start = time.perf_counter()
+        for record in read_records(Path(self.args.input), self.args.part_size):
+            records.append(record)
+            if len(records) == self.args.part_size:
+                self.stage_times["read"] += time.perf_counter() - start
+                if part not in self.done:
+                    yield part, records
+                records, part = [], part + 1
+                start = time.perf_counter()
+        self.stage_times["read"] += time.perf_counter() - start
+        if records and part not in self.done:
+            yield part, records
+
+    def _commit(self, result: Tuple[int, int, int, Dict[str, float]]):
+        """
+        Moves the shards of a finished part to the output,
+        and records the part as finished.
+        """
+        part, n_records, n_targets, times = result
+        for target in range(n_targets):
+            shard_path = (
+                self.output / f"target-{target + 1}" / f"shard-{part:05d}"
+            )
+            shutil.rmtree(shard_path, ignore_errors=True)
+            shard_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(
+                str(
+                    self.tmp
+                    / f"part-{part:05d}"
+                    / f"target-{target + 1}"
+                    / "shard-00000"
+                ),
+                str(shard_path),
+            )
+        shutil.rmtree(self.tmp / f"part-{part:05d}", ignore_errors=True)
+        self.done[part] = {"n_records": n_records, "n_targets": n_targets}
+        (self.progress / f"part-{part:05d}.json").write_text(
+            json.dumps(self.done[part])
+        )
+        self._write_metadata()
+
+        self.n_records += n_records
+        for stage, stage_time in times.items():
+            self.stage_times[stage] += stage_time
+        elapsed = time.perf_counter() - self.start
+        print(
+            f"[align] part {part:05d}: {n_records} records | "
+            + " ".join(
+                f"{stage} {stage_time:.2f}s"
+                for stage, stage_time in self.stage_times.items()
+            )
+            + f" | {self.n_records} records in {elapsed:.1f}s"
+            f" ({self.n_records / max(elapsed, 1e-9):.1f} records/s)",
+            file=sys.stderr,
+        )
+
+    def _write_metadata(self):
+        """
+        Writes the metadata of each target, covering
+        the finished parts from the start of the input.
+        """
+        n_parts = 0
+        while n_parts in self.done:
+            n_parts += 1
+        if n_parts == 0:
+            return
+        n_alignments = sum(
+            self.done[part]["n_records"] for part in range(n_parts)
+        )
+        for target in range(self.done[0]["n_targets"]):
+            write_metadata(
+                self.output / f"target-{target + 1}",
+                self.args.part_size,
+                n_parts,
+                n_alignments,
+            )
+
+    def run(self):
+        args = self.args
+        initargs = (
+            args.aligner,
+            args.distance,
+            json.loads(args.aligner_kwargs),
+            args.tokenizers,
+            args.text_field,
+        )
+        if self.done:
+            print(
+                f"[align] resuming, {len(self.done)} parts already finished",
+                file=sys.stderr,
+            )
+
+        if args.workers <= 1:
+            _init_worker(*initargs)
+            for part, records in self._parts():
+                self._commit(
+                    _align_part(part, records, self.tmp / f"part-{part:05d}")
+                )
+        else:
+            with ProcessPoolExecutor(
+                max_workers=args.workers,
+                initializer=_init_worker,
+                initargs=initargs,
+            ) as executor:
+                # Keep a bounded number of parts in memory
+                pending: List[Future] = []
+                for part, records in self._parts():
+                    if len(pending) >= 2 * args.workers:
+                        finished, not_finished = wait(
+                            pending, return_when=FIRST_COMPLETED
+                        )
+                        for future in finished:
+                            self._commit(future.result())
+                        pending = list(not_finished)
+                    pending.append(
+                        executor.submit(
+                            _align_part,
+                            part,
+                            records,
+                            self.tmp / f"part-{part:05d}",
+                        )
+                    )
+                for future in pending:
+                    self._commit(future.result())
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+def _add_aligner_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--aligner", choices=sorted(ALIGNERS), default="greedy-coverage"
+    )
+    parser.add_argument(
+        "--distance",
+        default="levenshtein",
+        help="Distance of the aligners that use distances.",
+    )
+    parser.add_argument(
+        "--aligner-kwargs",
+        default="{}",
+        help="JSON with other arguments of the aligner.",
+    )
+
+
+def serve(args: argparse.Namespace):
+    """
+    Runs an `AlignmentServer` until interrupted.
+
+    Args:
+        args (argparse.Namespace): arguments of the `serve` command.
+    """
+    server = AlignmentServer(
+        build_aligner(
+            args.aligner, args.distance, json.loads(args.aligner_kwargs)
+        ),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+    )
+
+    async def run():
+        listening = await server.start(args.socket, args.host, args.port)
+        address = listening.sockets[0].getsockname()
+        print(f"Serving on {address}", file=sys.stderr)
+        try:
+            async with listening:
+                await listening.serve_forever()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.socket is not None:
+            Path(args.socket).unlink(missing_ok=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="merge-tokenizers",
+        description="Align tokens from different tokenizers.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    align_parser = subparsers.add_parser(
+        "align",
+        help="Align the tokenizations of a corpus and store the alignments.",
+    )
+    align_parser.add_argument(
+        "input",
+        help="JSONL or Parquet file. Each record has a text and, optionally, "
+        "the `tokens`, `word_ids` and `spans` of each tokenizer.",
+    )
+    align_parser.add_argument(
+        "output", help="Output directory of the alignments."
+    )
+    _add_aligner_arguments(align_parser)
+    align_parser.add_argument(
+        "--tokenizers",
+        nargs="*",
+        default=[],
+        help="Local `tokenizer.json` files used to tokenize "
+        "the records without `tokens`. The first is the reference.",
+    )
+    align_parser.add_argument("--text-field", default="text")
+    align_parser.add_argument(
+        "--part-size",
+        type=int,
+        default=10000,
+        help="Records per part. Each part is a shard of the output, "
+        "and the unit of work and checkpointing.",
+    )
+    align_parser.add_argument("--workers", type=int, default=1)
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Serve alignment requests over a Unix domain socket or local TCP, "
+        "aligning concurrent requests in batches.",
+    )
+    serve_parser.add_argument(
+        "--socket", help="Path of the Unix domain socket. If missing, use TCP."
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--max-batch-size", type=int, default=32)
+    serve_parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=2.0,
+        help="Maximum time to wait for a batch to fill.",
+    )
+    _add_aligner_arguments(serve_parser)
+
+    args = parser.parse_args(argv)
+    if args.command == "align":
+        AlignJob(args).run()
+    elif args.command == "serve":
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+import asyncio
+import json
+import socket
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .aligners import Aligner
+from .types import Alignment, TokenizedSet
+
+# Aggregation functions accepted in the requests
+AGGREGATE_FNS = {"mean": np.mean, "sum": np.sum, "max": np.max, "min": np.min}
+
+# Maximum size in bytes of a request or response line
+MAX_LINE_SIZE = 2**26
+
+
+def parse_request(request: Dict) -> TokenizedSet:
+    """
+    Builds the tokenized set of a request.
+
+    Args:
+        request (Dict): request with the `tokens` of each tokenizer, and optionally
+                        `word_ids`, `spans`, `text` and `features`.
+
+    Returns:
+        TokenizedSet: tokenized texts of the request.
+    """
+    op = request.get("op", "align")
+    if op not in ["align", "aggregate"]:
+        raise ValueError(f"Unknown operation `{op}`.")
+    if len(request.get("tokens") or []) < 2:
+        raise ValueError(
+            "Requests must have the `tokens` of two or more tokenizers."
+        )
+    return TokenizedSet(
+        tokens=request["tokens"],
+        word_ids=request.get("word_ids") or [],
+        spans=[
+            [tuple(span) if span is not None else None for span in spans]
+            for spans in request.get("spans") or []
+        ],
+        features=(
+            [np.asarray(features) for features in request["features"]]
+            if op == "aggregate"
+            else []
+        ),
+        text=request.get("text") or "",
+    )
+
+
+def encode_alignment(alignment: Alignment) -> List[Tuple[int, List[int]]]:
+    """
+    Encodes the positions of an alignment as JSON-serializable lists.
+    """
+    return [
+        (position_a, list(positions_b)) for position_a, positions_b in alignment
+    ]
+
+
+class AlignmentServer:
+    """
+    Local server that aligns the requests received over a Unix domain
+    socket or a local TCP port. Concurrent requests are coalesced into batches
+    of up to `max_batch_size` requests, waiting at most `max_wait_ms` for a batch
+    to fill, and all the pairs of a batch are aligned with a single call to
+    `Aligner.align_pairs`.
+
+    The protocol is newline-delimited JSON. Each request has an `id`, which is
+    returned in the response, an `op` ("align" or "aggregate"), the `tokens`
+    of each tokenizer and optionally `word_ids`, `spans` and `text`. Aggregation
+    requests also have the `features` of each tokenizer, the `aggregate_fn`
+    ("mean", "sum", "max" or "min") and `stack`. Responses contain the positions
+    of the `alignments`, the aggregated `features` and the `metrics` of the
+    request, or an `error`. Responses of a connection may be out of order.
+
+    Example:
+        server = AlignmentServer(GreedyCoverageAligner(), max_batch_size=64)
+        asyncio.run(server.serve(path="/tmp/merge-tokenizers.sock"))
+    """
+
+    def __init__(
+        self,
+        aligner: Aligner,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+    ):
+        assert max_batch_size > 0, "`max_batch_size` must be greater than 0."
+        self.aligner = aligner
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self.n_requests = 0
+        self.n_batches = 0
+
+    async def submit(self, request: Dict) -> Dict:
+        """
+        Adds a request to the next batch and waits for its response.
+
+        Args:
+            request (Dict): request in the format of the protocol.
+
+        Returns:
+            Dict: response of the request.
+        """
+        assert self._queue is not None, "The server is not running."
+        received = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((request, received, future))
+        return await future
+
+    async def _batch_loop(self):
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self._queue.get(), timeout)
+                    )
+                except asyncio.TimeoutError:
+                    break
+            # Drop the requests whose clients are gone
+            batch = [item for item in batch if not item[2].done()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            responses = await asyncio.to_thread(
+                self._run_batch, [request for request, _, _ in batch]
+            )
+            finished = time.perf_counter()
+            self.n_requests += len(batch)
+            self.n_batches += 1
+            for (request, received, future), response in zip(batch, responses):
+                if future.done():
+                    continue
+                response["id"] = request.get("id")
+                response["metrics"] = {
+                    "queue_ms": (started - received) * 1000,
+                    "batch_ms": (finished - started) * 1000,
+                    "total_ms": (time.perf_counter() - received) * 1000,
+                    "batch_size": len(batch),
+                }
+                future.set_result(response)
+
+    def _run_batch(self, requests: List[Dict]) -> List[Dict]:
+        """
+        Aligns all the pairs of a batch of requests at once, and aggregates the
+        features of the aggregation requests. If the batch fails, the requests
+        are run one by one to return the error only to the invalid ones.
+        """
+        responses: List[Dict] = [{} for _ in requests]
+        tokenized_sets: List[Optional[TokenizedSet]] = []
+        for response, request in zip(responses, requests):
+            try:
+                tokenized_sets.append(parse_request(request))
+            except Exception as error:
+                response["error"] = str(error)
+                tokenized_sets.append(None)
+        valid = [idx for idx, ts in enumerate(tokenized_sets) if ts is not None]
+
+        try:
+            pairs = [
+                tokenized_sets[idx].to_pairs() for idx in valid  # type: ignore
+            ]
+            flat_alignments = iter(
+                self.aligner.align_pairs(
+                    [pair for request_pairs in pairs for pair in request_pairs]
+                )
+            )
+            alignments = {
+                idx: [next(flat_alignments) for _ in request_pairs]
+                for idx, request_pairs in zip(valid, pairs)
+            }
+        except Exception:
+            if len(valid) > 1:
+                for idx in valid:
+                    responses[idx] = self._run_batch([requests[idx]])[0]
+                return responses
+            alignments = {}
+
+        for idx in valid:
+            try:
+                if idx not in alignments:
+                    alignments[idx] = self.aligner.align_pairs(
+                        tokenized_sets[idx].to_pairs()  # type: ignore
+                    )
+                responses[idx] = self._respond(
+                    requests[idx], tokenized_sets[idx], alignments[idx]  # type: ignore
+                )
+            except Exception as error:
+                responses[idx] = {"error": str(error)}
+        return responses
+
+    def _respond(
+        self,
+        request: Dict,
+        tokenized_set: TokenizedSet,
+        alignments: List[Alignment],
+    ) -> Dict:
+        response: Dict[str, Any] = {
+            "alignments": [
+                encode_alignment(alignment) for alignment in alignments
+            ]
+        }
+        if request.get("op") == "aggregate":
+            aggregate_fn = request.get("aggregate_fn", "mean")
+            if aggregate_fn not in AGGREGATE_FNS:
+                raise ValueError(f"Unknown `aggregate_fn` `{aggregate_fn}`.")
+            features = self.aligner.aggregate_features(
+                tokenized_set,
+                AGGREGATE_FNS[aggregate_fn],
+                stack=bool(request.get("stack")),
+                alignments=alignments,
+            )
+            response["features"] = (
+                features.tolist()
+                if isinstance(features, np.ndarray)
+                else [np.asarray(f).tolist() for f in features]
+            )
+        return response
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def answer(line: bytes):
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Requests must be JSON objects.")
+                response = await self.submit(request)
+            except ValueError as error:
+                response = {"id": None, "error": str(error)}
+            async with lock:
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(answer(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def start(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> asyncio.AbstractServer:
+        """
+        Starts listening on the Unix domain socket `path` if passed,
+        otherwise, on the TCP `host` and `port`. It can be called
+        several times to listen on more addresses.
+
+        Args:
+            path (Optional[Union[str, Path]]): path of the Unix domain socket.
+            host (str): host of the TCP server.
+            port (int): port of the TCP server, 0 to pick a free one.
+
+        Returns:
+            asyncio.AbstractServer: the listening server.
+        """
+        # All the listeners of the server share the same batches
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.create_task(self._batch_loop())
+        if path is not None:
+            return await asyncio.start_unix_server(
+                self._handle_connection, path=str(path), limit=MAX_LINE_SIZE
+            )
+        return await asyncio.start_server(
+            self._handle_connection, host, port, limit=MAX_LINE_SIZE
+        )
+
+    async def serve(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        Starts the server and serves the requests until cancelled.
+
+        Args:
+            path (Optional[Union[str, Path]]): path of the Unix domain socket.
+            host (str): host of the TCP server.
+            port (int): port of the TCP server, 0 to pick a free one.
+        """
+        server = await self.start(path, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """
+        Stops batching requests. Pending requests are not answered.
+        """
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = self._queue = None
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the metrics of the server.
+
+        Returns:
+            Dict[str, float]: requests, batches and mean batch size.
+        """
+        return {
+            "requests": self.n_requests,
+            "batches": self.n_batches,
+            "mean_batch_size": (
+                self.n_requests / self.n_batches if self.n_batches else 0.0
+            ),
+        }
+
+
+class AlignmentClient:
+    """
+    Blocking client of `AlignmentServer`, sending one request at a time.
+
+    Example:
+        client = AlignmentClient(path="/tmp/merge-tokenizers.sock")
+        alignments = client.align([tokens_a, tokens_b])["alignments"]
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        host: str = "127.0.0.1",
+        port: Optional[int] = None,
+    ):
+        if path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(str(path))
+        else:
+            assert (
+                port is not None
+            ), "Pass the `path` or the `port` of the server."
+            self._socket = socket.create_connection((host, port))
+        self._file = self._socket.makefile("rwb")
+        self._next_id = 0
+
+    def request(self, request: Dict) -> Dict:
+        """
+        Sends a request and waits for its response.
+
+        Args:
+            request (Dict): request in the format of the protocol.
+
+        Returns:
+            Dict: response of the request.
+        """
+        request = {"id": self._next_id, **request}
+        self._next_id += 1
+        self._file.write(json.dumps(request).encode("utf-8") + b"\n")
+        self._file.flush()
+        response = json.loads(self._file.readline())
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    def align(self, tokens: List[List[str]], **kwargs) -> Dict:
+        """
+        Aligns the tokenizations of a text with the first one.
+
+        Args:
+            tokens (List[List[str]]): tokens of each tokenizer.
+            kwargs: `word_ids`, `spans` and `text` of the request.
+
+        Returns:
+            Dict: response with the `alignments` and the `metrics`.
+        """
+        return self.request({"op": "align", "tokens": tokens, **kwargs})
+
+    def aggregate(
+        self,
+        tokens: List[List[str]],
+        features: List[Any],
+        aggregate_fn: str = "mean",
+        stack: bool = False,
+        **kwargs,
+    ) -> Dict:
+        """
+        Aggregates the features of each tokenizer to the tokens of the first one.
+
+        Args:
+            tokens (List[List[str]]): tokens of each tokenizer.
+            features (List[Any]): features of each tokenizer.
+            aggregate_fn (str): "mean", "sum", "max" or "min".
+            stack (bool): whether to stack horizontally all the features.
+            kwargs: `word_ids`, `spans` and `text` of the request.
+
+        Returns:
+            Dict: response with the `alignments`, the `features` and the `metrics`.
+        """
+        return self.request(
+            {
+                "op": "aggregate",
+                "tokens": tokens,
+                "features": [np.asarray(f).tolist() for f in features],
+                "aggregate_fn": aggregate_fn,
+                "stack": stack,
+                **kwargs,
+            }
+        )
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self) -> "AlignmentClient":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,7 +1,11 @@
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
-from pydantic import BaseModel, field_validator, model_validator
+from pydantic import BaseModel, PrivateAttr, field_validator, model_validator
+from scipy.sparse import csr_matrix
+
+# Features of the tokens, as numpy arrays or torch tensors
+Features = Any
 
 
 class TokenizedPair(BaseModel):
@@ -18,8 +22,8 @@ class TokenizedPair(BaseModel):
     preprocessed_tokens_a: List[str] = []
     preprocessed_tokens_b: List[str] = []
     text: str = ""
-    features_a: np.ndarray = None
-    features_b: np.ndarray = None
+    features_a: Features = None
+    features_b: Features = None
 
     @field_validator("word_ids_a", "word_ids_b", mode="before")
     @classmethod
@@ -48,6 +52,18 @@ class TokenizedPair(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
+    @classmethod
+    def trusted(cls, **fields) -> "TokenizedPair":
+        """
+        Builds a tokenized pair without validating nor copying the fields,
+        for fields that are already valid, e.g., taken from a validated
+        `TokenizedSet`. The `word_ids` and `spans` must not contain None.
+
+        Returns:
+            TokenizedPair: a pair of tokenized texts.
+        """
+        return cls.model_construct(**fields)
+
 
 class TokenizedSet(BaseModel):
     """
@@ -57,7 +73,7 @@ class TokenizedSet(BaseModel):
     tokens: List[List[str]]
     word_ids: List[List[int]] = []
     spans: List[List[Tuple[int, int]]] = []
-    features: List[np.ndarray] = []
+    features: List[Features] = []
     text: str = ""
 
     class Config:
@@ -101,6 +117,43 @@ class TokenizedSet(BaseModel):
         else:
             return []
 
+    @classmethod
+    def trusted(cls, **fields) -> "TokenizedSet":
+        """
+        Builds a tokenized set without validating nor copying the fields,
+        for fields that are already valid. The `word_ids` and `spans` must
+        not contain None, and must have the same length as `tokens` if passed.
+
+        Returns:
+            TokenizedSet: multiple tokenized texts.
+        """
+        return cls.model_construct(**fields)
+
+    def to_pairs(self) -> List["TokenizedPair"]:
+        """
+        Pairs the first tokenization, the reference, with each of the others.
+        The pairs share the lists of the set, without validating them again.
+
+        Returns:
+            List[TokenizedPair]: a tokenized pair for each tokenization but the first.
+        """
+        word_ids = self.word_ids or [[] for _ in range(len(self.tokens))]
+        spans = self.spans or [[] for _ in range(len(self.tokens))]
+        return [
+            TokenizedPair.trusted(
+                tokens_a=self.tokens[0],
+                tokens_b=tokens_b,
+                word_ids_a=word_ids[0],
+                word_ids_b=word_ids_b,
+                spans_a=spans[0],
+                spans_b=spans_b,
+                text=self.text,
+            )
+            for tokens_b, word_ids_b, spans_b in zip(
+                self.tokens[1:], word_ids[1:], spans[1:]
+            )
+        ]
+
 
 class PositionAlignment(BaseModel):
     """
@@ -130,6 +183,7 @@ class Alignment(BaseModel):
 
     positions: List[PositionAlignment]
     tokens: List[TokenAlignment]
+    _projections: Dict[tuple, csr_matrix] = PrivateAttr(default_factory=dict)
 
     def __iter__(self):
         for position_alignment in self.positions:
@@ -145,3 +199,232 @@ class Alignment(BaseModel):
     def merge(self, alignment: "Alignment"):
         self.positions += alignment.positions
         self.tokens += alignment.tokens
+        self._projections.clear()
+
+    def to_indices(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the alignment as two index arrays (rows, cols), where the
+        token `rows[k]` of `a` is aligned with the token `cols[k]` of `b`.
+        If a position of `a` is repeated, its last alignment is kept.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: positions of `a` and `b` (int64).
+        """
+        merged = dict(self)
+        lengths = np.array(
+            [len(positions_b) for positions_b in merged.values()],
+            dtype=np.int64,
+        )
+        rows = np.repeat(np.array(list(merged), dtype=np.int64), lengths)
+        cols = np.array(
+            [p for positions_b in merged.values() for p in positions_b],
+            dtype=np.int64,
+        )
+        return rows, cols
+
+    def to_projection(
+        self,
+        kind: str = "mean",
+        dtype: np.dtype = np.float32,
+        shape: Optional[Tuple[int, int]] = None,
+    ) -> csr_matrix:
+        """
+        Builds a sparse (len_a, len_b) matrix that projects features of
+        the tokens of `b` to the tokens of `a`, so that aggregating
+        features through this alignment is a single sparse-dense matmul:
+        `projection @ features_b`. Projections are cached by arguments.
+
+        Args:
+            kind (str): "mean" to average the features of the tokens of `b`
+                        aligned to each token of `a`, or "sum" to add them.
+            dtype (np.dtype): dtype of the matrix.
+            shape (Optional[Tuple[int, int]]): (len_a, len_b). By default, the
+                                               largest aligned positions + 1.
+
+        Returns:
+            csr_matrix: projection matrix.
+        """
+        assert kind in ["mean", "sum"], "`kind` must be 'mean' or 'sum'."
+        key = (kind, np.dtype(dtype).str, shape)
+        if key not in self._projections:
+            rows, cols = self.to_indices()
+            lengths = np.bincount(rows, minlength=rows.max(initial=-1) + 1)
+            if shape is None:
+                shape = (
+                    int(rows.max(initial=-1)) + 1,
+                    int(cols.max(initial=-1)) + 1,
+                )
+            weights = (
+                1.0 / lengths[rows] if kind == "mean" else np.ones(len(cols))
+            )
+            # Negative positions index from the end, as in numpy
+            self._projections[key] = csr_matrix(
+                (weights, (rows, cols % max(shape[1], 1))),
+                shape=shape,
+                dtype=dtype,
+            )
+        return self._projections[key]
+
+
+class BatchAlignment(BaseModel):
+    """
+    Alignments of a batch of tokenized pairs, backed by arrays.
+    The alignment of the i-th pair is made of the matches
+    (positions_a[k], positions_b[k]) for k in offsets[i]:offsets[i + 1],
+    sorted by `positions_a` and then by `positions_b`.
+    """
+
+    positions_a: np.ndarray
+    positions_b: np.ndarray
+    offsets: np.ndarray
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.positions_a[start:end], self.positions_b[start:end]
+
+    @classmethod
+    def from_alignments(cls, alignments: List[Alignment]) -> "BatchAlignment":
+        """
+        Converts `Alignment` objects to the alignments of a batch.
+
+        Args:
+            alignments (List[Alignment]): positions and tokens of each alignment.
+
+        Returns:
+            BatchAlignment: array-backed alignments of the batch.
+        """
+        lengths = np.array(
+            [
+                sum(len(positions_b) for _, positions_b in alignment)
+                for alignment in alignments
+            ],
+            dtype=np.int64,
+        )
+        positions_a = np.fromiter(
+            (
+                position_a
+                for alignment in alignments
+                for position_a, positions_b in alignment
+                for _ in positions_b
+            ),
+            dtype=np.int32,
+            count=int(lengths.sum()),
+        )
+        positions_b = np.fromiter(
+            (
+                position_b
+                for alignment in alignments
+                for _, positions_b in alignment
+                for position_b in positions_b
+            ),
+            dtype=np.int32,
+            count=int(lengths.sum()),
+        )
+        rows = np.repeat(np.arange(len(alignments)), lengths)
+        order = np.lexsort((positions_b, positions_a, rows))
+        return cls(
+            positions_a=positions_a[order],
+            positions_b=positions_b[order],
+            offsets=np.concatenate(([0], np.cumsum(lengths))),
+        )
+
+    def to_arrow(self) -> Any:
+        """
+        Converts the alignments of the batch to an Arrow table with one row per
+        alignment, and the `positions_a` and `positions_b` of its matches as
+        `list<int32>` columns, without copying the positions. Requires `pyarrow`.
+
+        Returns:
+            Any: `pyarrow.Table` with the columns `positions_a` and `positions_b`.
+        """
+        from .utils.arrow import import_pyarrow, numpy_to_list_array
+
+        pa = import_pyarrow()
+        return pa.table(
+            {
+                "positions_a": numpy_to_list_array(
+                    self.offsets,
+                    np.asarray(self.positions_a, dtype=np.int32),
+                ),
+                "positions_b": numpy_to_list_array(
+                    self.offsets,
+                    np.asarray(self.positions_b, dtype=np.int32),
+                ),
+            }
+        )
+
+    def to_alignments(
+        self, tokens_a: List[List[str]], tokens_b: List[List[str]]
+    ) -> List[Alignment]:
+        """
+        Converts the alignments of the batch to `Alignment` objects.
+
+        Args:
+            tokens_a (List[List[str]]): tokens of `a` of each pair.
+            tokens_b (List[List[str]]): tokens of `b` of each pair.
+
+        Returns:
+            List[Alignment]: positions and tokens of each alignment.
+        """
+        alignments = []
+        for idx in range(len(self)):
+            positions_a, positions_b = self[idx]
+            merged: Dict[int, List[int]] = {}
+            for position_a, position_b in zip(
+                positions_a.tolist(), positions_b.tolist()
+            ):
+                merged.setdefault(position_a, []).append(position_b)
+            alignments.append(
+                Alignment(
+                    positions=[
+                        PositionAlignment(
+                            position_a=position_a, positions_b=positions_b
+                        )
+                        for position_a, positions_b in merged.items()
+                    ],
+                    tokens=[
+                        TokenAlignment(
+                            token_a=tokens_a[idx][position_a],
+                            tokens_b=[
+                                tokens_b[idx][position_b]
+                                for position_b in positions_b
+                            ],
+                        )
+                        for position_a, positions_b in merged.items()
+                    ],
+                )
+            )
+        return alignments
+
+
+class Segmentation(BaseModel):
+    """
+    Common segmentation of the text tokenized by multiple tokenizers.
+    Each segment is the union of the spans of the tokens that overlap,
+    so that every token falls in exactly one segment. The token at position
+    j of the t-th tokenization belongs to the segment `token_segments[t][j]`.
+    """
+
+    segments: np.ndarray
+    token_segments: List[np.ndarray]
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    def __getitem__(self, idx: int) -> List[np.ndarray]:
+        return [
+            np.arange(
+                np.searchsorted(token_segments, idx, "left"),
+                np.searchsorted(token_segments, idx, "right"),
+            )
+            for token_segments in self.token_segments
+        ]
@@ -1,3 +1,11 @@
+from .cache import AlignmentCache
 from .distances import get_distance_fn, precompute_distances
+from .serialization import AlignmentReader, AlignmentWriter
 
-__all__ = ["get_distance_fn", "precompute_distances"]
+__all__ = [
+    "get_distance_fn",
+    "precompute_distances",
+    "AlignmentReader",
+    "AlignmentWriter",
+    "AlignmentCache",
+]
@@ -0,0 +1,77 @@
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+
+def import_pyarrow() -> Any:
+    """
+    Imports `pyarrow`, which is only required by the Arrow inputs and outputs.
+
+    Returns:
+        Any: the `pyarrow` module.
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "Arrow inputs and outputs require `pyarrow`: pip install pyarrow"
+        )
+    return pyarrow
+
+
+def list_array_to_numpy(
+    array: Any, fill_value: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Views the offsets and values of an Arrow `ListArray` (or `LargeListArray`) of
+    numbers as numpy arrays, without copying them when the values have no nulls.
+    Values that are lists themselves, e.g., the (start, end) spans of the tokens
+    as `list<fixed_size_list<int32>[2]>`, are flattened.
+
+    Args:
+        array (Any): a list array, e.g., a column of a record batch.
+        fill_value (Optional[int]): value of the null numbers, e.g., -1 for the word ids
+                                    of special tokens. Null numbers can't be converted
+                                    without `fill_value`.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: offsets with length len(array) + 1, starting at 0,
+                                       and the values of the rows, where the values of
+                                       the row `i` are values[offsets[i]:offsets[i + 1]].
+    """
+    pa = import_pyarrow()
+    offsets = array.offsets.to_numpy()
+    # The values of the list array ignore its slicing offset
+    values = array.values.slice(int(offsets[0]), int(offsets[-1] - offsets[0]))
+    if (
+        pa.types.is_list(values.type)
+        or pa.types.is_large_list(values.type)
+        or pa.types.is_fixed_size_list(values.type)
+    ):
+        values = values.flatten()
+    if values.null_count:
+        assert (
+            fill_value is not None
+        ), "The lists have null values, but there is no `fill_value`."
+        import pyarrow.compute as pc
+
+        values = pc.fill_null(values, fill_value)
+    return offsets - offsets[0], values.to_numpy(zero_copy_only=False)
+
+
+def numpy_to_list_array(offsets: np.ndarray, values: np.ndarray) -> Any:
+    """
+    Builds an Arrow `ListArray` from the offsets and values of its rows,
+    without copying the values.
+
+    Args:
+        offsets (np.ndarray): offsets of the rows, with length n_rows + 1.
+        values (np.ndarray): values of the rows.
+
+    Returns:
+        Any: list array whose row `i` is values[offsets[i]:offsets[i + 1]].
+    """
+    pa = import_pyarrow()
+    return pa.ListArray.from_arrays(
+        pa.array(np.asarray(offsets, dtype=np.int32)), pa.array(values)
+    )
@@ -0,0 +1,235 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ..types import Alignment, PositionAlignment, TokenAlignment, TokenizedPair
+
+# Positions of an alignment: (position_a, positions_b) for each token of `a`
+Positions = List[Tuple[int, List[int]]]
+
+# Separators used to hash sequences of tokens
+_FIELD_SEPARATOR = "\x1e"
+_ITEM_SEPARATOR = "\x1f"
+
+
+def hash_pair(tokenized_pair: TokenizedPair, config: str) -> bytes:
+    """
+    Hashes the inputs of an aligner for a tokenized pair: the tokens,
+    word ids, spans and text of the pair, and the aligner config.
+
+    Args:
+        tokenized_pair (TokenizedPair): a pair of tokenized texts.
+        config (str): description of the aligner and its parameters.
+
+    Returns:
+        bytes: 16 bytes digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for field in [
+        [config],
+        tokenized_pair.tokens_a,
+        tokenized_pair.tokens_b,
+        map(str, tokenized_pair.word_ids_a),
+        map(str, tokenized_pair.word_ids_b),
+        map(str, tokenized_pair.spans_a),
+        map(str, tokenized_pair.spans_b),
+        [tokenized_pair.text],
+    ]:
+        digest.update(
+            (_ITEM_SEPARATOR.join(field) + _FIELD_SEPARATOR).encode(
+                "utf-8", errors="surrogatepass"
+            )
+        )
+    return digest.digest()
+
+
+def encode_positions(positions: Positions) -> bytes:
+    """
+    Encodes the positions of an alignment as a compact int32 blob:
+    [n_groups, positions_a..., lengths_b..., positions_b...].
+    """
+    return np.array(
+        [len(positions)]
+        + [position_a for position_a, _ in positions]
+        + [len(positions_b) for _, positions_b in positions]
+        + [p for _, positions_b in positions for p in positions_b],
+        dtype=np.int32,
+    ).tobytes()
+
+
+def decode_positions(blob: bytes) -> Positions:
+    """
+    Decodes the positions of an alignment encoded with `encode_positions`.
+    """
+    values = np.frombuffer(blob, dtype=np.int32).tolist()
+    n_groups = values[0]
+    positions_a = values[1 : 1 + n_groups]
+    lengths_b = values[1 + n_groups : 1 + 2 * n_groups]
+    positions, start = [], 1 + 2 * n_groups
+    for position_a, length in zip(positions_a, lengths_b):
+        positions.append((position_a, values[start : start + length]))
+        start += length
+    return positions
+
+
+class AlignmentCache:
+    """
+    Two-tier cache of alignments: an in-process LRU with at most
+    `max_size` alignments, and optionally a sqlite database in `path`
+    shared across processes and runs. The cache stores only positions,
+    the tokens of the alignments are rebuilt from each pair.
+
+    Example:
+        aligner = DTWAligner("levenshtein", cache=AlignmentCache(path="cache.db"))
+    """
+
+    def __init__(
+        self, max_size: int = 10000, path: Optional[Union[str, Path]] = None
+    ):
+        self.max_size = max_size
+        self.path = path
+        self._memory: "OrderedDict[bytes, Positions]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _database(self) -> sqlite3.Connection:
+        # Connections can't be shared with forked processes
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                str(self.path), check_same_thread=False, timeout=30
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS alignments "
+                "(key BLOB PRIMARY KEY, positions BLOB)"
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def _remember(self, key: bytes, positions: Positions):
+        self._memory[key] = positions
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: bytes) -> Optional[Positions]:
+        """
+        Looks up the positions of an alignment, first in memory and then on disk.
+
+        Args:
+            key (bytes): key computed with `hash_pair`.
+
+        Returns:
+            Optional[Positions]: positions of the alignment, or None if missing.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+            if self.path is not None:
+                row = (
+                    self._database()
+                    .execute(
+                        "SELECT positions FROM alignments WHERE key = ?",
+                        (key,),
+                    )
+                    .fetchone()
+                )
+                if row is not None:
+                    positions = decode_positions(row[0])
+                    self._remember(key, positions)
+                    self.disk_hits += 1
+                    return positions
+            self.misses += 1
+            return None
+
+    def put(self, key: bytes, positions: Positions):
+        """
+        Stores the positions of an alignment in both tiers.
+
+        Args:
+            key (bytes): key computed with `hash_pair`.
+            positions (Positions): positions of the alignment.
+        """
+        with self._lock:
+            self._remember(key, positions)
+            if self.path is not None:
+                database = self._database()
+                database.execute(
+                    "INSERT OR REPLACE INTO alignments VALUES (?, ?)",
+                    (key, encode_positions(positions)),
+                )
+                database.commit()
+
+    def clear(self):
+        """
+        Removes all the alignments from both tiers and resets the metrics.
+        """
+        with self._lock:
+            self._memory.clear()
+            if self.path is not None:
+                database = self._database()
+                database.execute("DELETE FROM alignments")
+                database.commit()
+            self.memory_hits = self.disk_hits = self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the metrics of the cache.
+
+        Returns:
+            Dict[str, float]: hits of each tier, misses, hit rate and size in memory.
+        """
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "memory_size": len(self._memory),
+        }
+
+
+def positions_to_alignment(
+    positions: Positions, tokenized_pair: TokenizedPair
+) -> Alignment:
+    """
+    Builds an alignment from its positions and the tokens of a pair.
+
+    Args:
+        positions (Positions): positions of the alignment.
+        tokenized_pair (TokenizedPair): a pair of tokenized texts.
+
+    Returns:
+        Alignment: positions and tokens of the alignment.
+    """
+    return Alignment(
+        positions=[
+            PositionAlignment(position_a=position_a, positions_b=positions_b)
+            for position_a, positions_b in positions
+        ],
+        tokens=[
+            TokenAlignment(
+                token_a=tokenized_pair.tokens_a[position_a],
+                tokens_b=[
+                    tokenized_pair.tokens_b[position_b]
+                    for position_b in positions_b
+                ],
+            )
+            for position_a, positions_b in positions
+        ],
+    )
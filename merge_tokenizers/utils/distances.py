@@ -1,10 +1,18 @@
+from collections import Counter
 from functools import lru_cache
-from typing import Callable, List, Union
+from math import sqrt
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import ukkonen
 from Levenshtein import distance as levenshtein
-from scipy.spatial.distance import cosine, euclidean
+from numba import njit
+
+# Ids of the distances implemented by the native kernels,
+# which work on tokens encoded as arrays of code points.
+LEVENSHTEIN = 0
+UKKONEN = 1
+INTERSECTION = 2
 
 
 @lru_cache(maxsize=None)
@@ -46,15 +54,48 @@ def intersection_distance(text_a: str, text_b: str) -> int:
 
 
 @lru_cache(maxsize=None)
-def cosine_distance(repr_text_a: np.ndarray, repr_text_b: np.ndarray) -> float:
-    return cosine(repr_text_a, repr_text_b)
+def cosine_distance(text_a: str, text_b: str) -> float:
+    """
+    Computes the cosine distance between the bags of characters of two
+    texts, as FastDTW does. Empty texts are at distance 1 from the
+    other texts and at distance 0 from each other.
+
+    Args:
+        text_a (str): text to be compared.
+        text_b (str): another text to be compared.
+
+    Returns:
+        float: cosine distance of both bags of characters.
+    """
+    bag_a, bag_b = Counter(text_a), Counter(text_b)
+    norm_a = sqrt(sum(count * count for count in bag_a.values()))
+    norm_b = sqrt(sum(count * count for count in bag_b.values()))
+    if norm_a == 0 or norm_b == 0:
+        return 0.0 if norm_a == norm_b else 1.0
+    dot = sum(count * bag_b[char] for char, count in bag_a.items())
+    return 1.0 - dot / (norm_a * norm_b)
 
 
 @lru_cache(maxsize=None)
-def euclidean_distance(
-    repr_text_a: np.ndarray, repr_text_b: np.ndarray
-) -> float:
-    return euclidean(repr_text_a, repr_text_b)
+def euclidean_distance(text_a: str, text_b: str) -> float:
+    """
+    Computes the euclidean distance between the bags of characters
+    of two texts, as FastDTW does.
+
+    Args:
+        text_a (str): text to be compared.
+        text_b (str): another text to be compared.
+
+    Returns:
+        float: euclidean distance of both bags of characters.
+    """
+    bag_a, bag_b = Counter(text_a), Counter(text_b)
+    return sqrt(
+        sum(
+            (bag_a[char] - bag_b[char]) ** 2
+            for char in bag_a.keys() | bag_b.keys()
+        )
+    )
 
 
 def precompute_distances(
@@ -100,3 +141,165 @@ def get_distance_fn(name: str) -> Callable:
         "euclidean": euclidean_distance,
     }
     return distance_fns.get(name, levenshtein_distance)  # type: ignore
+
+
+@njit(inline="always")
+def levenshtein_codepoints(
+    codepoints_a: np.ndarray,
+    codepoints_b: np.ndarray,
+    k: int,
+    workspace: np.ndarray,
+) -> int:
+    """
+    Computes levenshtein distance between two tokens encoded as
+    arrays of code points. If `k` >= 0, the distance is bounded
+    by `k` as in `ukkonen_distance`, stopping as soon as it is reached.
+
+    Args:
+        codepoints_a (np.ndarray): code points of a token.
+        codepoints_b (np.ndarray): code points of another token.
+        k (int): bound of the distance, or -1 to compute the exact distance.
+        workspace (np.ndarray): int array of size >= len(codepoints_b) + 1,
+                                reused across calls to avoid allocations.
+
+    Returns:
+        int: (bounded) levenshtein distance of both tokens.
+    """
+    len_a, len_b = len(codepoints_a), len(codepoints_b)
+    if len_a == 0 or len_b == 0:
+        distance = max(len_a, len_b)
+        return min(distance, k) if k >= 0 else distance
+    # Single row of the DP matrix, updated in place
+    for j in range(len_b + 1):
+        workspace[j] = j
+    for i in range(1, len_a + 1):
+        diagonal = workspace[0]
+        workspace[0] = i
+        row_min = i
+        codepoint = codepoints_a[i - 1]
+        for j in range(1, len_b + 1):
+            up = workspace[j]
+            value = diagonal + (0 if codepoint == codepoints_b[j - 1] else 1)
+            if up + 1 < value:
+                value = up + 1
+            if workspace[j - 1] + 1 < value:
+                value = workspace[j - 1] + 1
+            workspace[j] = value
+            diagonal = up
+            if value < row_min:
+                row_min = value
+        # The minimum of a row never decreases in the next rows
+        if k >= 0 and row_min >= k:
+            return k
+    distance = workspace[len_b]
+    return min(distance, k) if k >= 0 else distance
+
+
+@njit(inline="always")
+def intersection_codepoints(
+    codepoints_a: np.ndarray, codepoints_b: np.ndarray
+) -> int:
+    """
+    Computes `intersection_distance` between two tokens
+    encoded as arrays of code points.
+    """
+    common = 0
+    for i in range(len(codepoints_a)):
+        # Count each distinct code point of `a` only once
+        seen = False
+        for k in range(i):
+            if codepoints_a[k] == codepoints_a[i]:
+                seen = True
+                break
+        if seen:
+            continue
+        for j in range(len(codepoints_b)):
+            if codepoints_b[j] == codepoints_a[i]:
+                common += 1
+                break
+    return max(len(codepoints_a), len(codepoints_b)) - common
+
+
+@njit(inline="always")
+def codepoints_distance(
+    codepoints_a: np.ndarray,
+    codepoints_b: np.ndarray,
+    distance_id: int,
+    workspace: np.ndarray,
+) -> int:
+    """
+    Computes the distance with id `distance_id` between two
+    tokens encoded as arrays of code points.
+    """
+    if distance_id == UKKONEN:
+        return levenshtein_codepoints(codepoints_a, codepoints_b, 5, workspace)
+    if distance_id == INTERSECTION:
+        return intersection_codepoints(codepoints_a, codepoints_b)
+    return levenshtein_codepoints(codepoints_a, codepoints_b, -1, workspace)
+
+
+@njit(nogil=True)
+def codepoints_distance_matrix(
+    offsets_a: np.ndarray,
+    codepoints_a: np.ndarray,
+    rows: Tuple[int, int],
+    offsets_b: np.ndarray,
+    codepoints_b: np.ndarray,
+    cols: Tuple[int, int],
+    radius: int,
+    distance_id: int,
+) -> np.ndarray:
+    """
+    Computes the distances between the tokens rows[0]:rows[1] of `a` and
+    the tokens cols[0]:cols[1] of `b`, encoded as arrays of code points.
+    If `radius` > 0, only the pairs of tokens with |i - j| <= radius are
+    computed, and the rest are left to 0.
+    """
+    distances = np.zeros((rows[1] - rows[0], cols[1] - cols[0]), dtype=np.int32)
+    max_len_b = np.max(np.diff(offsets_b)) if len(offsets_b) > 1 else 0
+    workspace = np.empty(max_len_b + 1, dtype=np.int64)
+    for i in range(rows[0], rows[1]):
+        codepoints_i = codepoints_a[offsets_a[i] : offsets_a[i + 1]]
+        for j in range(cols[0], cols[1]):
+            if radius > 0 and abs(i - j) > radius:
+                continue
+            distances[i - rows[0], j - cols[0]] = codepoints_distance(
+                codepoints_i,
+                codepoints_b[offsets_b[j] : offsets_b[j + 1]],
+                distance_id,
+                workspace,
+            )
+    return distances
+
+
+def get_distance_id(distance_fn: Callable) -> Optional[int]:
+    """
+    Returns the id of the native implementation of a distance function.
+
+    Args:
+        distance_fn (Callable): a distance function of this module.
+
+    Returns:
+        Optional[int]: id of the distance, or None if the distance
+                       has no implementation for code points.
+    """
+    distance_ids: Dict[Callable, int] = {
+        levenshtein_distance: LEVENSHTEIN,
+        ukkonen_distance: UKKONEN,
+        intersection_distance: INTERSECTION,
+    }
+    return distance_ids.get(distance_fn)
+
+
+def is_float_distance(distance_fn: Callable) -> bool:
+    """
+    Checks whether a distance function returns float distances, which
+    must be accumulated as float costs by the DTW instead of int costs.
+
+    Args:
+        distance_fn (Callable): a distance function of this module.
+
+    Returns:
+        bool: whether the distances are floats.
+    """
+    return distance_fn in [cosine_distance, euclidean_distance]
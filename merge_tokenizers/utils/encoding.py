@@ -0,0 +1,30 @@
+from typing import List, Tuple
+
+import numpy as np
+
+
+def encode_tokens(tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes a list of tokens as one concatenated buffer of unicode
+    code points, so that native kernels can work on integer ids
+    shared across all the texts, without fitting any vocabulary.
+
+    Args:
+        tokens (List[str]): list of tokens
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: offsets (int32) of each token in the buffer,
+                                       with length len(tokens) + 1, and the buffer of
+                                       code points (int32). The code points of the i-th token
+                                       are codepoints[offsets[i]:offsets[i + 1]].
+    """
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int32)
+    np.cumsum(
+        np.fromiter(map(len, tokens), dtype=np.int32, count=len(tokens)),
+        out=offsets[1:],
+    )
+    codepoints = np.frombuffer(
+        "".join(tokens).encode("utf-32-le", errors="surrogatepass"),
+        dtype=np.int32,
+    )
+    return offsets, codepoints
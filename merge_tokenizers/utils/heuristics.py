@@ -1,4 +1,11 @@
+from typing import AbstractSet, List, Tuple
+
 from ..types import Alignment, PositionAlignment, TokenAlignment, TokenizedPair
+from .cache import Positions
+from .preprocess import strip_markers
+
+# Range [start, end) of consecutive tokens
+Run = Tuple[int, int]
 
 
 def align_one_to_one(tokenized_pair: TokenizedPair) -> Alignment:
@@ -21,3 +28,134 @@ def align_one_to_one(tokenized_pair: TokenizedPair) -> Alignment:
         for token in tokenized_pair.tokens_a
     ]
     return Alignment(positions=position_alignment, tokens=token_alignment)
+
+
+def special_runs(
+    tokens: List[str], special_tokens: AbstractSet[str]
+) -> List[Run]:
+    """
+    Finds the runs of consecutive special tokens of a tokenization.
+
+    Args:
+        tokens (List[str]): tokens of a text.
+        special_tokens (AbstractSet[str]): special tokens of the tokenizers.
+
+    Returns:
+        List[Run]: [start, end) of each run of special tokens.
+    """
+    runs: List[Run] = []
+    for idx, token in enumerate(tokens):
+        if token not in special_tokens:
+            continue
+        if runs and runs[-1][1] == idx:
+            runs[-1] = (runs[-1][0], idx + 1)
+        else:
+            runs.append((idx, idx + 1))
+    return runs
+
+
+def align_runs(run_a: Run, run_b: Run) -> Positions:
+    """
+    Aligns two runs of tokens spreading the tokens of `b` evenly
+    over the tokens of `a`, one to one if both have the same length.
+
+    Args:
+        run_a (Run): [start, end) of the run of `a`.
+        run_b (Run): [start, end) of the run of `b`.
+
+    Returns:
+        Positions: positions of `b` aligned with each position of `a`.
+    """
+    len_a, len_b = run_a[1] - run_a[0], run_b[1] - run_b[0]
+    positions = []
+    for idx in range(len_a):
+        start = idx * len_b // len_a
+        end = max((idx + 1) * len_b // len_a, start + 1)
+        positions.append(
+            (run_a[0] + idx, list(range(run_b[0] + start, run_b[0] + end)))
+        )
+    return positions
+
+
+def pin_special_tokens(
+    tokenized_pair: TokenizedPair, special_tokens: AbstractSet[str]
+) -> Tuple[Positions, List[Tuple[Run, Run]]]:
+    """
+    Pins the special tokens of a tokenized pair to each other, e.g., BOS, EOS,
+    CLS, SEP or chat template tokens. The leading runs of special tokens are
+    pinned to each other, as are the trailing runs, and the other runs are
+    pinned in order to the next run of the other text with the same tokens.
+    The other special tokens are left as content.
+
+    Args:
+        tokenized_pair (TokenizedPair): a tokenized pair.
+        special_tokens (AbstractSet[str]): special tokens of the tokenizers.
+
+    Returns:
+        Tuple[Positions, List[Tuple[Run, Run]]]: alignment of the pinned tokens, and the
+                                                 [start, end) of the content between the
+                                                 pinned tokens in `a` and in `b`.
+    """
+    len_a, len_b = len(tokenized_pair.tokens_a), len(tokenized_pair.tokens_b)
+    runs_a = special_runs(tokenized_pair.tokens_a, special_tokens)
+    runs_b = special_runs(tokenized_pair.tokens_b, special_tokens)
+    leading, trailing = [], []
+    if runs_a and runs_b and runs_a[0][0] == 0 and runs_b[0][0] == 0:
+        leading.append((runs_a.pop(0), runs_b.pop(0)))
+    if runs_a and runs_b and runs_a[-1][1] == len_a and runs_b[-1][1] == len_b:
+        trailing.append((runs_a.pop(), runs_b.pop()))
+    middle = []
+    idx_b = 0
+    for run_a in runs_a:
+        tokens_a = tokenized_pair.tokens_a[run_a[0] : run_a[1]]
+        for next_b in range(idx_b, len(runs_b)):
+            run_b = runs_b[next_b]
+            if tokenized_pair.tokens_b[run_b[0] : run_b[1]] == tokens_a:
+                middle.append((run_a, run_b))
+                idx_b = next_b + 1
+                break
+    pinned = leading + middle + trailing
+
+    positions: Positions = []
+    segments = []
+    start_a = start_b = 0
+    for run_a, run_b in pinned + [((len_a, len_a), (len_b, len_b))]:
+        if start_a < run_a[0]:
+            segments.append(((start_a, run_a[0]), (start_b, run_b[0])))
+        positions += align_runs(run_a, run_b)
+        start_a, start_b = run_a[1], run_b[1]
+    return positions, segments
+
+
+def slice_pair(
+    tokenized_pair: TokenizedPair, run_a: Run, run_b: Run
+) -> TokenizedPair:
+    """
+    Takes the tokens [start, end) of each text of a preprocessed tokenized pair.
+    Without spans, the text is rebuilt from the tokens of `a`, so that the
+    spans of the tokens are looked up only in the text of the range.
+
+    Args:
+        tokenized_pair (TokenizedPair): a preprocessed tokenized pair.
+        run_a (Run): [start, end) of the tokens of `a`.
+        run_b (Run): [start, end) of the tokens of `b`.
+
+    Returns:
+        TokenizedPair: tokenized pair with the tokens of both ranges.
+    """
+    slice_a, slice_b = slice(*run_a), slice(*run_b)
+    return TokenizedPair.trusted(
+        tokens_a=tokenized_pair.tokens_a[slice_a],
+        tokens_b=tokenized_pair.tokens_b[slice_b],
+        word_ids_a=tokenized_pair.word_ids_a[slice_a],
+        word_ids_b=tokenized_pair.word_ids_b[slice_b],
+        spans_a=tokenized_pair.spans_a[slice_a],
+        spans_b=tokenized_pair.spans_b[slice_b],
+        preprocessed_tokens_a=tokenized_pair.preprocessed_tokens_a[slice_a],
+        preprocessed_tokens_b=tokenized_pair.preprocessed_tokens_b[slice_b],
+        text=(
+            tokenized_pair.text
+            if tokenized_pair.spans_a or tokenized_pair.spans_b
+            else "".join(map(strip_markers, tokenized_pair.tokens_a[slice_a]))
+        ),
+    )
@@ -47,3 +47,59 @@ def preprocess_tokens(tokens: List[str]) -> List[str]:
             token = fn(token)
         preprocessed.append(token)
     return preprocessed
+
+
+# Characters used by subword tokenizers to encode whitespaces
+# (byte-level BPE and sentencepiece), and prefix of continuation
+# tokens (wordpiece). They are not part of the text.
+WHITESPACE_MARKERS = ["Ġ", "Ċ", "ĉ", "▁"]
+CONTINUATION_MARKER = "##"
+
+
+def strip_markers(token: str) -> str:
+    """
+    Removes the markers that subword tokenizers add to the tokens,
+    like `Ġ`, `▁` or `##`, to match the tokens against the text.
+
+    Args:
+        token (str): a token
+
+    Returns:
+        str: token without markers
+    """
+    if token.startswith(CONTINUATION_MARKER):
+        token = token[len(CONTINUATION_MARKER) :]
+    for marker in WHITESPACE_MARKERS:
+        token = token.replace(marker, "")
+    return token
+
+
+def preprocess_text(text: str) -> str:
+    """
+    Preprocess a text as the tokens are preprocessed
+    in `preprocess_tokens`, and removes all the whitespaces.
+
+    Args:
+        text (str): a text
+
+    Returns:
+        str: preprocessed text without whitespaces
+    """
+    return "".join(lowercase(normalize_unicode(text)).split())
+
+
+def preprocess_span_tokens(tokens: List[str]) -> List[str]:
+    """
+    Preprocess tokens to find the spans they cover in
+    a text preprocessed with `preprocess_text`, removing
+    their markers and whitespaces.
+
+    Args:
+        tokens (List[str]): list of tokens
+
+    Returns:
+        List[str]: preprocessed tokens without markers
+    """
+    return preprocess_tokens(
+        ["".join(strip_markers(token).split()) for token in tokens]
+    )
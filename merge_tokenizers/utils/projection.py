@@ -0,0 +1,146 @@
+import sys
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# Aggregation functions that can be computed with a projection matrix
+PROJECTION_KINDS: Dict[Callable, str] = {np.mean: "mean", np.sum: "sum"}
+
+# Aggregation functions supported for torch tensors
+TORCH_REDUCTIONS: Dict[Callable, str] = {
+    np.mean: "mean",
+    np.sum: "sum",
+    np.max: "amax",
+    np.min: "amin",
+}
+
+
+def project_features(
+    projection: csr_matrix, features: np.ndarray, axis: int = 0
+) -> np.ndarray:
+    """
+    Projects features along the tokens axis with a sparse
+    projection matrix, in a single sparse-dense matmul.
+
+    Args:
+        projection (csr_matrix): (len_a, len_b) projection matrix.
+        features (np.ndarray): features with `len_b` tokens along `axis`.
+        axis (int): axis of the tokens in `features`.
+
+    Returns:
+        np.ndarray: features with `len_a` tokens along `axis`.
+    """
+    features = np.moveaxis(np.asarray(features), axis, 0)
+    projected = projection @ features.reshape(features.shape[0], -1)
+    return np.moveaxis(
+        np.asarray(projected).reshape(projection.shape[0], *features.shape[1:]),
+        0,
+        axis,
+    )
+
+
+def project_features_chunked(
+    projection: csr_matrix,
+    features: np.ndarray,
+    out: np.ndarray,
+    chunk_size: int = 1024,
+) -> np.ndarray:
+    """
+    Projects features along the first axis in chunks of rows of the
+    projection, writing each chunk into `out`. Only the rows of `features`
+    spanned by each chunk are read, so `features` and `out` can be
+    memory-mapped arrays bigger than the available memory.
+
+    Args:
+        projection (csr_matrix): (len_a, len_b) projection matrix.
+        features (np.ndarray): (len_b, ...) features, e.g., a `np.memmap`.
+        out (np.ndarray): (len_a, ...) array where the projected features are written.
+        chunk_size (int): number of rows projected at once.
+
+    Returns:
+        np.ndarray: `out`.
+    """
+    for start in range(0, projection.shape[0], chunk_size):
+        chunk = projection[start : start + chunk_size]
+        if chunk.nnz == 0:
+            out[start : start + chunk.shape[0]] = 0
+            continue
+        first, last = chunk.indices.min(), chunk.indices.max() + 1
+        block = np.asarray(features[first:last])
+        out[start : start + chunk.shape[0]] = np.asarray(
+            chunk[:, first:last] @ block.reshape(block.shape[0], -1)
+        ).reshape(chunk.shape[0], *block.shape[1:])
+    return out
+
+
+def is_torch_tensor(features: Any) -> bool:
+    """
+    Checks if some features are a torch tensor,
+    without importing torch if it was not imported yet.
+
+    Args:
+        features (Any): features of the tokens.
+
+    Returns:
+        bool: whether `features` is a torch tensor.
+    """
+    torch = sys.modules.get("torch")
+    return torch is not None and isinstance(features, torch.Tensor)
+
+
+def aggregate_torch(
+    indices: Tuple[np.ndarray, np.ndarray],
+    n_rows: int,
+    features: Any,
+    reduction: str = "mean",
+    axis: int = 0,
+) -> Any:
+    """
+    Aggregates the features of a torch tensor along the tokens axis,
+    with `index_add` for sums and means, and `scatter_reduce` for
+    maximums and minimums. The result keeps the dtype and device of
+    `features`, and supports autograd.
+
+    Args:
+        indices (Tuple[np.ndarray, np.ndarray]): (rows, cols) aligned positions, as
+                                                 given by `Alignment.to_indices`.
+        n_rows (int): number of tokens of the result.
+        features (torch.Tensor): features with the tokens along `axis`.
+        reduction (str): "mean", "sum", "amax" or "amin".
+        axis (int): axis of the tokens in `features`.
+
+    Returns:
+        torch.Tensor: features with `n_rows` tokens along `axis`.
+    """
+    import torch
+
+    rows, cols = indices
+    # Negative positions index from the end, as in numpy
+    cols = cols % max(features.shape[axis], 1)
+    rows_t = torch.as_tensor(rows, device=features.device)
+    selected = features.index_select(
+        axis, torch.as_tensor(cols, device=features.device)
+    )
+    shape = list(features.shape)
+    shape[axis] = n_rows
+
+    if reduction in ["sum", "mean"]:
+        if reduction == "mean":
+            counts = np.bincount(rows, minlength=n_rows)[rows]
+            broadcast = [1] * features.dim()
+            broadcast[axis] = -1
+            selected = selected / torch.as_tensor(
+                counts, dtype=features.dtype, device=features.device
+            ).view(broadcast)
+        return features.new_zeros(shape).index_add(axis, rows_t, selected)
+
+    index_shape = [1] * features.dim()
+    index_shape[axis] = -1
+    return features.new_zeros(shape).scatter_reduce(
+        axis,
+        rows_t.view(index_shape).expand_as(selected),
+        selected,
+        reduction,
+        include_self=False,
+    )
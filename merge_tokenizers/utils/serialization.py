@@ -0,0 +1,295 @@
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ..types import Alignment, BatchAlignment, PositionAlignment, TokenAlignment
+
+# Version of the format of the alignment shards
+FORMAT_VERSION = 1
+
+# Columns of each shard. The alignment `i` of a shard is made of the groups
+# groups[i]:groups[i + 1], and the group `g` aligns the token positions_a[g]
+# with the tokens positions_b[offsets_b[g]:offsets_b[g + 1]].
+COLUMNS = ["groups", "positions_a", "offsets_b", "positions_b"]
+
+
+def write_metadata(
+    path: Union[str, Path], shard_size: int, n_shards: int, n_alignments: int
+):
+    """
+    Writes the metadata of a directory of alignment shards.
+
+    Args:
+        path (Union[str, Path]): directory of the shards.
+        shard_size (int): number of alignments per shard.
+        n_shards (int): number of shards.
+        n_alignments (int): total number of alignments.
+    """
+    with open(Path(path) / "metadata.json", "w") as metadata_file:
+        json.dump(
+            {
+                "version": FORMAT_VERSION,
+                "shard_size": shard_size,
+                "n_shards": n_shards,
+                "n_alignments": n_alignments,
+            },
+            metadata_file,
+        )
+
+
+class AlignmentWriter:
+    """
+    Writes a stream of alignments as shards of columnar `.npy` files
+    that can be memory-mapped by `AlignmentReader`. Only the alignments
+    of the current shard are kept in memory.
+
+    Example:
+        with AlignmentWriter("alignments/", shard_size=100_000) as writer:
+            writer.write_all(aligner.align_pairs(pairs))
+    """
+
+    def __init__(self, path: Union[str, Path], shard_size: int = 100_000):
+        assert shard_size > 0, "`shard_size` must be greater than 0."
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.n_alignments = 0
+        self.n_shards = 0
+        self._reset()
+
+    def _reset(self):
+        self._groups = [0]
+        self._positions_a: List[np.ndarray] = []
+        self._lengths_b: List[np.ndarray] = []
+        self._positions_b: List[np.ndarray] = []
+
+    def write(self, alignment: Alignment):
+        """
+        Appends an alignment.
+
+        Args:
+            alignment (Alignment): positions and tokens of the alignment.
+        """
+        positions = alignment.positions
+        self._positions_a.append(
+            np.fromiter(
+                (position.position_a for position in positions),
+                dtype=np.int32,
+                count=len(positions),
+            )
+        )
+        self._lengths_b.append(
+            np.fromiter(
+                (len(position.positions_b) for position in positions),
+                dtype=np.int64,
+                count=len(positions),
+            )
+        )
+        self._positions_b.append(
+            np.array(
+                [p for position in positions for p in position.positions_b],
+                dtype=np.int32,
+            )
+        )
+        self._append_groups(len(positions))
+
+    def write_batch(self, batch_alignment: BatchAlignment):
+        """
+        Appends all the alignments of a `BatchAlignment`, grouping
+        the consecutive matches with the same `position_a`.
+
+        Args:
+            batch_alignment (BatchAlignment): array-backed alignments of a batch.
+        """
+        positions_a = np.asarray(batch_alignment.positions_a)
+        offsets = np.asarray(batch_alignment.offsets)
+        # A group starts with each alignment and each change of `position_a`
+        starts = np.zeros(len(positions_a), dtype=bool)
+        starts[offsets[:-1][offsets[:-1] < offsets[1:]]] = True
+        starts[1:] |= positions_a[1:] != positions_a[:-1]
+        group_starts = np.flatnonzero(starts)
+        for idx in range(len(batch_alignment)):
+            first, last = np.searchsorted(group_starts, offsets[idx : idx + 2])
+            self._positions_a.append(
+                positions_a[group_starts[first:last]].astype(np.int32)
+            )
+            self._lengths_b.append(
+                np.diff(np.append(group_starts[first:last], offsets[idx + 1]))
+            )
+            self._positions_b.append(
+                np.asarray(
+                    batch_alignment.positions_b[
+                        offsets[idx] : offsets[idx + 1]
+                    ],
+                    dtype=np.int32,
+                )
+            )
+            self._append_groups(last - first)
+
+    def write_all(self, alignments: Iterable[Alignment]):
+        """
+        Appends a stream of alignments.
+
+        Args:
+            alignments (Iterable[Alignment]): alignments to write.
+        """
+        for alignment in alignments:
+            self.write(alignment)
+
+    def _append_groups(self, n_groups: int):
+        self._groups.append(self._groups[-1] + n_groups)
+        self.n_alignments += 1
+        if len(self._groups) - 1 == self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the alignments of the current shard, if any.
+        """
+        if len(self._groups) == 1:
+            return
+        lengths_b = np.concatenate(self._lengths_b).astype(np.int64)
+        columns = {
+            "groups": np.array(self._groups, dtype=np.int64),
+            "positions_a": np.concatenate(self._positions_a).astype(np.int32),
+            "offsets_b": np.concatenate(([0], np.cumsum(lengths_b))),
+            "positions_b": np.concatenate(self._positions_b).astype(np.int32),
+        }
+        shard_path = self.path / f"shard-{self.n_shards:05d}"
+        shard_path.mkdir(exist_ok=True)
+        for name, column in columns.items():
+            np.save(shard_path / f"{name}.npy", column)
+        self.n_shards += 1
+        self._reset()
+        self._write_metadata()
+
+    def _write_metadata(self):
+        write_metadata(
+            self.path, self.shard_size, self.n_shards, self.n_alignments
+        )
+
+    def close(self):
+        """
+        Writes the last shard and the metadata.
+        """
+        self.flush()
+        self._write_metadata()
+
+    def __enter__(self) -> "AlignmentWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class AlignmentReader:
+    """
+    Reads the alignments written by `AlignmentWriter`. The shards are
+    memory-mapped when accessed, so the alignment of a document is read
+    in O(1) without loading the rest.
+
+    Example:
+        reader = AlignmentReader("alignments/")
+        alignment = reader[42]
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path / "metadata.json") as metadata_file:
+            metadata = json.load(metadata_file)
+        assert (
+            metadata["version"] == FORMAT_VERSION
+        ), f"Unsupported format version {metadata['version']}."
+        self.shard_size = metadata["shard_size"]
+        self.n_alignments = metadata["n_alignments"]
+        self._shards: Dict[int, Dict[str, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return self.n_alignments
+
+    def _shard(self, idx: int) -> Dict[str, np.ndarray]:
+        if idx not in self._shards:
+            shard_path = self.path / f"shard-{idx:05d}"
+            self._shards[idx] = {
+                name: np.load(shard_path / f"{name}.npy", mmap_mode="r")
+                for name in COLUMNS
+            }
+        return self._shards[idx]
+
+    def get_arrays(self, idx: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the alignment `idx` as arrays, without copies.
+
+        Args:
+            idx (int): index of the alignment.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: positions of `a`, offsets of the
+                                                       positions of `b` aligned with each
+                                                       position of `a`, and positions of `b`.
+        """
+        if idx < 0:
+            idx += self.n_alignments
+        if not 0 <= idx < self.n_alignments:
+            raise IndexError(f"Alignment index {idx} out of range.")
+        shard = self._shard(idx // self.shard_size)
+        row = idx % self.shard_size
+        first, last = shard["groups"][row], shard["groups"][row + 1]
+        offsets_b = shard["offsets_b"][first : last + 1]
+        return (
+            shard["positions_a"][first:last],
+            offsets_b - offsets_b[0],
+            shard["positions_b"][offsets_b[0] : offsets_b[-1]],
+        )
+
+    def get(
+        self,
+        idx: int,
+        tokens_a: Optional[List[str]] = None,
+        tokens_b: Optional[List[str]] = None,
+    ) -> Alignment:
+        """
+        Returns the alignment `idx`. The tokens of the alignment
+        are only filled if the tokens of both texts are passed.
+
+        Args:
+            idx (int): index of the alignment.
+            tokens_a (Optional[List[str]]): tokens of `a`.
+            tokens_b (Optional[List[str]]): tokens of `b`.
+
+        Returns:
+            Alignment: positions and tokens of the alignment.
+        """
+        positions_a, offsets_b, positions_b = self.get_arrays(idx)
+        merged = [
+            (position_a, positions_b[start:end].tolist())
+            for position_a, start, end in zip(
+                positions_a.tolist(), offsets_b[:-1], offsets_b[1:]
+            )
+        ]
+        return Alignment(
+            positions=[
+                PositionAlignment(position_a=position_a, positions_b=positions)
+                for position_a, positions in merged
+            ],
+            tokens=(
+                [
+                    TokenAlignment(
+                        token_a=tokens_a[position_a],
+                        tokens_b=[tokens_b[p] for p in positions],
+                    )
+                    for position_a, positions in merged
+                ]
+                if tokens_a is not None and tokens_b is not None
+                else []
+            ),
+        )
+
+    def __getitem__(self, idx: int) -> Alignment:
+        return self.get(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.get(idx)
@@ -9,10 +9,9 @@ INSTALL_REQUIRES: List[str] = [
     "levenshtein",
     "pydantic",
     "spacy-alignments",
-    "scikit-learn",
-    "fastdtw",
     "ukkonen",
     "numba",
+    "scipy",
 ]
 
 EXTRAS_REQUIRES: Dict[str, List[str]] = {
@@ -25,16 +24,24 @@ EXTRAS_REQUIRES: Dict[str, List[str]] = {
         "isort",
         "autoflake",
         "pre-commit",
-    ]
+    ],
+    "torch": ["torch"],
 }
 
 extensions = [
     Extension(
         name="merge_tokenizers.aligners.dtw_c.dtw",
         sources=["merge_tokenizers/aligners/dtw_c/dtw.c"],
+        depends=["merge_tokenizers/aligners/dtw_c/dtw_kernel.h"],
         language="c",
         include_dirs=["merge_tokenizers/aligners/dtw_c"],
     ),
+    Extension(
+        name="merge_tokenizers.aligners.fast_dtw_c.fast_dtw",
+        sources=["merge_tokenizers/aligners/fast_dtw_c/fast_dtw.c"],
+        language="c",
+        include_dirs=["merge_tokenizers/aligners/fast_dtw_c"],
+    ),
     Extension(
         name="merge_tokenizers.aligners.greedy_coverage_c.greedy_coverage",
         sources=["merge_tokenizers/aligners/greedy_coverage_c/greedy_coverage.c"],
@@ -57,6 +64,9 @@ setup(
     extras_require=EXTRAS_REQUIRES,
     include_package_data=True,
     ext_modules=extensions,
+    entry_points={
+        "console_scripts": ["merge-tokenizers=merge_tokenizers.cli:main"],
+    },
     zip_safe=False,
     python_requires=">=3.8.0",
     classifiers=[
@@ -0,0 +1,16 @@
+from merge_tokenizers import WordIdsAligner
+from merge_tokenizers.types import TokenizedPair
+
+
+def test_pinning_keeps_content_unaligned_by_word_ids():
+    fields = dict(
+        tokens_a=["<s>", "hel", "lo", "</s>"],
+        tokens_b=["[CLS]", "hello", "[SEP]"],
+        word_ids_a=[0, 1, 1, 2],
+        word_ids_b=[0, 1, 2],
+    )
+    unpinned = WordIdsAligner().align_pair(TokenizedPair(**fields))
+    pinned = WordIdsAligner(
+        special_tokens={"<s>", "</s>", "[CLS]", "[SEP]"}
+    ).align_pair(TokenizedPair(**fields))
+    assert list(pinned) == list(unpinned)